@@ -1,21 +1,96 @@
 import os
-from openai import OpenAI
+import re
+import logging
 from config import OPENAI_API_KEY
+from services.resilience import chat_completion
+from services.session_store import KVSessionStore
+
+# Questions factuelles auxquelles une notice Mérimée répond sans LLM (ordre = priorité)
+_FACTUAL = [
+    ("architect",  re.compile(r"\b(architecte|qui a (?:construit|conçu|bâti|dessiné|édifié)|auteur)", re.IGNORECASE)),
+    ("protection", re.compile(r"\b(classée?s?|inscrite?s?|protégée?s?|protection|monument historique)\b", re.IGNORECASE)),
+    ("dates",      re.compile(r"\b(quand|quelle année|en quelle|date|datation|construite?|bâtie?|édifiée?|siècle)\b", re.IGNORECASE)),
+]
+
 
 class CultureAgent:
-    def __init__(self):
+    namespace = "culture"
+    system_prompt = "Réponds en expert du patrimoine et de l'histoire locale."
+    rag_prompt = ("Réponds en expert du patrimoine et de l'histoire locale, en t'appuyant sur les extraits "
+                  "de notices fournis. Si l'information n'y figure pas, dis-le brièvement.")
+
+    def __init__(self, session_store=None, max_history: int = 20, knowledge_base=None,
+                 top_k: int = 4, min_score: float = 0.35, context_chars: int = 2500, rag_history: int = 4):
+        from openai import OpenAI  # import différé : le module reste léger à importer
+
         self.model = "gpt-4o"
         self.client = OpenAI(api_key=OPENAI_API_KEY or os.getenv("OPENAI_API_KEY"))
-        self.conversation_history = [
-            {"role": "system", "content": "Réponds en expert du patrimoine et de l'histoire locale."}
-        ]
-
-    def handle_request(self, user_input):
-        self.conversation_history.append({"role": "user", "content": user_input})
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.conversation_history
-        )
-        reply = response.choices[0].message.content
-        self.conversation_history.append({"role": "assistant", "content": reply})
+        # Historique externalisé : seuls les `max_history` derniers tours sont relus
+        self.session_store = session_store or KVSessionStore()
+        self.max_history = max_history
+        # Base patrimoine locale (services/heritage_kb.py) : prompt borné au lieu de tout l'historique
+        self.kb = knowledge_base
+        self.top_k = top_k
+        self.min_score = min_score
+        self.context_chars = context_chars
+        self.rag_history = rag_history
+
+    @staticmethod
+    def factual_answer(user_input, rec):
+        """Réponse directe depuis la notice, ou None si la question n'est pas factuelle / le champ est vide."""
+        title = f"**{rec['name']}**" + (f" ({rec['commune']})" if rec["commune"] else "")
+        source = f"\n\n_Source : base Mérimée, notice {rec['ref']}_"
+        for field, regex in _FACTUAL:
+            if not regex.search(user_input):
+                continue
+            if field == "architect" and rec["architect"]:
+                return f"🏛️ {title} : {rec['architect']}.{source}"
+            if field == "protection" and rec["protection"]:
+                return f"🏛️ {title} — protection : {rec['protection']}.{source}"
+            if field == "dates" and (rec["siecle"] or rec["dates"]):
+                when = " ; ".join(v for v in (rec["siecle"], rec["dates"]) if v)
+                return f"🏛️ {title} — construction : {when}.{source}"
+        return None
+
+    def _rag_messages(self, user_input, hits, history):
+        passages, used = [], 0
+        for i, hit in enumerate(hits, 1):
+            if used + len(hit["text"]) > self.context_chars:
+                break
+            passages.append(f"[{i}] {hit['text']}")
+            used += len(hit["text"])
+        return [{"role": "system", "content": self.rag_prompt}, *history[-self.rag_history:],
+                {"role": "user", "content": "Extraits :\n" + "\n".join(passages) + f"\n\nQuestion : {user_input}"}]
+
+    def handle_request(self, user_input, session_id=None):
+        """Sans session_id, la question est traitée sans historique (ex : panneaux de la sidebar)."""
+        history = self.session_store.history(session_id, self.namespace, self.max_history) if session_id else []
+        reply = None
+        kb = self.kb  # peut passer à None pendant la requête (rechargement du checkpoint)
+        if kb is not None:
+            try:
+                hits = [h for h in kb.search(user_input, self.top_k) if h["score"] >= self.min_score]
+                rec = kb.match_record(user_input, hits)
+            except Exception as e:
+                # embed distant en échec, disjoncteur ouvert... : réponse LLM sans la base
+                logging.warning(f"[Culture] base patrimoine indisponible : {e}")
+                hits, rec = [], None
+            if rec:
+                reply = self.factual_answer(user_input, rec)
+            if reply is None and hits:
+                response = chat_completion(self.client, model=self.model,
+                                           messages=self._rag_messages(user_input, hits, history))
+                reply = response.choices[0].message.content
+        if reply is None:
+            messages = [{"role": "system", "content": self.system_prompt}, *history,
+                        {"role": "user", "content": user_input}]
+            response = chat_completion(
+                self.client,
+                model=self.model,
+                messages=messages
+            )
+            reply = response.choices[0].message.content
+        if session_id:
+            self.session_store.append(session_id, self.namespace, "user", user_input)
+            self.session_store.append(session_id, self.namespace, "assistant", reply)
         return reply
@@ -1,21 +1,80 @@
 from __future__ import annotations
-import functools
-import torch
-import os
+import importlib
+import json
 import logging
+import os
 import re
+import threading
+import time
+import uuid
+from collections.abc import Mapping
 from typing import List, Optional, Tuple
-from sentence_transformers import SentenceTransformer
-from huggingface_hub import hf_hub_download
 
-from agents.transport_agent import TransportAgent
-from agents.weather_agent   import WeatherAgent
-from agents.culture_agent   import CultureAgent
-from agents.loisirs_agent   import LoisirsAgent
+from agents.sbert_classifier import SbertClassifier, ClassifierClient, resolve_checkpoint
+from services.resilience    import deadline, remaining
+from services.model_selector import request_scope
+from services.session_store import open_session_store
+from services.memory        import registry as memory_registry, start_monitor_from_env
+from services.request_journal import open_journal
+from services.profiler       import start_profiler
+from config import (SESSION_STORE_URL, SESSION_TTL, CLASSIFIER_URL, DISPATCHER_THRESHOLDS_PATH,
+                    CHECKPOINT_WATCH_INTERVAL, PROFILE_DIR)
 
 logging.basicConfig(level=logging.DEBUG,
                     format="%(asctime)s [%(levelname)s] %(message)s")
 
+# Agents chargés à la demande : leur module (openai, googlemaps, numpy...) n'est importé
+# qu'au premier message de la catégorie, ou en tâche de fond via LazyAgents.preload()
+_AGENT_CLASSES = {
+    "transport": ("agents.transport_agent", "TransportAgent"),
+    "météo":     ("agents.weather_agent",   "WeatherAgent"),
+    "culture":   ("agents.culture_agent",   "CultureAgent"),
+    "loisirs":   ("agents.loisirs_agent",   "LoisirsAgent"),
+}
+
+
+class LazyAgents(Mapping):
+    """Dictionnaire nom → agent, chaque agent étant construit au premier accès."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        agent = self._agents.get(name)
+        if agent is None:
+            if name not in _AGENT_CLASSES:
+                raise KeyError(name)
+            with self._lock:
+                agent = self._agents.get(name)
+                if agent is None:
+                    agent = self._agents[name] = self._factory(name)
+        return agent
+
+    def __iter__(self):
+        return iter(_AGENT_CLASSES)
+
+    def __len__(self):
+        return len(_AGENT_CLASSES)
+
+    def loaded(self) -> list[str]:
+        return list(self._agents)
+
+    def preload(self, background: bool = True):
+        """Construit tous les agents (dans un thread pour ne pas retarder le premier rendu)."""
+        def load_all():
+            for name in _AGENT_CLASSES:
+                try:
+                    self[name]
+                except Exception:
+                    logging.exception(f"Préchargement de l'agent '{name}' impossible")
+        if background:
+            threading.Thread(target=load_all, name="agents-preload", daemon=True).start()
+        else:
+            load_all()
+
+
 class Dispatcher:
     """Route les requêtes vers quatre agents (transport, météo, culture, loisirs)."""
 
@@ -32,54 +91,49 @@ class Dispatcher:
         model_path: str = "checkpoints/dispatcher_sbert.pt",
         hf_repo_id: str = "meriem2801/portfolio",
         hf_filename: str = "dispatcher_sbert.pt",
-        threshold: float = 0.50,
-        secondary_threshold: float = 0.35
+        threshold: float | None = None,
+        secondary_threshold: float | None = None,
+        request_timeout: float | None = 25.0,
+        session_store=None,
+        classifier_url: str | None = None,
+        watch_interval: float | None = None,
+        journal_path: str | None = None
     ):
-        self.threshold = threshold
-        self.secondary_threshold = secondary_threshold
+        # Seuils explicites > fichier de training/tune_thresholds.py > valeurs historiques
+        self._thresholds_pinned = threshold is not None or secondary_threshold is not None
+        tuned = self._load_thresholds(DISPATCHER_THRESHOLDS_PATH)
+        self.threshold = threshold if threshold is not None else tuned.get("threshold", 0.50)
+        self.secondary_threshold = (secondary_threshold if secondary_threshold is not None
+                                    else tuned.get("secondary_threshold", 0.35))
+        # Deadline globale d'une requête, héritée par chaque appel externe des agents
+        self.request_timeout = request_timeout
 
-        # ✅ 1) On privilégie le fichier local si présent
-        if os.path.exists(model_path):
-            resolved_path = model_path
+        # Modèle local, ou client du serveur de classification partagé
+        classifier_url = classifier_url or CLASSIFIER_URL
+        if classifier_url:
+            self.classifier = ClassifierClient(classifier_url)
         else:
-            # ✅ 2) Sinon on le télécharge depuis Hugging Face (cache auto)
-            resolved_path = hf_hub_download(
-                repo_id=hf_repo_id,
-                filename=hf_filename,
-                repo_type="model",
-            )
-
-        # Chargement du checkpoint fine-tune
-        ckpt = torch.load(resolved_path, map_location="cpu")
-        self.label2id = ckpt["label2id"]
-        self.id2label = {i: lbl for lbl, i in self.label2id.items()}
-
-        # Backbone SBERT
-        self.backbone = SentenceTransformer(
-            "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-        )
-        self.backbone.load_state_dict(ckpt["sbert"])
-        self.backbone.eval()
-
-        # Tête de classification
-        dim = self.backbone.get_sentence_embedding_dimension()
-        self.clf = torch.nn.Sequential(
-            torch.nn.Dropout(0.2),
-            torch.nn.Linear(dim, 256),
-            torch.nn.ReLU(),
-            torch.nn.Dropout(0.2),
-            torch.nn.Linear(256, len(self.label2id)),
-        )
-        self.clf.load_state_dict(ckpt["clf"])
-        self.clf.eval()
-
-        # Agents métiers
-        self.agents = {
-            "transport": TransportAgent(),
-            "météo":     WeatherAgent(),
-            "culture":   CultureAgent(),
-            "loisirs":   LoisirsAgent(),
-        }
+            self.classifier = SbertClassifier(resolve_checkpoint(model_path, hf_repo_id, hf_filename))
+
+        # Historique des conversations, hors du process (survit aux redémarrages)
+        self.sessions = session_store or open_session_store(SESSION_STORE_URL, ttl=SESSION_TTL)
+
+        # Agents métiers, construits au premier usage
+        self.agents = LazyAgents(self._build_agent)
+
+        self._register_caches()
+        start_monitor_from_env()
+
+        # Journal des requêtes (écrit en tâche de fond) ; journal_path="" le désactive
+        self.journal = open_journal(journal_path)
+
+        # Surveillance du checkpoint (modèle local uniquement : le serveur gère le sien)
+        watch_interval = CHECKPOINT_WATCH_INTERVAL if watch_interval is None else watch_interval
+        self.watcher = None
+        if watch_interval and not classifier_url:
+            from services.hot_reload import CheckpointWatcher
+
+            self.watcher = CheckpointWatcher(self, model_path, hf_repo_id, hf_filename, interval=watch_interval)
 
         # Pré-compile les regex fallback
         self._kw_regex = {
@@ -87,23 +141,97 @@ class Dispatcher:
             for lbl, pat in self._KEYWORDS.items()
         }
 
-    @functools.lru_cache(maxsize=256)
-    def _encode(self, text: str):
-        with torch.no_grad():
-            return self.backbone.encode(text, convert_to_tensor=True)
+    # Le classifieur porte backbone, tête et label2id : un seul attribut à échanger
+    @property
+    def label2id(self):
+        return self.classifier.label2id
+
+    @property
+    def id2label(self):
+        return self.classifier.id2label
+
+    @property
+    def backbone(self):
+        return self.classifier.backbone  # None si le modèle est distant
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.classifier.embed(texts)
+
+    def swap_classifier(self, new_classifier):
+        """
+        Remplace le modèle d'un bloc (affectation atomique). Les requêtes en cours gardent
+        leur référence à l'ancien, qui est libéré à la fin de la dernière.
+        """
+        # base patrimoine encodée par l'ancien backbone : désactivée AVANT l'échange, sinon
+        # les requêtes seraient encodées par le nouveau modèle et comparées aux anciens vecteurs
+        if "culture" in self.agents.loaded():
+            culture = self.agents["culture"]
+            if culture.kb is not None and not culture.kb.matches(new_classifier.embed):
+                culture.kb = None
+                logging.warning("[Dispatcher] nouveau backbone : base patrimoine désactivée, la reconstruire "
+                                "(python -m services.heritage_kb build ...) puis redémarrer")
+        old = self.classifier
+        self.classifier = new_classifier
+        self._register_caches()
+        tuned = {} if self._thresholds_pinned else self._load_thresholds(DISPATCHER_THRESHOLDS_PATH)
+        self.threshold = tuned.get("threshold", self.threshold)
+        self.secondary_threshold = tuned.get("secondary_threshold", self.secondary_threshold)
+        logging.info(f"[Dispatcher] classifieur remplacé ({len(old.label2id)} → {len(self.label2id)} classes)")
+
+    @staticmethod
+    def _load_thresholds(path: str) -> dict:
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                tuned = json.load(f)
+            logging.info(f"[Dispatcher] seuils {tuned['threshold']} / {tuned['secondary_threshold']} lus dans {path}")
+            return tuned
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"[Dispatcher] fichier de seuils {path} ignoré : {e}")
+            return {}
+
+    def _build_agent(self, name: str):
+        module, cls = _AGENT_CLASSES[name]
+        agent_cls = getattr(importlib.import_module(module), cls)
+        if name == "culture":
+            from services.heritage_kb import open_heritage_kb
+
+            # base patrimoine encodée avec le même backbone (local ou via /embed du serveur)
+            agent = agent_cls(session_store=self.sessions, knowledge_base=open_heritage_kb(self.embed))
+        elif name == "loisirs":
+            agent = agent_cls(session_store=self.sessions)
+        else:
+            agent = agent_cls()
+        logging.debug(f"Agent '{name}' chargé")
+
+        # caches de l'agent suivis par services.memory
+        if name == "météo":
+            memory_registry.register("weather.coords", agent._coords, agent._coords_lock)
+            memory_registry.register("weather.forecasts", agent.forecasts._data, agent.forecasts._lock)
+        elif name == "transport":
+            memory_registry.register("transport.durations", agent.durations._data, agent.durations._lock)
+        return agent
+
+    def _register_caches(self):
+        """Caches en mémoire suivis par services.memory (taille, croissance, plafonds)."""
+        if hasattr(self.classifier, "_emb_cache"):
+            memory_registry.register("classifier.embeddings", self.classifier._emb_cache, self.classifier._emb_lock)
+        kv = getattr(self.sessions, "kv", None)
+        if hasattr(kv, "_data"):
+            memory_registry.register("sessions.kv", kv._data, kv._lock, evict=kv.evict_oldest)
 
     def _sbert_predict(self, text: str) -> Tuple[Optional[str], float, List[str]]:
-        emb = self._encode(text)
-        with torch.no_grad():
-            logits = self.clf(emb)
-            probs  = torch.softmax(logits, dim=-1).squeeze(0)
+        clf = self.classifier  # même modèle pour les probas et les labels, même si un swap survient
+        return self._decode(text, clf.predict_proba([text])[0], clf.id2label)
 
-        idx_main = int(torch.argmax(probs).item())
+    def _decode(self, text: str, probs: List[float], id2label: dict) -> Tuple[Optional[str], float, List[str]]:
+        idx_main = max(range(len(probs)), key=probs.__getitem__)
         score    = float(probs[idx_main])
-        label    = self.id2label[idx_main]
+        label    = id2label[idx_main]
 
         secondaries = [
-            self.id2label[i]
+            id2label[i]
             for i, p in enumerate(probs)
             if i != idx_main and p >= self.secondary_threshold
         ]
@@ -121,8 +249,19 @@ class Dispatcher:
         return None
 
     def classify_request(self, text: str) -> List[str]:
-        main, score, secondaries = self._sbert_predict(text)
+        return self._categories(text, *self._sbert_predict(text))
+
+    def classify_batch(self, texts: List[str], batch_size: int = 64) -> List[List[str]]:
+        """Même décision que classify_request, mais un seul forward par lot de `batch_size` textes."""
+        cats = []
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            clf = self.classifier
+            for text, probs in zip(chunk, clf.predict_proba(chunk)):
+                cats.append(self._categories(text, *self._decode(text, probs, clf.id2label)))
+        return cats
 
+    def _categories(self, text: str, main: str, score: float, secondaries: List[str]) -> List[str]:
         # Si score SBERT trop bas (< threshold), tenter fallback par mot clef
         if score < self.threshold:
             kw = self._keyword_fallback(text)
@@ -133,23 +272,94 @@ class Dispatcher:
 
         return [main] + secondaries
 
-    def route_request(self, user_input: str) -> str:
+    def reset_session(self, session_id: str = "default"):
+        """Oublie l'historique de la session, sans toucher au modèle."""
+        self.sessions.reset(session_id)
+
+    def route_request(self, user_input: str, session_id: str | None = "default",
+                      cats: List[str] | None = None, profile: bool | None = None) -> str:
+        """
+        `cats` déjà calculées (ex : classify_batch en mode batch) ; session_id=None : sans historique.
+        profile=True/False force le profilage CPU de la requête (None : PROFILE_SAMPLE_RATE).
+        """
+        request_id = uuid.uuid4().hex[:12]
+        entry = {"request_id": request_id, "session_id": session_id, "text": user_input, "ts": time.time()}
+        t0 = time.perf_counter()
+        profiler = None
+        try:
+            try:
+                profiler = start_profiler(profile)
+            except Exception:
+                logging.exception(f"[Profiler] profilage de la requête {request_id} impossible")
+            with deadline(self.request_timeout), request_scope(session_id) as decisions:
+                response = self._route(user_input, session_id, cats, entry)
+                if decisions:
+                    logging.info("[LLM] " + ", ".join(f"{d['requested']}→{d['model']} ({d['reason']})" for d in decisions))
+                entry["models"] = [d["model"] for d in decisions]
+            return response
+        except Exception as e:
+            entry["outcome"] = f"exception: {type(e).__name__}"
+            raise
+        finally:
+            entry["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            if profiler is not None:
+                # diagnostic optionnel : une erreur ici ne doit jamais coûter la réponse
+                try:
+                    profiler.stop()
+                    entry["profile"] = profiler.write(PROFILE_DIR, request_id, entry.get("categories"))
+                except Exception:
+                    logging.exception(f"[Profiler] profil de la requête {request_id} non écrit")
+            if self.journal is not None:
+                self.journal.record(entry)
+
+    def _route(self, user_input: str, session_id: str | None, cats: List[str] | None = None,
+               entry: dict | None = None) -> str:
+        entry = {} if entry is None else entry
         logging.info(f"[User] {user_input}")
-        cats = self.classify_request(user_input)
+        if cats is None:
+            main, score, secondaries = self._sbert_predict(user_input)
+            cats = self._categories(user_input, main, score, secondaries)
+            entry.update(main=main, score=round(score, 4))
         logging.info(f"[Cats] {cats}")
+        entry["categories"] = cats
 
         output = []
+        entry["agents"] = timings = []
         for cat in cats:
-            agent = self.agents.get(cat)
+            # les agents sont construits au premier accès (LazyAgents) : un échec de
+            # construction (dépendance absente, base corrompue...) ne coûte que cet agent
+            try:
+                agent = self.agents.get(cat)
+            except Exception as e:
+                logging.exception(f"Construction de l'agent '{cat}' impossible")
+                output.append(f"[{cat.capitalize()}] [Erreur] agent indisponible : {e}")
+                timings.append({"agent": cat, "outcome": "init_error"})
+                continue
             if not agent:
                 logging.error(f"Aucun agent pour '{cat}'")
+                timings.append({"agent": cat, "outcome": "absent"})
+                continue
+            left = remaining()
+            if left is not None and left <= 0:
+                logging.warning(f"Deadline dépassée avant l'agent '{cat}'")
+                output.append(f"[{cat.capitalize()}] [Erreur] délai de réponse dépassé.")
+                timings.append({"agent": cat, "outcome": "deadline"})
                 continue
+            t0 = time.perf_counter()
+            outcome = "ok"
             try:
                 logging.debug(f"→ appel agent '{cat}'")
-                resp = agent.handle_request(user_input)
+                if getattr(agent, "session_store", None) is not None:
+                    resp = agent.handle_request(user_input, session_id=session_id)
+                else:
+                    resp = agent.handle_request(user_input)
             except Exception as e:
                 logging.exception(f"Erreur agent '{cat}'")
                 resp = f"[Erreur] échec de traitement : {e}"
+                outcome = f"exception: {type(e).__name__}"
+            timings.append({"agent": cat, "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+                            "outcome": outcome})
             output.append(f"[{cat.capitalize()}] {resp}")
 
+        entry["outcome"] = "ok" if all(t["outcome"] == "ok" for t in timings) else "partial"
         return "\n".join(output)
@@ -0,0 +1,212 @@
+"""
+Prévisions horaires / journalières Open-Meteo stockées en colonnes numpy.
+
+Une seule requête par lieu (7 jours, horaire + journalier) remplit le cache ; les questions
+« demain à 15h », « ce week-end », « lundi », « dans 3 heures » sont ensuite résolues par
+découpage vectoriel des tableaux, sans nouvel appel réseau tant que le TTL court.
+
+Les horodatages sont stockés en secondes « heure locale » (epoch + décalage UTC renvoyé
+par l'API), pour être comparés directement aux datetime naïfs de Europe/Paris.
+"""
+import re
+import time
+import calendar
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+
+HOURLY_VARS = "temperature_2m,precipitation_probability,weathercode,windspeed_10m"
+DAILY_VARS = "weathercode,temperature_2m_max,temperature_2m_min,precipitation_sum"
+
+_EPOCH = datetime(1970, 1, 1)
+_WEEKDAYS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+_PERIODS = {"matin": 9, "après-midi": 15, "apres-midi": 15, "midi": 12, "soir": 20, "nuit": 23}
+
+
+def local_ts(dt: datetime) -> int:
+    """datetime naïf (heure locale) → secondes, dans la même échelle que le cache."""
+    return calendar.timegm(dt.timetuple())
+
+
+@dataclass
+class Forecast:
+    hourly_time: np.ndarray     # int64, secondes locales
+    temperature: np.ndarray     # float32, °C
+    precip_prob: np.ndarray     # float32, %
+    hourly_code: np.ndarray     # int16
+    windspeed: np.ndarray       # float32, km/h
+    daily_time: np.ndarray      # int64, minuit local
+    tmax: np.ndarray            # float32
+    tmin: np.ndarray            # float32
+    precip_sum: np.ndarray      # float32, mm
+    daily_code: np.ndarray      # int16
+    fetched_at: float
+
+    @classmethod
+    def from_api(cls, data: dict) -> "Forecast":
+        offset = int(data.get("utc_offset_seconds", 0))
+        h, d = data["hourly"], data["daily"]
+
+        def col(values, dtype):
+            # l'API peut renvoyer des null : NaN (ou -1 pour les codes)
+            fill = -1 if np.issubdtype(np.dtype(dtype), np.integer) else np.nan
+            return np.array([fill if v is None else v for v in values], dtype=dtype)
+
+        return cls(
+            hourly_time=np.asarray(h["time"], dtype=np.int64) + offset,
+            temperature=col(h["temperature_2m"], np.float32),
+            precip_prob=col(h["precipitation_probability"], np.float32),
+            hourly_code=col(h["weathercode"], np.int16),
+            windspeed=col(h["windspeed_10m"], np.float32),
+            daily_time=np.asarray(d["time"], dtype=np.int64) + offset,
+            tmax=col(d["temperature_2m_max"], np.float32),
+            tmin=col(d["temperature_2m_min"], np.float32),
+            precip_sum=col(d["precipitation_sum"], np.float32),
+            daily_code=col(d["weathercode"], np.int16),
+            fetched_at=time.time(),
+        )
+
+    def at_hour(self, dt: datetime) -> dict | None:
+        """Valeurs de l'heure la plus proche de `dt` (None hors de la fenêtre de prévision)."""
+        t = local_ts(dt)
+        if not len(self.hourly_time) or t < self.hourly_time[0] or t > self.hourly_time[-1] + 3600:
+            return None
+        i = int(np.clip(np.searchsorted(self.hourly_time, t - 1800), 0, len(self.hourly_time) - 1))
+        return {
+            "temperature": float(self.temperature[i]),
+            "precip_prob": float(self.precip_prob[i]),
+            "code": int(self.hourly_code[i]),
+            "windspeed": float(self.windspeed[i]),
+        }
+
+    def days(self, start: datetime, end: datetime) -> list[dict]:
+        """Résumé journalier de `start` à `end` inclus (découpage par masque)."""
+        mask = (self.daily_time >= local_ts(start)) & (self.daily_time <= local_ts(end))
+        idx = np.nonzero(mask)[0]
+        return [
+            {
+                "date": _EPOCH + timedelta(seconds=int(self.daily_time[i])),
+                "tmax": float(self.tmax[i]),
+                "tmin": float(self.tmin[i]),
+                "precip_sum": float(self.precip_sum[i]),
+                "code": int(self.daily_code[i]),
+            }
+            for i in idx
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes for v in vars(self).values() if isinstance(v, np.ndarray))
+
+
+class ForecastCache:
+    """Cache LRU (+ TTL) des prévisions par lieu, clé = coordonnées arrondies à ~1 km."""
+
+    def __init__(self, ttl: float = 1800, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(lat: float, lon: float) -> tuple:
+        return round(lat, 2), round(lon, 2)
+
+    def get(self, lat: float, lon: float, fetch) -> Forecast:
+        """`fetch(lat, lon)` → JSON Open-Meteo ; appelé seulement si absent ou expiré."""
+        k = self.key(lat, lon)
+        with self._lock:
+            fc = self._data.get(k)
+            if fc is not None and time.time() - fc.fetched_at < self.ttl:
+                self._data.move_to_end(k)
+                return fc
+        fc = Forecast.from_api(fetch(lat, lon))
+        with self._lock:
+            self._data[k] = fc
+            self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return fc
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =========================
+# Expressions temporelles
+# =========================
+@dataclass
+class TimeQuery:
+    kind: str              # "current", "hour" ou "days"
+    start: datetime | None = None
+    end: datetime | None = None
+    label: str = ""
+
+
+def parse_time_expression(text: str, now: datetime | None = None) -> TimeQuery:
+    """
+    Reconnaît : aujourd'hui / demain / après-demain, un jour de la semaine, « ce week-end »,
+    « dans N heures / jours », une heure (« à 15h », « 15h30 ») ou un moment (« demain matin »).
+    Sans expression reconnue : météo actuelle.
+    """
+    now = now or datetime.now()
+    t = text.lower()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    m = re.search(r"dans\s+(\d+)\s*h(?:eures?)?\b", t)
+    if m:
+        dt = now + timedelta(hours=int(m.group(1)))
+        return TimeQuery("hour", dt, dt, f"dans {m.group(1)} h")
+    m = re.search(r"dans\s+(\d+)\s*jours?\b", t)
+    if m:
+        day = today + timedelta(days=int(m.group(1)))
+        return TimeQuery("days", day, day, f"dans {m.group(1)} jours")
+
+    if re.search(r"\b(?:ce|le)\s+week-?end\b", t):
+        if now.weekday() == 6:
+            start = today
+        else:
+            start = today + timedelta(days=(5 - now.weekday()) % 7)
+        end = start + timedelta(days=1) if start.weekday() == 5 else start
+        return TimeQuery("days", start, end, "ce week-end")
+
+    day, label = None, ""
+    if "après-demain" in t or "apres-demain" in t:
+        day, label = today + timedelta(days=2), "après-demain"
+    elif "demain" in t:
+        day, label = today + timedelta(days=1), "demain"
+    elif "aujourd" in t or "ce soir" in t or "ce matin" in t or "cet après-midi" in t:
+        day, label = today, "aujourd'hui"
+    else:
+        for i, name in enumerate(_WEEKDAYS):
+            if re.search(rf"\b{name}\b", t):
+                delta = (i - now.weekday()) % 7 or 7
+                day, label = today + timedelta(days=delta), name
+                break
+
+    hour = None
+    m = re.search(r"\b(\d{1,2})\s*h\s*(\d{2})?\b", t)
+    if m and int(m.group(1)) < 24:
+        hour = (int(m.group(1)), int(m.group(2) or 0))
+        label = f"{label} à {m.group(1)}h{m.group(2) or ''}".strip()
+    else:
+        for word, h in _PERIODS.items():
+            if re.search(rf"\b{word}\b", t):
+                hour = (h, 0)
+                if label == "aujourd'hui":
+                    label = f"{'cet' if word.startswith('a') else 'ce'} {word}"
+                else:
+                    label = f"{label} {word}".strip()
+                break
+
+    if hour is not None:
+        dt = (day or today).replace(hour=hour[0], minute=hour[1])
+        if day is None and dt < now:
+            dt += timedelta(days=1)  # « à 8h » le soir : demain matin
+        return TimeQuery("hour", dt, dt, label)
+    if day is not None:
+        return TimeQuery("days", day, day, label)
+    return TimeQuery("current")
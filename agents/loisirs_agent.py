@@ -1,21 +1,119 @@
 import os
-from openai import OpenAI
+import re
+from datetime import datetime, timedelta
 from config import OPENAI_API_KEY
+from services.resilience import chat_completion
+from services.session_store import KVSessionStore
+from services.events_index import open_events_index
+from agents.forecast_cache import parse_time_expression
+
+# Émoji par type d'événement (premier mot-clé trouvé dans le titre ou les mots-clés)
+_EMOJIS = [
+    ("concert", "🎵"), ("musique", "🎵"), ("jazz", "🎷"), ("exposition", "🖼️"), ("expo", "🖼️"),
+    ("musée", "🏛️"), ("théâtre", "🎭"), ("spectacle", "🎭"), ("danse", "💃"), ("cinéma", "🎬"),
+    ("film", "🎬"), ("festival", "🎉"), ("marché", "🧺"), ("brocante", "🧺"), ("sport", "🏃"),
+    ("course", "🏃"), ("balade", "🚶"), ("visite", "🚶"), ("atelier", "🛠️"), ("enfant", "🧒"),
+    ("conférence", "🎤"), ("lecture", "📚"), ("livre", "📚"),
+]
+
+_CITY_RE = re.compile(r"\b(?:à|de|sur|pour|vers)\s+([A-ZÀ-Ö][\w'-]*(?:\s+[A-ZÀ-Ö][\w'-]*)*)")
+
 
 class LoisirsAgent:
-    def __init__(self):
+    namespace = "loisirs"
+    system_prompt = "Réponds en expert en loisirs et événements culturels."
+    phrasing_prompt = ("Réponds en expert en loisirs. Présente uniquement les événements fournis, "
+                       "sans en inventer d'autres, avec leurs dates et lieux.")
+
+    def __init__(self, session_store=None, max_history: int = 20, events_index=None,
+                 top_k: int = 8, phrase_with_llm: bool = False):
+        from openai import OpenAI  # import différé : le module reste léger à importer
+
         self.model = "gpt-4o"
         self.client = OpenAI(api_key=OPENAI_API_KEY or os.getenv("OPENAI_API_KEY"))
-        self.conversation_history = [
-            {"role": "system", "content": "Réponds en expert en loisirs et événements culturels."}
-        ]
-
-    def handle_request(self, user_input):
-        self.conversation_history.append({"role": "user", "content": user_input})
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.conversation_history
-        )
-        reply = response.choices[0].message.content
-        self.conversation_history.append({"role": "assistant", "content": reply})
+        # Historique externalisé : seuls les `max_history` derniers tours sont relus
+        self.session_store = session_store or KVSessionStore()
+        self.max_history = max_history
+        # Index local d'événements (services/events_index.py) : interrogé avant gpt-4o
+        self.events = events_index if events_index is not None else open_events_index()
+        self.top_k = top_k
+        self.phrase_with_llm = phrase_with_llm
+
+    # ----- index local -----
+    @staticmethod
+    def extract_city(user_input):
+        for match in _CITY_RE.finditer(user_input):
+            return match.group(1).strip()
+        return None
+
+    @staticmethod
+    def date_window(user_input, now=None):
+        """Fenêtre (début, fin) en timestamps ; sans précision : les 7 prochains jours."""
+        now = now or datetime.now()
+        tq = parse_time_expression(user_input, now)
+        if tq.kind == "days":
+            start, end = tq.start, tq.end + timedelta(days=1)
+        elif tq.kind == "hour":
+            start = tq.start.replace(hour=0, minute=0)
+            end = start + timedelta(days=1)
+        else:
+            start, end = now, now + timedelta(days=7)
+        return int(start.timestamp()), int(end.timestamp())
+
+    @staticmethod
+    def _emoji(event):
+        text = f"{event.get('title') or ''} {event.get('keywords') or ''}".lower()
+        return next((e for word, e in _EMOJIS if word in text), "📅")
+
+    def format_events(self, events, compact=False):
+        if compact:
+            return "\n".join(f"{self._emoji(ev)} {ev['title']}" for ev in events)
+        lines = []
+        for ev in events:
+            when = datetime.fromtimestamp(ev["start_ts"]).strftime("%d/%m %H:%M") if ev.get("start_ts") else ""
+            where = ev.get("address") or ev.get("city") or ""
+            line = f"- {self._emoji(ev)} **{ev['title']}**"
+            if when or where:
+                line += f" — {', '.join(p for p in (when, where) if p)}"
+            if ev.get("url"):
+                line += f" ([lien]({ev['url']}))"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def search_events(self, user_input):
+        if self.events is None:
+            return []
+        start, end = self.date_window(user_input)
+        return self.events.search(user_input, city=self.extract_city(user_input),
+                                  start_ts=start, end_ts=end, limit=self.top_k)
+
+    def _answer_from_events(self, user_input, events, history):
+        compact = "uniquement les titres" in user_input.lower()
+        if not self.phrase_with_llm or compact:
+            return self.format_events(events, compact=compact)
+        # le LLM ne fait que rédiger à partir des top-k (prompt court, pas de recherche)
+        context = self.format_events(events)
+        messages = [{"role": "system", "content": self.phrasing_prompt}, *history,
+                    {"role": "user", "content": f"{user_input}\n\nÉvénements trouvés :\n{context}"}]
+        response = chat_completion(self.client, model=self.model, messages=messages)
+        return response.choices[0].message.content
+
+    def handle_request(self, user_input, session_id=None):
+        """Sans session_id, la question est traitée sans historique (ex : panneaux de la sidebar)."""
+        history = self.session_store.history(session_id, self.namespace, self.max_history) if session_id else []
+        events = self.search_events(user_input)
+        if events:
+            reply = self._answer_from_events(user_input, events, history)
+        else:
+            messages = [{"role": "system", "content": self.system_prompt}, *history,
+                        {"role": "user", "content": user_input}]
+            response = chat_completion(
+                self.client,
+                model=self.model,
+                messages=messages
+            )
+            reply = response.choices[0].message.content
+        if session_id:
+            self.session_store.append(session_id, self.namespace, "user", user_input)
+            self.session_store.append(session_id, self.namespace, "assistant", reply)
         return reply
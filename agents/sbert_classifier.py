@@ -0,0 +1,139 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+
+# torch / sentence_transformers / huggingface_hub sont importés au premier chargement du
+# modèle : importer ce module (ou agents.dispatcher) reste quasi gratuit
+
+from services.resilience import guarded, call_timeout
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+
+
+def resolve_checkpoint(
+    model_path: str = "checkpoints/dispatcher_sbert.pt",
+    hf_repo_id: str = "meriem2801/portfolio",
+    hf_filename: str = "dispatcher_sbert.pt",
+) -> str:
+    # ✅ 1) On privilégie le fichier local si présent
+    if os.path.exists(model_path):
+        return model_path
+    # ✅ 2) Sinon on le télécharge depuis Hugging Face (cache auto)
+    from huggingface_hub import hf_hub_download
+
+    return hf_hub_download(
+        repo_id=hf_repo_id,
+        filename=hf_filename,
+        repo_type="model",
+    )
+
+
+class SbertClassifier:
+    """Backbone SBERT fine-tuné + tête de classification, chargés depuis le checkpoint."""
+
+    def __init__(self, checkpoint_path: str, max_cached_texts: int = 256):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        # Chargement du checkpoint fine-tune
+        ckpt = torch.load(checkpoint_path, map_location="cpu")
+        self.label2id = ckpt["label2id"]
+        self.id2label = {i: lbl for lbl, i in self.label2id.items()}
+
+        # Backbone SBERT
+        self.backbone = SentenceTransformer(MODEL_NAME)
+        self.backbone.load_state_dict(ckpt["sbert"])
+        self.backbone.eval()
+
+        # Tête de classification
+        dim = self.backbone.get_sentence_embedding_dimension()
+        self.clf = torch.nn.Sequential(
+            torch.nn.Dropout(0.2),
+            torch.nn.Linear(dim, 256),
+            torch.nn.ReLU(),
+            torch.nn.Dropout(0.2),
+            torch.nn.Linear(256, len(self.label2id)),
+        )
+        self.clf.load_state_dict(ckpt["clf"])
+        self.clf.eval()
+
+        # Cache LRU par instance (un lru_cache sur la méthode retenait `self` et ses tenseurs
+        # pour toute la durée du process) ; enregistré dans services.memory par le Dispatcher
+        self.max_cached_texts = max_cached_texts
+        self._emb_cache = OrderedDict()
+        self._emb_lock = threading.Lock()
+
+    def _encode(self, text: str):
+        import torch
+
+        with self._emb_lock:
+            emb = self._emb_cache.get(text)
+            if emb is not None:
+                self._emb_cache.move_to_end(text)
+                return emb
+        with torch.no_grad():
+            emb = self.backbone.encode(text, convert_to_tensor=True).detach().cpu()
+        with self._emb_lock:
+            self._emb_cache[text] = emb
+            while len(self._emb_cache) > self.max_cached_texts:
+                self._emb_cache.popitem(last=False)
+        return emb
+
+    def predict_proba(self, texts: List[str]) -> List[List[float]]:
+        """Probabilités par classe (ordre des ids), en un seul forward pour tout le lot."""
+        import torch
+
+        with torch.no_grad():
+            if len(texts) == 1:
+                embs = self._encode(texts[0]).unsqueeze(0)
+            else:
+                embs = self.backbone.encode(texts, convert_to_tensor=True, batch_size=len(texts))
+            probs = torch.softmax(self.clf(embs), dim=-1)
+        return probs.tolist()
+
+    def embed(self, texts: List[str], batch_size: int = 64) -> List[List[float]]:
+        """Embeddings normalisés du backbone (base de connaissances patrimoine, sans second modèle)."""
+        import torch
+
+        with torch.no_grad():
+            embs = self.backbone.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                                        convert_to_numpy=True)
+        return embs.tolist()
+
+
+class ClassifierClient:
+    """Client léger du serveur de classification (services/classifier_server.py)."""
+
+    def __init__(self, url: str):
+        import requests
+
+        self.url = url.rstrip("/")
+        self.session = requests.Session()  # keep-alive
+        labels = guarded("classifier", lambda: self._checked(self.session.get(
+            f"{self.url}/labels", timeout=call_timeout("classifier")
+        )).json())
+        self.label2id = labels["label2id"]
+        self.id2label = {i: lbl for lbl, i in self.label2id.items()}
+        self.backbone = None
+        logging.info(f"[Classifier] serveur distant {self.url} ({len(self.label2id)} classes)")
+
+    @staticmethod
+    def _checked(resp):
+        # dans l'appel protégé : une réponse 5xx compte comme un échec pour le disjoncteur
+        resp.raise_for_status()
+        return resp
+
+    def predict_proba(self, texts: List[str]) -> List[List[float]]:
+        resp = guarded("classifier", lambda: self._checked(self.session.post(
+            f"{self.url}/classify", json={"texts": texts}, timeout=call_timeout("classifier")
+        )))
+        return resp.json()["probs"]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        resp = guarded("classifier", lambda: self._checked(self.session.post(
+            f"{self.url}/embed", json={"texts": texts}, timeout=call_timeout("classifier")
+        )))
+        return resp.json()["embeddings"]
@@ -1,18 +1,92 @@
 import os
 import re
+import time
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from services.resilience import chat_completion, guarded, get_provider, bind_context
+
+class DurationTable:
+    """
+    Petit cache origine × destination des durées renvoyées par la Distance Matrix.
+    Seules les paires absentes (ou expirées) déclenchent un appel, et en un seul lot.
+    """
+
+    def __init__(self, gmaps, ttl: float = 300, max_entries: int = 5000):
+        self.gmaps = gmaps
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}  # (origine, destination, mode) -> (element, horodatage)
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entry = self._data.get(key)
+        return entry is not None and time.time() - entry[1] < self.ttl
+
+    def lookup(self, origins: list[str], destinations: list[str], mode: str = "transit") -> dict:
+        """Renvoie {(origine, destination): élément Distance Matrix} pour toutes les paires."""
+        with self._lock:
+            missing = [(o, d) for o in origins for d in destinations if not self._fresh((o, d, mode))]
+        if missing:
+            miss_o = list(dict.fromkeys(o for o, _ in missing))
+            miss_d = list(dict.fromkeys(d for _, d in missing))
+            resp = guarded(
+                "google_maps",
+                self.gmaps.distance_matrix,
+                miss_o,
+                miss_d,
+                mode=mode,
+                departure_time=datetime.now(),
+                language="fr"
+            )
+            now = time.time()
+            with self._lock:
+                for o, row in zip(miss_o, resp.get("rows", [])):
+                    for d, element in zip(miss_d, row.get("elements", [])):
+                        self._data[(o, d, mode)] = (element, now)
+                if len(self._data) > self.max_entries:
+                    # on jette les entrées les plus anciennes
+                    for key, _ in sorted(self._data.items(), key=lambda kv: kv[1][1])[:len(self._data) - self.max_entries]:
+                        del self._data[key]
+        with self._lock:
+            return {
+                (o, d): self._data[(o, d, mode)][0]
+                for o in origins for d in destinations if (o, d, mode) in self._data
+            }
 
-from openai import OpenAI
-import googlemaps
 
 class TransportAgent:
+    # Modes Google Maps comparés, avec leur libellé
+    MODES = {
+        "transit":   "🚆 Transports en commun",
+        "walking":   "🚶 À pied",
+        "bicycling": "🚲 Vélo",
+        "driving":   "🚗 Voiture",
+    }
+    # « comparer », « tous les modes », « quel moyen le plus rapide », « à pied ou en vélo »...
+    _COMPARE_RE = re.compile(
+        r"\b(compar\w*|tous les modes|quel(?:le)?s? (?:moyens?|modes?)|"
+        r"(?:à pied|vélo|voiture|transports? en commun)\s+ou\b)",
+        re.IGNORECASE
+    )
+
     def __init__(self):
+        # imports différés : le module reste léger, le coût est payé à la création de l'agent
+        import googlemaps
+        from openai import OpenAI
+
         openai_api_key = os.getenv("OPENAI_API_KEY")
         self.client = OpenAI(api_key=openai_api_key)
+        # googlemaps fixe le timeout HTTP à la création du client et ne permet pas de le passer
+        # par appel : ses requêtes ne suivent donc pas la deadline (call_timeout), seulement ce
+        # plafond. La deadline est vérifiée avant chaque appel, pas pendant.
         self.gmaps = googlemaps.Client(
             key=os.getenv("GOOGLE_MAPS_API_KEY"),
-            timeout=10
+            timeout=get_provider("google_maps").timeout,
+            retry_timeout=10  # défaut googlemaps : 60 s de retries sur les 5xx
         )
+        self.durations = DurationTable(self.gmaps)
 
     def extract_parameters(self, text: str):
         """
@@ -38,6 +112,85 @@ class TransportAgent:
 
         return None, None
 
+    # fragments de liste qui ne sont jamais des lieux (« de Lille à Paris, s'il vous plaît »)
+    _NOT_PLACES = re.compile(r"^(s'il (vous|te) pla[iî]t|svp|merci|retour|aller-retour|stp)$", re.IGNORECASE)
+    # nom de lieu : majuscule, éventuellement après un article (« la Défense », « l'Opéra »)
+    _PLACE = re.compile(r"^(?:(?:le|la|les|l')\s*)?[A-ZÀ-Ý0-9]")
+    # heure (« 8h », « 9 h 30 ») : jamais un lieu
+    _TIME = re.compile(r"\b\d{1,2}\s*h(?:\s*\d{2})?\b", re.IGNORECASE)
+    # fin de phrase temporelle : « Lyon demain à 8h ou 9h » → « Lyon »
+    _TIME_TAIL = re.compile(
+        r"\s+(?:demain|après-demain|aujourd'hui|maintenant|ce\s+(?:soir|matin|midi)|cet\s+après-midi|"
+        r"lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche|(?:à|vers|avant|après|pour)\s+\d{1,2}\s*h)\b.*$",
+        re.IGNORECASE
+    )
+
+    @classmethod
+    def _split_places(cls, text: str) -> list[str]:
+        text = cls._TIME_TAIL.sub("", text)
+        parts = [p.strip(" ?!.:") for p in re.split(r",|\s+ou\s+|\s+et\s+", text)]
+        return [p for p in parts
+                if p and not cls._NOT_PLACES.match(p) and not cls._TIME.search(p)
+                and cls._PLACE.match(p) and len(p.split()) <= 5]
+
+    def extract_matrix_parameters(self, text: str):
+        """
+        Détecte les questions un-vers-plusieurs / plusieurs-vers-plusieurs :
+        « le plus rapide depuis Châtelet : Louvre, Orsay ou Pompidou ? »,
+        « de Lille ou Roubaix à Paris, Lens ou Arras ». Renvoie (origines, destinations)
+        seulement s'il y a plus d'une paire de vrais noms de lieux, sinon (None, None) :
+        la question suit alors le chemin normal (classify_request).
+        """
+        match = (
+            re.search(r"\bdepuis\s+(.+?)\s*(?::|\bà\b|\bvers\b|\bjusqu'à\b)\s*(.+)", text, re.IGNORECASE)
+            or re.search(r"\bde\s+(.+?)\s+(?:à|vers)\s+(.+)", text, re.IGNORECASE)
+        )
+        if not match:
+            return None, None
+        origins = self._split_places(match.group(1))
+        destinations = self._split_places(match.group(2))
+        if not origins or not destinations or len(origins) * len(destinations) < 2:
+            return None, None
+        return origins, destinations
+
+    def rank_destinations(self, origins: list[str], destinations: list[str], mode: str = "transit") -> str:
+        """Un seul appel Distance Matrix pour N candidats, puis classement par durée."""
+        try:
+            table = self.durations.lookup(origins, destinations, mode)
+        except Exception as e:
+            return f"Erreur API Google Maps : {e}"
+
+        ok = {pair: el for pair, el in table.items() if el.get("status") == "OK"}
+        if not ok:
+            return "Aucun trajet trouvé pour ces lieux."
+
+        label = self.MODES.get(mode, mode)
+        lines = []
+        if len(origins) == 1:
+            lines.append(f"Temps de trajet depuis {origins[0]} ({label})")
+            lines.append(f"*Départ prévu à {datetime.now().strftime('%H:%M')}*")
+            ranked = sorted(
+                ((d, el) for (o, d), el in ok.items()),
+                key=lambda item: item[1]["duration"]["value"]
+            )
+            for rank, (dest, el) in enumerate(ranked, start=1):
+                lines.append(f"\n### {rank}. {dest} — durée totale : {el['duration']['text']}")
+                lines.append(f"- Distance : {el['distance']['text']}")
+        else:
+            lines.append(f"Temps de trajet ({label})")
+            lines.append("\n| Départ | " + " | ".join(destinations) + " |")
+            lines.append("|---" * (len(destinations) + 1) + "|")
+            for o in origins:
+                cells = [ok[(o, d)]["duration"]["text"] if (o, d) in ok else "—" for d in destinations]
+                lines.append(f"| {o} | " + " | ".join(cells) + " |")
+            (bo, bd), best = min(ok.items(), key=lambda item: item[1]["duration"]["value"])
+            lines.append(f"\n**Plus rapide** : {bo} → {bd} ({best['duration']['text']})")
+
+        missing = [f"{o} → {d}" for o in origins for d in destinations if (o, d) not in ok]
+        if missing:
+            lines.append("\n*Trajets introuvables :* " + ", ".join(missing))
+        return "\n".join(lines)
+
     def classify_request(self, user_input: str) -> str:
         """
         Retourne 'ITINERARY' si la requête est un itinéraire, sinon 'GENERAL'.
@@ -47,7 +200,8 @@ class TransportAgent:
             "est une demande d'itinéraire (« de A à B ») ou une question générale sur les transports.\n"
             "Répondez strictement par ITINERARY ou GENERAL."
         )
-        resp = self.client.chat.completions.create(
+        resp = chat_completion(
+            self.client,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system",  "content": prompt},
@@ -65,7 +219,8 @@ class TransportAgent:
             "Transformez la phrase de l'utilisateur en une forme exacte « de X à Y ». "
             "Si non pertinent, renvoyez une chaîne vide."
         )
-        resp = self.client.chat.completions.create(
+        resp = chat_completion(
+            self.client,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system",  "content": prompt},
@@ -75,12 +230,98 @@ class TransportAgent:
         )
         return resp.choices[0].message.content.strip()
 
-    def handle_request(self, user_input: str) -> str:
+    def wants_comparison(self, user_input: str) -> bool:
+        return bool(self._COMPARE_RE.search(user_input))
+
+    @staticmethod
+    def _strip_modes(place: str) -> str:
+        # « Roubaix à pied ou en vélo ? » → « Roubaix »
+        place = re.split(r"\s+(?:à pied|en vélo|à vélo|en voiture|en transports?|ou)\b", place, maxsplit=1)[0]
+        return place.strip(" ?!.")
+
+    def _first_route(self, origin, destination, mode, now):
+        routes = guarded(
+            "google_maps",
+            self.gmaps.directions,
+            origin,
+            destination,
+            mode=mode,
+            departure_time=now,
+            language="fr"
+        )
+        return routes[0] if routes else None
+
+    def compare_modes(self, origin: str, destination: str) -> str:
+        """
+        Interroge transit, marche, vélo et voiture en parallèle (latence ≈ un seul appel)
+        puis classe les modes par durée, puis par nombre de correspondances.
+        """
+        now = datetime.now()
+        with ThreadPoolExecutor(max_workers=len(self.MODES)) as pool:
+            futures = {
+                mode: pool.submit(bind_context(self._first_route), origin, destination, mode, now)
+                for mode in self.MODES
+            }
+        results, errors = [], []
+        for mode, fut in futures.items():
+            try:
+                route = fut.result()
+            except Exception as e:
+                errors.append(f"- {self.MODES[mode]} : erreur API Google Maps ({e})")
+                continue
+            if not route:
+                errors.append(f"- {self.MODES[mode]} : aucun itinéraire")
+                continue
+            leg = route["legs"][0]
+            n_transit = sum(1 for step in leg["steps"] if step["travel_mode"] == "TRANSIT")
+            results.append({
+                "mode": mode,
+                "seconds": leg["duration"]["value"],
+                "duration": leg["duration"]["text"],
+                "distance": leg["distance"]["text"],
+                "transfers": max(0, n_transit - 1),
+            })
+
+        if not results:
+            return f"Aucun itinéraire trouvé entre « {origin} » et « {destination} »."
+
+        results.sort(key=lambda r: (r["seconds"], r["transfers"]))
+        lines = [
+            f"Comparaison des modes de {origin} → {destination}",
+            f"*Départ prévu à {now.strftime('%H:%M')}*"
+        ]
+        for rank, res in enumerate(results, start=1):
+            lines.append(f"\n### {rank}. {self.MODES[res['mode']]} — durée totale : {res['duration']}")
+            details = f"- Distance : {res['distance']}"
+            if res["mode"] == "transit":
+                details += f" · Correspondances : {res['transfers']}"
+            lines.append(details)
+        if errors:
+            lines.append("\n*Modes indisponibles :*")
+            lines.extend(errors)
+        return "\n".join(lines)
+
+    def handle_request(self, user_input: str, compare: bool | None = None) -> str:
+        """compare=None : comparaison multi-modes si la question la demande."""
+        if compare is None:
+            compare = self.wants_comparison(user_input)
+        if compare:
+            # itinéraire explicite : pas besoin de la chaîne de classification LLM
+            origin, destination = self.extract_parameters(user_input)
+            if origin and destination:
+                return self.compare_modes(origin, self._strip_modes(destination))
+        else:
+            # un départ, plusieurs candidats (ou l'inverse) : une seule requête Distance Matrix
+            origins, destinations = self.extract_matrix_parameters(user_input)
+            if origins:
+                return self.rank_destinations(origins, destinations)
+
         # Classification
         kind = self.classify_request(user_input)
         if kind != "ITINERARY":
             # question générale, on délègue à OpenAI --- type "Quel est le moyen de transport le + écologique"
-            resp = self.client.chat.completions.create(
+            resp = chat_completion(
+                self.client,
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system",  "content": "Vous êtes un expert en transport. Répondez clairement à la question."},
@@ -101,10 +342,15 @@ class TransportAgent:
                 "Merci d'indiquer votre itinéraire sous la forme « de X à Y ». "
             )
 
+        if compare:
+            return self.compare_modes(origin, self._strip_modes(destination))
+
         # Appel Google Maps en français
         now = datetime.now()
         try:
-            routes = self.gmaps.directions(
+            routes = guarded(
+                "google_maps",
+                self.gmaps.directions,
                 origin,
                 destination,
                 mode="transit",
@@ -1,11 +1,44 @@
 import re
-import requests
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.forecast_cache import ForecastCache, parse_time_expression, HOURLY_VARS, DAILY_VARS
+from services.resilience import http_get, bind_context
+
+# Mots qui terminent le nom de ville : « à Lille demain à 15h » → « Lille »
+# (aussi en tête de fragment : « à Paris demain et après-demain » → « après-demain » → vide)
+_TIME_WORDS = re.compile(
+    r"(?:^|\s+)(?:après-demain|apres-demain|demain|aujourd\S*|ce|cet|cette|dans|matin|midi|soir|nuit|"
+    r"lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche|à|pour)\b.*$",
+    re.IGNORECASE
+)
+# Fragments d'énumération qui ne sont pas des villes (politesse, proposition, mot météo) ;
+# la casse n'est pas un indice : « météo à paris et lyon » doit marcher
+_NOT_CITIES = re.compile(
+    r"^(?:s'il (?:vous|te) pla[iî]t|svp|stp|merci)$"
+    r"|^(?:(?:le|la|les|l')\s*)?(?:il|elle|on|je|j'|tu|nous|vous|ils|elles|ça|ca|c'est|est|y|"
+    r"que|qu'|quel|quelle|comment|combien|météo|meteo|temps|température|pluie|vent|prévisions?)\b",
+    re.IGNORECASE
+)
+_JOURS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+
 
 class WeatherAgent:
-    def __init__(self):
+    def __init__(self, max_cached_cities: int = 1000):
         # Endpoints pour la géocodification et la météo via Open-Meteo
         self.geocoding_api_url = "https://geocoding-api.open-meteo.com/v1/search"
         self.weather_api_url = "https://api.open-meteo.com/v1/forecast"
+        # Séries horaires / journalières par lieu (numpy) et géocodage déjà résolu
+        self.forecasts = ForecastCache()
+        self._coords = OrderedDict()
+        self._coords_lock = threading.Lock()  # get_coordinates_many géocode depuis plusieurs threads
+        self.max_cached_cities = max_cached_cities
+
+    @staticmethod
+    def _clean_city(city):
+        return _TIME_WORDS.sub("", city).strip()
 
     def extract_city(self, user_input):
         """
@@ -14,28 +47,166 @@ class WeatherAgent:
         """
         match = re.search(r"(?:à|pour)\s+([A-Za-zÀ-ÖØ-öø-ÿ\s\-]+)", user_input, re.IGNORECASE)
         if match:
-            return match.group(1).strip()
+            return self._clean_city(match.group(1)) or None
         return None
 
+    def extract_cities(self, user_input):
+        """
+        Comme extract_city, mais accepte une énumération :
+        « météo à Lille, Paris et Lyon » → ["Lille", "Paris", "Lyon"].
+        """
+        match = re.search(r"(?:à|pour)\s+([A-Za-zÀ-ÖØ-öø-ÿ\s\-,']+)", user_input, re.IGNORECASE)
+        if not match:
+            return []
+        cities = []
+        for part in re.split(r",|\bet\b", match.group(1)):
+            part = self._clean_city(re.sub(r"^(?:à|pour)\s+", "", part.strip(), flags=re.IGNORECASE))
+            # seuls les fragments qui ressemblent à un nom de lieu comptent
+            # (« à Paris, s'il vous plaît », « à Paris et il pleut à Lyon »)
+            if not part or _NOT_CITIES.match(part) or len(part.split()) > 4:
+                continue
+            if part.lower() not in (c.lower() for c in cities):
+                cities.append(part)
+        return cities
+
     def get_coordinates(self, city):
         """
         Utilise le service de géocodage d'Open-Meteo pour obtenir
         les coordonnées (latitude, longitude) de la ville.
         """
+        key = city.lower()
+        with self._coords_lock:
+            if key in self._coords:
+                self._coords.move_to_end(key)
+                return self._coords[key]
         params = {
             "name": city,
             "count": 1,
             "language": "fr",
             "format": "json"
         }
-        response = requests.get(self.geocoding_api_url, params=params)
+        response = http_get("open_meteo", self.geocoding_api_url, params=params, hedge=True)
         data = response.json()
         if "results" in data and len(data["results"]) > 0:
             result = data["results"][0]
-            return result["latitude"], result["longitude"]
+            coords = (result["latitude"], result["longitude"])
+            with self._coords_lock:
+                self._coords[key] = coords
+                if len(self._coords) > self.max_cached_cities:
+                    self._coords.popitem(last=False)
+            return coords
         else:
             return None, None
 
+    def get_coordinates_many(self, cities):
+        """Géocode plusieurs villes en parallèle (un appel Open-Meteo par ville)."""
+        if not cities:
+            return []
+        with ThreadPoolExecutor(max_workers=min(8, len(cities))) as pool:
+            return list(pool.map(bind_context(self._safe_coordinates), cities))
+
+    def _safe_coordinates(self, city):
+        try:
+            return self.get_coordinates(city)
+        except Exception:
+            return None, None
+
+    def fetch_current_weather_many(self, coords):
+        """
+        Une seule requête forecast pour toutes les coordonnées (listes séparées par des virgules).
+        Renvoie un bloc `current_weather` (ou None) par coordonnée, dans le même ordre.
+        """
+        params = {
+            "latitude": ",".join(str(lat) for lat, _ in coords),
+            "longitude": ",".join(str(lon) for _, lon in coords),
+            "current_weather": True,
+            "timezone": "Europe/Paris"
+        }
+        response = http_get("open_meteo", self.weather_api_url, params=params, hedge=True)
+        data = response.json()
+        # Open-Meteo renvoie un objet pour un seul point, une liste sinon
+        items = data if isinstance(data, list) else [data]
+        return [item.get("current_weather") for item in items]
+
+    def format_current_weather(self, city, current_weather):
+        temperature = current_weather["temperature"]
+        windspeed = current_weather["windspeed"]
+        weather_description = self.map_weather_code(current_weather["weathercode"])
+        return (f"À {city.capitalize()}, le temps est {weather_description}, "
+                f"la température est de {temperature}°C et la vitesse du vent est de {windspeed} km/h.")
+
+    def handle_batch(self, cities):
+        """
+        Météo actuelle pour plusieurs villes : géocodage concurrent puis un seul
+        appel forecast. Renvoie une liste de dicts {city, ok, text} dans l'ordre des villes.
+        """
+        coords = self.get_coordinates_many(cities)
+        results = [{"city": city, "ok": False, "text": ""} for city in cities]
+        found = [i for i, (lat, lon) in enumerate(coords) if lat is not None and lon is not None]
+        for i, res in enumerate(results):
+            if i not in found:
+                res.update(not_found=True, text=f"Impossible de trouver les coordonnées pour la ville {res['city']}.")
+        if not found:
+            return results
+
+        try:
+            blocks = self.fetch_current_weather_many([coords[i] for i in found])
+        except Exception:
+            blocks = [None] * len(found)
+        for i, block in zip(found, blocks):
+            if block is None:
+                results[i]["text"] = "Erreur lors de la récupération des données météo."
+                continue
+            results[i].update(ok=True, text=self.format_current_weather(cities[i], block), current_weather=block)
+        return results
+
+    def fetch_forecast(self, lat, lon):
+        """Séries horaires + journalières sur 7 jours, en un seul appel (timestamps unix)."""
+        params = {
+            "latitude": lat,
+            "longitude": lon,
+            "hourly": HOURLY_VARS,
+            "daily": DAILY_VARS,
+            "forecast_days": 7,
+            "timeformat": "unixtime",
+            "timezone": "Europe/Paris"
+        }
+        return http_get("open_meteo", self.weather_api_url, params=params, hedge=True).json()
+
+    def forecast_answer(self, city, query):
+        """Réponse à une question datée, à partir du cache numpy (réseau seulement au 1er appel)."""
+        try:
+            lat, lon = self.get_coordinates(city)
+        except Exception:
+            return "Erreur lors de la récupération des données météo."
+        if lat is None or lon is None:
+            return f"Impossible de trouver les coordonnées pour la ville {city}."
+        try:
+            forecast = self.forecasts.get(lat, lon, self.fetch_forecast)
+        except Exception:
+            return "Erreur lors de la récupération des données météo."
+
+        if query.kind == "hour":
+            h = forecast.at_hour(query.start)
+            if h is None:
+                return f"Pas de prévision disponible pour {query.label} à {city.capitalize()}."
+            precip = h["precip_prob"]
+            rain = ("risque de pluie inconnu" if precip is None or math.isnan(precip)
+                    else f"{precip:.0f} % de risque de pluie")
+            return (f"À {city.capitalize()}, {query.label} : {self.map_weather_code(h['code'])}, "
+                    f"{h['temperature']:.1f}°C, {rain}, vent {h['windspeed']:.0f} km/h.")
+
+        days = forecast.days(query.start, query.end)
+        if not days:
+            return f"Pas de prévision disponible pour {query.label} à {city.capitalize()}."
+        lines = []
+        for d in days:
+            jour = f"{_JOURS[d['date'].weekday()]} {d['date'].strftime('%d/%m')}"
+            lines.append(f"À {city.capitalize()}, {jour} : {self.map_weather_code(d['code'])}, "
+                         f"entre {d['tmin']:.0f}°C et {d['tmax']:.0f}°C, "
+                         f"{d['precip_sum']:.1f} mm de précipitations.")
+        return "\n".join(lines)
+
     def map_weather_code(self, code):
         """
         Mappe les codes météo d'Open-Meteo à une description textuelle simplifiée.
@@ -74,11 +245,24 @@ class WeatherAgent:
         return mapping.get(code, "indéterminé")
 
     def handle_request(self, user_input):
-        city = self.extract_city(user_input)
-        if not city:
+        query = parse_time_expression(user_input)
+        # une seule ville reconnue dans l'énumération : elle prime sur le texte brut d'extract_city
+        cities = self.extract_cities(user_input) or [c for c in (self.extract_city(user_input),) if c]
+        if not cities:
             return "Veuillez préciser la ville pour laquelle vous souhaitez connaître la météo."
+        if query.kind != "current":
+            return "\n".join(self.forecast_answer(city, query) for city in cities)
+        if len(cities) > 1:
+            results = self.handle_batch(cities)
+            # fragment non géocodé : probablement pas une ville, on l'ignore s'il en reste d'autres
+            located = [res for res in results if not res.get("not_found")]
+            return "\n".join(res["text"] for res in (located or results))
 
-        lat, lon = self.get_coordinates(city)
+        city = cities[0]
+        try:
+            lat, lon = self.get_coordinates(city)
+        except Exception:
+            return "Erreur lors de la récupération des données météo."
         if lat is None or lon is None:
             return f"Impossible de trouver les coordonnées pour la ville {city}."
 
@@ -89,17 +273,10 @@ class WeatherAgent:
             "timezone": "Europe/Paris"
         }
         try:
-            response = requests.get(self.weather_api_url, params=params)
+            response = http_get("open_meteo", self.weather_api_url, params=params, hedge=True)
             data = response.json()
             if "current_weather" not in data:
                 return "Erreur lors de la récupération des données météo."
-            current_weather = data["current_weather"]
-            temperature = current_weather["temperature"]
-            windspeed = current_weather["windspeed"]
-            weathercode = current_weather["weathercode"]
-            weather_description = self.map_weather_code(weathercode)
-            result = (f"À {city.capitalize()}, le temps est {weather_description}, "
-                      f"la température est de {temperature}°C et la vitesse du vent est de {windspeed} km/h.")
-            return result
+            return self.format_current_weather(city, data["current_weather"])
         except Exception as e:
             return "Erreur lors de la récupération des données météo."
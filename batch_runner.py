@@ -0,0 +1,135 @@
+"""
+Mode batch de l'assistant : un fichier JSONL de questions → un fichier JSONL de réponses.
+
+    python main.py --batch questions.jsonl -o answers.jsonl --concurrency 8
+
+Entrée : une question par ligne, {"id": ..., "question": "..."} (clés acceptées : question,
+text, query ; `id` absent → numéro de ligne ; `session_id` optionnel, sinon sans historique).
+
+Les questions sont lues par lots : un seul forward SBERT par lot (Dispatcher.classify_batch),
+puis les appels aux agents partent sur un pool borné. Les réponses sont écrites dans l'ordre
+d'entrée, au fil de l'eau ; relancer la même commande reprend après la dernière réponse écrite.
+"""
+import os
+import json
+import time
+import logging
+import statistics
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from services.model_selector import request_scope
+
+_TEXT_KEYS = ("question", "text", "query")
+
+
+def read_questions(path: str):
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            text = next((item[k] for k in _TEXT_KEYS if item.get(k)), None)
+            if text is None:
+                logging.warning(f"[Batch] ligne {lineno} ignorée : pas de question")
+                continue
+            yield {"id": str(item.get("id", lineno)), "question": text, "session_id": item.get("session_id")}
+
+
+def load_done(path: str) -> set[str]:
+    """Ids déjà traités ; une dernière ligne tronquée (arrêt brutal) est retirée du fichier."""
+    if not os.path.exists(path):
+        return set()
+    done, valid = set(), []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+                valid.append(line)
+            except (ValueError, KeyError):
+                break
+    with open(path, "r+", encoding="utf-8") as f:
+        f.seek(sum(len(line.encode("utf-8")) for line in valid))
+        f.truncate()
+    return done
+
+
+def _answer(dispatcher, item: dict, cats: list[str]) -> dict:
+    t0 = time.perf_counter()
+    with request_scope(item["session_id"]) as decisions:
+        try:
+            answer, error = dispatcher.route_request(item["question"], session_id=item["session_id"], cats=cats), None
+        except Exception as e:
+            logging.exception(f"[Batch] échec de la question {item['id']}")
+            answer, error = None, str(e)
+    out = {"id": item["id"], "question": item["question"], "categories": cats, "answer": answer,
+           "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+           "models": [d["model"] for d in decisions]}
+    if error:
+        out["error"] = error
+    return out
+
+
+def run_batch(dispatcher, input_path: str, output_path: str | None = None, concurrency: int = 8,
+              batch_size: int = 64, report_every: float = 5.0) -> dict:
+    output_path = output_path or os.path.splitext(input_path)[0] + ".answers.jsonl"
+    if os.path.abspath(output_path) == os.path.abspath(input_path):
+        raise ValueError("le fichier de sortie doit être différent du fichier d'entrée")
+
+    done = load_done(output_path)
+    todo = (q for q in read_questions(input_path) if q["id"] not in done)
+    total = sum(1 for q in read_questions(input_path) if q["id"] not in done)
+    if done:
+        logging.info(f"[Batch] reprise : {len(done)} réponses déjà présentes dans {output_path}")
+
+    latencies, cats_count, models_count, errors = [], Counter(), Counter(), 0
+    written, t_start, t_report = 0, time.perf_counter(), time.perf_counter()
+    in_flight = deque()  # (future), dans l'ordre d'entrée
+
+    def write_next(out):
+        nonlocal written, errors, t_report
+        out_f.write(json.dumps(out, ensure_ascii=False) + "\n")
+        out_f.flush()
+        written += 1
+        latencies.append(out["latency_ms"])
+        cats_count.update(out["categories"])
+        models_count.update(out["models"])
+        errors += "error" in out
+        if time.perf_counter() - t_report >= report_every:
+            t_report = time.perf_counter()
+            rate = written / (t_report - t_start)
+            eta = (total - written) / rate if rate else 0
+            logging.info(f"[Batch] {written}/{total} ({rate:.2f} q/s, reste ~{eta:.0f}s)")
+
+    with open(output_path, "a", encoding="utf-8") as out_f, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        while True:
+            chunk = [q for _, q in zip(range(batch_size), todo)]
+            if not chunk:
+                break
+            cats = dispatcher.classify_batch([q["question"] for q in chunk], batch_size)
+            for item, c in zip(chunk, cats):
+                in_flight.append(pool.submit(_answer, dispatcher, item, c))
+                # fenêtre bornée : on écrit dans l'ordre dès que la plus ancienne est prête
+                while len(in_flight) > 2 * concurrency:
+                    write_next(in_flight.popleft().result())
+        while in_flight:
+            write_next(in_flight.popleft().result())
+
+    elapsed = time.perf_counter() - t_start
+    report = {
+        "output": output_path,
+        "answered": written,
+        "skipped_done": len(done),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_qps": round(written / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": round(statistics.quantiles(latencies, n=20)[-1], 1) if len(latencies) >= 2 else None,
+        "categories": dict(cats_count),
+        "models": dict(models_count),
+    }
+    logging.info(f"[Batch] terminé : {report}")
+    return report
@@ -0,0 +1,70 @@
+"""
+Temps d'un rerun Streamlit selon la taille de l'historique : rendu complet (ancien
+comportement, une bulle par message) vs rendu paginé (ui_history.render_history).
+
+Usage (depuis la racine du dépôt) :
+    python benchmarks/bench_history_render.py --sizes 10 50 200 1000 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.testing.v1 import AppTest
+
+
+def full_app():
+    import streamlit as st
+    for msg in st.session_state.history:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+
+def paginated_app():
+    import streamlit as st
+    from ui_history import render_history
+    render_history(st, st.session_state.history, recent_n=10, page_size=20)
+
+
+def make_history(n: int) -> list[dict]:
+    # réponses transport « longues » (plusieurs étapes) une fois sur deux
+    steps = "\n".join(f"- 🚆 **Ligne {i}** (5 arrêts) : A → B (10:0{i}–10:1{i})" for i in range(8))
+    return [
+        {"role": "user", "content": f"Question {i} : comment aller de Lille à Paris ?"} if i % 2 == 0
+        else {"role": "assistant", "content": f"### Itinéraire #{i}\n{steps}"}
+        for i in range(n)
+    ]
+
+
+def time_rerun(app_fn, history: list[dict], repeat: int) -> float:
+    at = AppTest.from_function(app_fn)
+    at.session_state["history"] = history
+    at.run()  # premier run : imports + caches
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du rendu de l'historique")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'messages':>9} | {'complet (ms)':>12} | {'paginé (ms)':>11}")
+    print("-" * 39)
+    for n in args.sizes:
+        history = make_history(n)
+        full = time_rerun(full_app, history, args.repeat)
+        paged = time_rerun(paginated_app, history, args.repeat)
+        print(f"{n:>9} | {full:>12.1f} | {paged:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Budget de temps d'import (`python -X importtime`) des modules chargés avant le premier
+rendu de ui_app.py, et des modules importés par les scripts d'entraînement.
+
+Chaque module est importé dans un process neuf ; on relève le temps cumulé de l'import,
+le temps total du process et les dépendances les plus lourdes.
+
+Usage (depuis la racine du dépôt) :
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --modules agents.dispatcher --top 15 --budget-ms 300
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# imports faits par ui_app.py avant d'afficher le titre, puis les agents chargés à la demande
+DEFAULT_MODULES = [
+    "streamlit",
+    "agents.dispatcher",
+    "services.geocoder",
+    "services.prefetch",
+    "ui_history",
+    "agents.transport_agent",
+    "agents.weather_agent",
+    "agents.culture_agent",
+    "agents.loisirs_agent",
+    "training_data_searching",
+]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "training")]))
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = (time.perf_counter() - t0) * 1000
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)
+            rows.append((name, self_us, cum_us, indent))
+    # -X importtime affiche les enfants avant le parent : les dépendances directes de la cible
+    # sont les lignes de niveau 1 qui précèdent sa ligne (jusqu'à l'import de niveau 0 précédent)
+    idx = next((i for i, r in enumerate(rows) if r[0] == module and r[3] == 1), None)
+    target = rows[idx] if idx is not None else None
+    top_level = []
+    for r in reversed(rows[:idx] if idx is not None else []):
+        if r[3] == 1:
+            break
+        if r[3] == 3:
+            top_level.append(r)
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"code {proc.returncode}"
+    return {
+        "module": module,
+        "import_ms": target[2] / 1000 if target else None,
+        "wall_ms": wall,
+        "heaviest": sorted(top_level, key=lambda r: -r[2]),
+        "error": error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des temps d'import")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=5, help="dépendances les plus lourdes affichées")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="échec (code 1) si un module dépasse ce temps d'import")
+    args = parser.parse_args()
+
+    over_budget = []
+    print(f"{'module':<28} | {'import (ms)':>11} | {'process (ms)':>12}")
+    print("-" * 58)
+    for module in args.modules:
+        res = measure(module)
+        if res["error"]:
+            print(f"{module:<28} | {'—':>11} | {res['wall_ms']:>12.0f}   ⚠️ {res['error']}")
+            continue
+        print(f"{module:<28} | {res['import_ms']:>11.1f} | {res['wall_ms']:>12.0f}")
+        for name, _, cum_us, _ in res["heaviest"][:args.top]:
+            print(f"    {cum_us / 1000:>8.1f} ms  {name}")
+        if args.budget_ms is not None and res["import_ms"] > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"\nBudget de {args.budget_ms} ms dépassé : {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
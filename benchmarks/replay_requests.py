@@ -0,0 +1,138 @@
+"""
+Rejeu du trafic enregistré par le journal des requêtes (services/request_journal.py)
+contre un Dispatcher, en respectant les écarts d'origine divisés par --speedup.
+
+Sert aux tests de capacité : à x10, une heure de trafic réel passe en 6 minutes. Le
+retard pris sur le planning (lag) montre à partir de quelle accélération le process
+ne suit plus.
+
+Usage (depuis la racine du dépôt) :
+    python benchmarks/replay_requests.py --journal logs/requests.jsonl --speedup 10 --concurrency 16
+    python benchmarks/replay_requests.py --speedup 0          # sans attente : débit maximal
+Le Dispatcher du rejeu a son propre store de sessions en mémoire (memory://) : il ne touche
+jamais aux sessions réelles (SESSION_STORE_URL). Par défaut les requêtes partent sans
+historique ; --sessions rejoue les session_id d'origine dans ce store isolé. Le rejeu
+n'écrit pas dans le journal (sauf --journal-out).
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.request_journal import read_journal  # noqa: E402
+
+
+def load_traffic(path: str, limit: int | None = None) -> list[dict]:
+    entries = [e for e in read_journal(path) if e.get("text")]
+    entries.sort(key=lambda e: e.get("ts", 0))
+    return entries[:limit] if limit else entries
+
+
+def _pct(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+def replay(dispatcher, entries: list[dict], speedup: float = 1.0, concurrency: int = 16,
+           keep_sessions: bool = False, reuse_cats: bool = False) -> dict:
+    """
+    speedup=0 : toutes les requêtes partent dès qu'un worker est libre.
+    keep_sessions=True : à n'utiliser qu'avec un Dispatcher dont le store de sessions est isolé.
+    """
+    results = []
+    lock = threading.Lock()
+    t_first = entries[0].get("ts", 0) if entries else 0
+
+    def run(entry, scheduled):
+        lag = time.perf_counter() - scheduled
+        t0 = time.perf_counter()
+        error = None
+        try:
+            dispatcher.route_request(entry["text"],
+                                     session_id=entry.get("session_id") if keep_sessions else None,
+                                     cats=entry.get("categories") if reuse_cats else None)
+        except Exception as e:
+            error = type(e).__name__
+        with lock:
+            results.append({"latency_ms": (time.perf_counter() - t0) * 1000, "lag_ms": lag * 1000,
+                            "categories": entry.get("categories") or [], "error": error,
+                            "recorded_ms": entry.get("latency_ms")})
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            offset = (entry.get("ts", t_first) - t_first) / speedup if speedup else 0.0
+            scheduled = t_start + offset
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(run, entry, scheduled)
+    elapsed = time.perf_counter() - t_start
+
+    latencies = [r["latency_ms"] for r in results]
+    per_cat = defaultdict(list)
+    for r in results:
+        for cat in r["categories"]:
+            per_cat[cat].append(r["latency_ms"])
+    recorded = [r["recorded_ms"] for r in results if r["recorded_ms"] is not None]
+    span = (entries[-1].get("ts", t_first) - t_first) if entries else 0
+    return {
+        "requests": len(results),
+        "speedup": speedup,
+        "recorded_span_s": round(span, 1),
+        "elapsed_s": round(elapsed, 2),
+        "target_qps": round(len(entries) * speedup / span, 2) if span and speedup else None,
+        "throughput_qps": round(len(results) / elapsed, 2) if elapsed else None,
+        "errors": dict(Counter(r["error"] for r in results if r["error"])),
+        "p50_ms": _pct(latencies, 0.5),
+        "p95_ms": _pct(latencies, 0.95),
+        "recorded_p95_ms": _pct(recorded, 0.95),
+        "lag_p95_ms": _pct([r["lag_ms"] for r in results], 0.95),
+        "per_category_p95_ms": {cat: _pct(v, 0.95) for cat, v in sorted(per_cat.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejeu du journal des requêtes contre un Dispatcher")
+    parser.add_argument("--journal", default="logs/requests.jsonl")
+    parser.add_argument("--speedup", type=float, default=1.0, help="facteur d'accélération (0 = sans attente)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=None, help="n premières requêtes seulement")
+    parser.add_argument("--sessions", action="store_true",
+                        help="rejouer les session_id d'origine (store en mémoire isolé)")
+    parser.add_argument("--reuse-cats", action="store_true",
+                        help="réutiliser les catégories enregistrées (mesure les agents seuls)")
+    parser.add_argument("--classifier-url", default=None)
+    parser.add_argument("--journal-out", default="", help="journaliser le rejeu dans ce fichier")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s", force=True)
+    entries = load_traffic(args.journal, args.limit)
+    if not entries:
+        print(f"Aucune requête dans {args.journal}")
+        return
+
+    from agents.dispatcher import Dispatcher
+    from services.session_store import open_session_store
+
+    dispatcher = Dispatcher(classifier_url=args.classifier_url, journal_path=args.journal_out,
+                            session_store=open_session_store("memory://"))
+    logging.getLogger().setLevel(logging.WARNING)  # Dispatcher configure DEBUG à l'import
+    report = replay(dispatcher, entries, args.speedup, args.concurrency,
+                    keep_sessions=args.sessions, reuse_cats=args.reuse_cats)
+    width = max(len(k) for k in report)
+    for key, value in report.items():
+        print(f"{key:<{width}} : {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,3 +5,46 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SNCF_API_KEY= os.getenv("SNCF_API_KEY")
+
+# Stockage des conversations : sqlite:///<fichier>, memory:// ou redis://...
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "sqlite:///sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 7 * 24 * 3600))
+
+# Serveur de classification partagé (services/classifier_server.py) ; vide = modèle local
+CLASSIFIER_URL = os.getenv("CLASSIFIER_URL")
+
+# Diagnostic mémoire (services/memory.py) : intervalle des relevés en secondes, vide = désactivé
+MEMORY_DIAGNOSTICS = float(os.getenv("MEMORY_DIAGNOSTICS") or 0)
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "0") == "1"
+MEMORY_DEBUG_PORT = int(os.getenv("MEMORY_DEBUG_PORT") or 0)
+# Plafonds d'entrées par cache, ex : "weather.forecasts=128,ui.geohash=20000"
+MEMORY_CAPS = {
+    name.strip(): int(cap)
+    for name, cap in (item.split("=") for item in os.getenv("MEMORY_CAPS", "").split(",") if "=" in item)
+}
+
+# Seuils de routage réglés par training/tune_thresholds.py (absent = 0.50 / 0.35)
+DISPATCHER_THRESHOLDS_PATH = os.getenv("DISPATCHER_THRESHOLDS", "checkpoints/dispatcher_thresholds.json")
+
+# Rechargement à chaud du checkpoint (services/hot_reload.py) : période en secondes, 0 = désactivé
+CHECKPOINT_WATCH_INTERVAL = float(os.getenv("CHECKPOINT_WATCH_INTERVAL") or 0)
+
+# Choix du modèle LLM (services/model_selector.py) : p95 max en secondes avant de passer
+# au modèle moins cher, et budget de tokens par session
+LLM_P95_BUDGET = float(os.getenv("LLM_P95_BUDGET") or 8.0)
+LLM_SESSION_TOKEN_BUDGET = int(os.getenv("LLM_SESSION_TOKEN_BUDGET") or 30_000)
+
+# Journal des requêtes (services/request_journal.py) : JSONL tournant, désactivé par défaut
+# (il contient le texte brut des utilisateurs). Un fichier par process : « {pid} » dans le
+# chemin est remplacé, ex. REQUEST_JOURNAL=logs/requests-{pid}.jsonl
+REQUEST_JOURNAL = os.getenv("REQUEST_JOURNAL", "")
+REQUEST_JOURNAL_MAX_MB = float(os.getenv("REQUEST_JOURNAL_MAX_MB") or 20)
+REQUEST_JOURNAL_BACKUPS = int(os.getenv("REQUEST_JOURNAL_BACKUPS") or 5)
+
+# Profilage CPU par requête (services/profiler.py) : part des requêtes profilées (0 = aucune)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE") or 0)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS") or 5)
+PROFILE_TORCH = os.getenv("PROFILE_TORCH", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+# En-tête HTTP « X-Profile: 1 » honoré par l'UI (n'importe quel client peut l'envoyer)
+PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "0") == "1"
@@ -1,10 +1,18 @@
+import argparse
+
 from agents.dispatcher import Dispatcher
+from services.memory import get_monitor, format_report
+from services.model_selector import get_selector
 
-def main():
-    dispatcher = Dispatcher()
+SESSION_ID = "cli"
+
+def interactive(dispatcher, profile: bool | None = None):
     print("Bienvenue dans l'assistant de mobilité urbaine !")
     print("Vous pouvez poser des questions sur les transports, la météo, le patrimoine ou les loisirs.")
     print("Pour réinitialiser la conversation, tapez 'reset'. Pour quitter, tapez 'exit' ou 'quit'.")
+    print("Tapez 'llm' pour les latences, tokens et choix de modèle.")
+    if get_monitor():
+        print("Diagnostic mémoire actif : tapez 'mem' pour un relevé.")
 
     while True:
         user_input = input("Vous : ")
@@ -12,12 +20,45 @@ def main():
             print("Au revoir !")
             break
         if user_input.lower() == "reset":
-            dispatcher = Dispatcher()  # Réinitialise l'historique de conversation de tous les agents
+            dispatcher.reset_session(SESSION_ID)  # Réinitialise l'historique de conversation de tous les agents
             print("Conversation réinitialisée.")
             continue
+        if user_input.lower() == "mem":
+            monitor = get_monitor()
+            print(format_report(monitor.snapshot()) if monitor
+                  else "Diagnostic mémoire désactivé (définir MEMORY_DIAGNOSTICS=<secondes>).")
+            continue
+
+        if user_input.lower() == "llm":
+            metrics = get_selector().metrics()
+            for model, m in metrics["models"].items():
+                p50, p95 = (f"{v:.2f}s" if v is not None else "—" for v in (m["p50_s"], m["p95_s"]))
+                print(f"  {model:<12} {m['calls']} appels, {m['tokens']} tokens, p50 {p50}, p95 {p95}")
+            for d in metrics["decisions"]:
+                print(f"  {d['requested']} → {d['model']} ({d['reason']}) : {d['count']}")
+            continue
 
-        response = dispatcher.route_request(user_input)
+        response = dispatcher.route_request(user_input, session_id=SESSION_ID, profile=profile)
         print("Assistant :", response)
 
+def main():
+    parser = argparse.ArgumentParser(description="Assistant de mobilité urbaine")
+    parser.add_argument("--batch", metavar="QUESTIONS.jsonl", help="traiter un fichier JSONL de questions")
+    parser.add_argument("-o", "--output", help="JSONL des réponses (défaut : <entrée>.answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="appels d'agents simultanés")
+    parser.add_argument("--batch-size", type=int, default=64, help="questions par forward SBERT")
+    parser.add_argument("--profile", action="store_true", help="profiler chaque question (logs/profiles/)")
+    args = parser.parse_args()
+
+    dispatcher = Dispatcher()
+    if args.batch:
+        from batch_runner import run_batch
+
+        report = run_batch(dispatcher, args.batch, args.output, args.concurrency, args.batch_size)
+        print(f"{report['answered']} réponses → {report['output']} "
+              f"({report['throughput_qps']} q/s, {report['errors']} erreurs)")
+    else:
+        interactive(dispatcher, profile=args.profile or None)
+
 if __name__ == "__main__":
     main()
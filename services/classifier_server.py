@@ -0,0 +1,148 @@
+"""
+Serveur de classification hors-process : une seule instance du modèle SBERT + tête,
+partagée par toutes les répliques Streamlit / CLI (Dispatcher(classifier_url=...)).
+
+Les requêtes concurrentes sont regroupées en micro-lots dynamiques : un lot part dès
+qu'il atteint `max_batch_size` textes ou que le plus ancien a attendu `max_wait_ms`.
+
+    python -m services.classifier_server --port 8765 --max-batch 32 --max-wait-ms 5
+
+API HTTP (JSON) :
+    GET  /health   → {"ok": true, "batches": ..., "mean_batch": ...}
+    GET  /labels   → {"label2id": {...}}
+    POST /classify {"texts": [...]} → {"probs": [[...], ...]}
+    POST /embed    {"texts": [...]} → {"embeddings": [[...], ...]}  (vecteurs normalisés)
+"""
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MicroBatcher:
+    """Regroupe les appels `submit(text)` venant de plusieurs threads en appels `predict_fn(list)`."""
+
+    def __init__(self, predict_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def predict(self, texts: list[str], timeout: float | None = None) -> list:
+        futures = [self.submit(t) for t in texts]
+        return [f.result(timeout=timeout) for f in futures]
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            end = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                left = end - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=left))
+                except queue.Empty:
+                    break
+            texts = [t for t, _ in batch]
+            try:
+                results = self.predict_fn(texts)
+            except Exception as e:
+                logging.exception("[ClassifierServer] échec du lot")
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+
+class ClassifierHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # beaucoup de clients se connectent en même temps
+
+
+def make_handler(batcher: MicroBatcher, label2id: dict, request_timeout: float = 10.0,
+                 embedder: MicroBatcher | None = None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive pour le client
+
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/labels":
+                self._send(200, {"label2id": label2id})
+            elif self.path == "/health":
+                mean = batcher.items / batcher.batches if batcher.batches else 0.0
+                self._send(200, {"ok": True, "batches": batcher.batches, "mean_batch": round(mean, 2)})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            routes = {"/classify": (batcher, "probs"), "/embed": (embedder, "embeddings")}
+            target, key = routes.get(self.path, (None, None))
+            if target is None:
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = json.loads(self.rfile.read(length))["texts"]
+                results = target.predict(texts, timeout=request_timeout)
+            except (ValueError, KeyError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {key: results})
+
+        def log_message(self, fmt, *args):
+            logging.debug("[ClassifierServer] " + fmt % args)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur de classification SBERT avec micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--model-path", default="checkpoints/dispatcher_sbert.pt")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    from agents.sbert_classifier import SbertClassifier, resolve_checkpoint
+
+    model = SbertClassifier(resolve_checkpoint(args.model_path))
+    batcher = MicroBatcher(model.predict_proba, args.max_batch, args.max_wait_ms)
+    embedder = MicroBatcher(model.embed, args.max_batch, args.max_wait_ms)
+    server = ClassifierHTTPServer((args.host, args.port),
+                                  make_handler(batcher, model.label2id, embedder=embedder))
+    logging.info(f"Serveur de classification sur http://{args.host}:{args.port} "
+                 f"(lot max {args.max_batch}, attente max {args.max_wait_ms} ms)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
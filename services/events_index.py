@@ -0,0 +1,375 @@
+"""
+Index local d'événements (exports open data type OpenAgenda) pour LoisirsAgent.
+
+SQLite + FTS5 : recherche plein texte (titre, description, mots-clés) filtrée par ville,
+dates et zone géographique, en quelques millisecondes et sans appel à gpt-4o. Sous le
+seuil de pertinence EVENTS_MIN_SCORE, la recherche ne renvoie rien et LoisirsAgent
+laisse répondre gpt-4o.
+
+Ingestion incrémentale : chaque événement porte une empreinte de son contenu ; un
+re-import du même export ne réécrit que les événements nouveaux ou modifiés.
+
+    python -m services.events_index ingest export_openagenda.json --source lille
+    python -m services.events_index ingest que-faire-a-paris.csv --source paris --prune
+    python -m services.events_index search "concert jazz" --city Lille
+"""
+import os
+import csv
+import re
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+DEFAULT_PATH = os.getenv("EVENTS_DB_PATH", "data/events.db")
+# Pertinence minimale (-bm25, titre x3, mots-clés x2, description x1) d'un résultat de recherche
+MIN_SCORE = float(os.getenv("EVENTS_MIN_SCORE", "2.0"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    rowid INTEGER PRIMARY KEY,
+    uid TEXT UNIQUE NOT NULL,
+    source TEXT,
+    title TEXT NOT NULL,
+    description TEXT,
+    keywords TEXT,
+    city TEXT,
+    address TEXT,
+    lat REAL,
+    lon REAL,
+    start_ts INTEGER,
+    end_ts INTEGER,
+    url TEXT,
+    content_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_dates ON events (end_ts, start_ts);
+CREATE INDEX IF NOT EXISTS events_city ON events (city COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS events_geo ON events (lat, lon);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    title, description, keywords, city,
+    content='events', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS events_ai AFTER INSERT ON events BEGIN
+    INSERT INTO events_fts (rowid, title, description, keywords, city)
+    VALUES (new.rowid, new.title, new.description, new.keywords, new.city);
+END;
+CREATE TRIGGER IF NOT EXISTS events_ad AFTER DELETE ON events BEGIN
+    INSERT INTO events_fts (events_fts, rowid, title, description, keywords, city)
+    VALUES ('delete', old.rowid, old.title, old.description, old.keywords, old.city);
+END;
+CREATE TRIGGER IF NOT EXISTS events_au AFTER UPDATE ON events BEGIN
+    INSERT INTO events_fts (events_fts, rowid, title, description, keywords, city)
+    VALUES ('delete', old.rowid, old.title, old.description, old.keywords, old.city);
+    INSERT INTO events_fts (rowid, title, description, keywords, city)
+    VALUES (new.rowid, new.title, new.description, new.keywords, new.city);
+END;
+"""
+
+# Noms de colonnes possibles dans les exports CSV (OpenAgenda, « Que faire à Paris », ...)
+_CSV_ALIASES = {
+    "uid":         ["uid", "id", "identifiant", "event id"],
+    "title":       ["title", "titre", "title_fr", "nom"],
+    "description": ["description", "description_fr", "chapeau", "résumé", "description longue"],
+    "keywords":    ["keywords", "mots clés", "mots-clés", "keywords_fr", "tags", "catégorie"],
+    "city":        ["city", "ville", "location_city", "commune"],
+    "address":     ["address", "adresse", "adresse du lieu", "location_address", "nom du lieu"],
+    "lat":         ["lat", "latitude", "location_latitude"],
+    "lon":         ["lon", "lng", "longitude", "location_longitude"],
+    "geo":         ["coordonnées géographiques", "geo", "location_coordinates"],
+    "start":       ["start", "date de début", "première date - début", "firstdate_begin", "date_start"],
+    "end":         ["end", "date de fin", "dernière date - fin", "lastdate_end", "date_end"],
+    "url":         ["url", "lien", "canonicalurl", "link"],
+}
+
+_DATE_FORMATS = ["%d/%m/%Y %H:%M", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+
+
+def _to_ts(value) -> int | None:
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+def _fr(value):
+    """Champs multilingues OpenAgenda : {"fr": "...", "en": "..."} → texte français."""
+    if isinstance(value, dict):
+        value = value.get("fr") or next(iter(value.values()), "")
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    return (value or "").strip() if isinstance(value, str) else value
+
+
+def _float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_openagenda(ev: dict) -> dict:
+    """Événement JSON OpenAgenda (API v2 / export JSON) → enregistrement de l'index."""
+    loc = ev.get("location") or {}
+    timings = ev.get("timings") or []
+    first = ev.get("firstTiming") or (timings[0] if timings else {})
+    last = ev.get("lastTiming") or (timings[-1] if timings else {})
+    return {
+        "uid": str(ev.get("uid") or ev.get("id")),
+        "title": _fr(ev.get("title")),
+        "description": _fr(ev.get("description")) or _fr(ev.get("longDescription")),
+        "keywords": _fr(ev.get("keywords")),
+        "city": loc.get("city"),
+        "address": loc.get("address"),
+        "lat": _float(loc.get("latitude")),
+        "lon": _float(loc.get("longitude")),
+        "start_ts": _to_ts(first.get("begin")),
+        "end_ts": _to_ts(last.get("end") or first.get("end")),
+        "url": ev.get("canonicalUrl") or ev.get("link"),
+    }
+
+
+def normalize_csv_row(row: dict) -> dict:
+    lowered = {k.strip().lower(): v for k, v in row.items() if k}
+
+    def pick(field):
+        for alias in _CSV_ALIASES[field]:
+            if lowered.get(alias) not in (None, ""):
+                return lowered[alias].strip()
+        return None
+
+    lat, lon = _float(pick("lat")), _float(pick("lon"))
+    if lat is None and pick("geo"):
+        parts = pick("geo").replace(";", ",").split(",")
+        if len(parts) == 2:
+            lat, lon = _float(parts[0]), _float(parts[1])
+    title = pick("title")
+    return {
+        "uid": pick("uid") or hashlib.sha1(f"{title}|{pick('start')}|{pick('city')}".encode("utf8")).hexdigest(),
+        "title": title,
+        "description": pick("description"),
+        "keywords": pick("keywords"),
+        "city": pick("city"),
+        "address": pick("address"),
+        "lat": lat,
+        "lon": lon,
+        "start_ts": _to_ts(pick("start")),
+        "end_ts": _to_ts(pick("end")) or _to_ts(pick("start")),
+        "url": pick("url"),
+    }
+
+
+def read_export(path: str):
+    """Itère les événements normalisés d'un export JSON (liste, {"events": [...]}, JSONL) ou CSV."""
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+            for row in csv.DictReader(f, dialect=dialect):
+                yield normalize_csv_row(row)
+        return
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield normalize_openagenda(json.loads(line))
+            return
+        data = json.load(f)
+    events = data.get("events", []) if isinstance(data, dict) else data
+    for ev in events:
+        yield normalize_openagenda(ev)
+
+
+def _content_hash(rec: dict) -> str:
+    payload = json.dumps({k: rec.get(k) for k in sorted(rec) if k != "uid"}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf8")).hexdigest()
+
+
+def _terms(text: str) -> list[str]:
+    terms = [t for t in "".join(c if c.isalnum() else " " for c in text.lower()).split()
+             if len(t) > 2 and t not in _STOPWORDS]
+    # pluriel simple : « concerts » doit trouver « concert » (recherche par préfixe)
+    return [t[:-1] if len(t) > 4 and t[-1] in "sx" else t for t in terms]
+
+
+def _fts_query(text: str, exclude: str | None = None) -> str:
+    """
+    Transforme une question en requête FTS5 : termes en AND (préfixes), alternatives
+    « ou » / virgules en OR. La colonne ville n'est jamais interrogée et les mots de
+    `exclude` (la ville déjà filtrée) sont retirés : le nom de la ville seul ne suffit plus.
+    """
+    skip = set(_terms(exclude or ""))
+    groups = []
+    for part in re.split(r"\bou\b|,", text.lower()):
+        terms = [t for t in _terms(part) if t not in skip]
+        if terms:
+            groups.append(" AND ".join(f'"{t}"*' for t in dict.fromkeys(terms)))
+    if not groups:
+        return ""
+    return "{title description keywords} : (" + " OR ".join(f"({g})" for g in groups) + ")"
+
+
+_STOPWORDS = {
+    "que", "quoi", "faire", "les", "des", "une", "pour", "dans", "avec", "sur", "est", "sont", "ont",
+    "quel", "quels", "quelle", "quelles", "moi", "nous", "vous", "ville", "proximité", "près", "chez",
+    "activités", "activité", "sortir", "sorties", "sortie", "idées", "idée", "cette", "ces", "aux",
+    "uniquement", "titres", "émojis", "lien", "fais", "pas", "phrases", "plaît", "plait", "week", "end",
+    "demain", "aujourd", "hui", "soir", "matin", "semaine", "prochain", "prochaine",
+    "cherche", "voudrais", "aimerais", "peux", "propose", "proposes", "conseille", "conseilles",
+}
+
+
+class EventsIndex:
+    def __init__(self, path: str = DEFAULT_PATH, min_score: float = MIN_SCORE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    # ----- ingestion -----
+    def ingest(self, records, source: str = "", prune: bool = False) -> dict:
+        """
+        Upsert incrémental : un événement dont l'empreinte n'a pas changé n'est pas réécrit.
+        prune=True supprime les événements de `source` absents de cet export.
+        """
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "deleted": 0}
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_uids (uid TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM seen_uids")
+            for rec in records:
+                if not rec.get("title") or not rec.get("uid"):
+                    stats["skipped"] += 1
+                    continue
+                rec = {**rec, "source": source}
+                h = _content_hash(rec)
+                self.conn.execute("INSERT OR IGNORE INTO seen_uids VALUES (?)", (rec["uid"],))
+                row = self.conn.execute("SELECT content_hash FROM events WHERE uid = ?", (rec["uid"],)).fetchone()
+                if row and row[0] == h:
+                    stats["unchanged"] += 1
+                    continue
+                cols = ["uid", "source", "title", "description", "keywords", "city", "address",
+                        "lat", "lon", "start_ts", "end_ts", "url"]
+                values = [rec.get(c) for c in cols] + [h]
+                if row:
+                    self.conn.execute(
+                        f"UPDATE events SET {', '.join(f'{c} = ?' for c in cols[1:])}, content_hash = ? WHERE uid = ?",
+                        values[1:] + [rec["uid"]],
+                    )
+                    stats["updated"] += 1
+                else:
+                    self.conn.execute(
+                        f"INSERT INTO events ({', '.join(cols)}, content_hash) VALUES ({', '.join('?' * (len(cols) + 1))})",
+                        values,
+                    )
+                    stats["inserted"] += 1
+            if prune:
+                cur = self.conn.execute(
+                    "DELETE FROM events WHERE source = ? AND uid NOT IN (SELECT uid FROM seen_uids)", (source,)
+                )
+                stats["deleted"] = cur.rowcount
+        return stats
+
+    # ----- recherche -----
+    def search(self, text: str = "", city: str | None = None, start_ts: int | None = None,
+               end_ts: int | None = None, near: tuple | None = None, limit: int = 10) -> list[dict]:
+        """
+        near = (lat, lon, rayon_km). Les événements sans date sont gardés ; ceux terminés
+        avant `start_ts` ou commençant après `end_ts` sont exclus.
+        """
+        where, params = [], []
+        if start_ts is not None:
+            where.append("(e.end_ts IS NULL OR e.end_ts >= ?)")
+            params.append(start_ts)
+        if end_ts is not None:
+            where.append("(e.start_ts IS NULL OR e.start_ts <= ?)")
+            params.append(end_ts)
+        if city:
+            where.append("e.city = ? COLLATE NOCASE")
+            params.append(city)
+        if near:
+            lat, lon, km = near
+            dlat = km / 111.0
+            dlon = km / (111.0 * max(0.1, math.cos(math.radians(lat))))
+            where.append("e.lat BETWEEN ? AND ? AND e.lon BETWEEN ? AND ?")
+            params += [lat - dlat, lat + dlat, lon - dlon, lon + dlon]
+
+        query = _fts_query(text, exclude=city)
+        if query:
+            # seuil de pertinence : sans lui, un seul mot commun suffirait à renvoyer un événement
+            sql = ("SELECT e.* FROM events_fts f JOIN events e ON e.rowid = f.rowid "
+                   "WHERE events_fts MATCH ? AND bm25(events_fts, 3.0, 1.0, 2.0, 0.0) <= ?" +
+                   "".join(f" AND {w}" for w in where) +
+                   " ORDER BY bm25(events_fts, 3.0, 1.0, 2.0, 0.0), e.start_ts LIMIT ?")
+            params = [query, -self.min_score] + params
+        else:
+            sql = ("SELECT e.* FROM events e" + (" WHERE " + " AND ".join(where) if where else "") +
+                   " ORDER BY e.start_ts IS NULL, e.start_ts LIMIT ?")
+        with self._lock:
+            rows = self.conn.execute(sql, params + [limit]).fetchall()
+        return [dict(r) for r in rows]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def open_events_index(path: str = DEFAULT_PATH) -> "EventsIndex | None":
+    """Index existant, ou None s'il n'a jamais été construit (l'agent reste alors 100 % LLM)."""
+    if not os.path.exists(path):
+        return None
+    return EventsIndex(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index local d'événements (SQLite FTS5)")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ing = sub.add_parser("ingest", help="importer un export OpenAgenda (JSON/JSONL) ou CSV")
+    p_ing.add_argument("paths", nargs="+")
+    p_ing.add_argument("--source", default="")
+    p_ing.add_argument("--prune", action="store_true", help="supprimer les événements disparus de la source")
+    p_s = sub.add_parser("search")
+    p_s.add_argument("text")
+    p_s.add_argument("--city")
+    p_s.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    index = EventsIndex(args.db)
+    if args.cmd == "ingest":
+        for path in args.paths:
+            t0 = time.perf_counter()
+            stats = index.ingest(read_export(path), source=args.source or os.path.basename(path), prune=args.prune)
+            logging.info(f"{path} : {stats} en {time.perf_counter() - t0:.2f}s ({len(index)} événements indexés)")
+    else:
+        t0 = time.perf_counter()
+        for ev in index.search(args.text, city=args.city, start_ts=int(time.time()), limit=args.limit):
+            print(f"- {ev['title']} ({ev['city'] or '?'}) {ev['url'] or ''}")
+        logging.info(f"Recherche en {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
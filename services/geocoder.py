@@ -0,0 +1,189 @@
+"""
+Géocodage inverse hors-ligne (lat/lon → ville) pour ui_app.py.
+
+- `OfflineReverseGeocoder` : k-d tree sur les centroïdes de villes (data/cities_fr.csv,
+  ou un export GeoNames « cities1000.txt » si GEONAMES_CITIES_PATH est défini).
+  Chaque ville a un rayon approximatif qui sert de « frontière » : au-delà, pas de réponse.
+- `GeohashCache` : cache par cellule geohash, pour que deux positions voisines
+  partagent la même entrée (au lieu de clés float exactes).
+- `ReverseGeocoder` : cache geohash → k-d tree → fallback distant (Google / OSM).
+"""
+import os
+import csv
+import math
+import time
+import threading
+from collections import OrderedDict
+
+EARTH_RADIUS_KM = 6371.0
+_DEFAULT_CITIES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cities_fr.csv")
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# =========================
+# Geohash
+# =========================
+def geohash_encode(lat: float, lon: float, precision: int = 6) -> str:
+    """Geohash standard ; précision 6 ≈ cellule de 1,2 km × 0,6 km."""
+    lat_rng, lon_rng = [-90.0, 90.0], [-180.0, 180.0]
+    out, bit, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        rng, val = (lon_rng, lon) if even else (lat_rng, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if val >= mid:
+            ch |= 1 << (4 - bit)
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            out.append(_GEOHASH_BASE32[ch])
+            bit, ch = 0, 0
+    return "".join(out)
+
+
+class GeohashCache:
+    """Cache LRU (+ TTL) indexé par cellule geohash, partagé entre sessions."""
+
+    def __init__(self, precision: int = 6, max_entries: int = 50_000, ttl: float = 7 * 24 * 3600):
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, lat: float, lon: float) -> str:
+        return geohash_encode(lat, lon, self.precision)
+
+    def get(self, lat: float, lon: float):
+        k = self.key(lat, lon)
+        with self._lock:
+            entry = self._data.get(k)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                self._data.pop(k, None)
+                self.misses += 1
+                return None
+            self._data.move_to_end(k)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, lat: float, lon: float, value):
+        k = self.key(lat, lon)
+        with self._lock:
+            self._data[k] = (value, time.time())
+            self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =========================
+# k-d tree hors-ligne
+# =========================
+def _to_xyz(lat: float, lon: float) -> tuple:
+    # coordonnées 3D sur la sphère unité : la distance euclidienne est monotone
+    # avec la distance orthodromique, et il n'y a pas de souci au méridien 180°
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class OfflineReverseGeocoder:
+    """Ville la plus proche par k-d tree (pur Python, quelques µs par requête)."""
+
+    def __init__(self, path: str | None = None):
+        path = path or os.getenv("GEONAMES_CITIES_PATH") or _DEFAULT_CITIES
+        self.cities = self._load(path)  # [(name, lat, lon, radius_km)]
+        points = [(_to_xyz(lat, lon), i) for i, (_, lat, lon, _) in enumerate(self.cities)]
+        self._root = self._build(points, 0)
+
+    @staticmethod
+    def _load(path: str) -> list:
+        cities = []
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                for row in csv.DictReader(f):
+                    cities.append((row["name"], float(row["lat"]), float(row["lon"]), float(row["radius_km"])))
+            else:
+                # format GeoNames : name=1, lat=4, lon=5, population=14 (séparateur tabulation)
+                for line in f:
+                    cols = line.rstrip("\n").split("\t")
+                    if len(cols) < 15:
+                        continue
+                    pop = int(cols[14] or 0)
+                    radius = min(10.0, max(1.5, math.sqrt(pop) / 150))
+                    cities.append((cols[1], float(cols[4]), float(cols[5]), radius))
+        return cities
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        return (points[mid], axis,
+                self._build(points[:mid], depth + 1),
+                self._build(points[mid + 1:], depth + 1))
+
+    def nearest(self, lat: float, lon: float):
+        """Renvoie (nom, distance_km, rayon_km) de la ville la plus proche, ou None."""
+        if self._root is None:
+            return None
+        target = _to_xyz(lat, lon)
+        best = [None, float("inf")]
+
+        def visit(node):
+            if node is None:
+                return
+            (xyz, idx), axis, left, right = node
+            d2 = sum((a - b) ** 2 for a, b in zip(xyz, target))
+            if d2 < best[1]:
+                best[0], best[1] = idx, d2
+            diff = target[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff < best[1]:
+                visit(far)
+
+        visit(self._root)
+        name, _, _, radius = self.cities[best[0]]
+        return name, _chord_to_km(math.sqrt(best[1])), radius
+
+    def reverse(self, lat: float, lon: float) -> str | None:
+        """Ville contenant le point (distance au centroïde ≤ rayon), sinon None."""
+        hit = self.nearest(lat, lon)
+        if hit and hit[1] <= hit[2]:
+            return hit[0]
+        return None
+
+
+# =========================
+# Façade : cache → hors-ligne → distant
+# =========================
+class ReverseGeocoder:
+    def __init__(self, offline: OfflineReverseGeocoder | None = None, cache: GeohashCache | None = None):
+        self.offline = offline or OfflineReverseGeocoder()
+        self.cache = cache or GeohashCache()
+
+    def reverse(self, lat: float, lon: float, fallback=None) -> str | None:
+        """
+        `fallback(lat, lon)` n'est appelé qu'en dernier recours (hors couverture locale) ;
+        son résultat est mis en cache pour toute la cellule geohash.
+        """
+        city = self.cache.get(lat, lon)
+        if city:
+            return city
+        city = self.offline.reverse(lat, lon)
+        if not city and fallback is not None:
+            city = fallback(lat, lon)
+        if city:
+            self.cache.put(lat, lon, city)
+        return city
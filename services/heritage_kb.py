@@ -0,0 +1,261 @@
+"""
+Base de connaissances patrimoine (notices Mérimée) pour CultureAgent.
+
+Chaque notice est découpée en passages courts, encodés avec le backbone SBERT déjà chargé
+par le Dispatcher (aucun second modèle), puis stockés sur disque :
+
+    data/heritage_kb/
+        meta.json      dimension, nombre de passages, checkpoint utilisé, empreinte du backbone
+        vectors.npy    embeddings normalisés (float16, ouverts en memmap)
+        kb.sqlite      notices (champs structurés) + texte des passages
+
+Construction (une fois, ou à chaque nouvel export Mérimée) :
+    python -m services.heritage_kb build merimee.csv
+    python -m services.heritage_kb query "Qui est l'architecte de l'opéra de Lille ?"
+
+Les vecteurs ne valent que pour le backbone qui les a produits : meta.json garde
+l'embedding d'une phrase témoin, et la base est refusée (None) si le modèle courant ne
+le reproduit pas — au démarrage comme après un rechargement à chaud du checkpoint.
+"""
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+DEFAULT_PATH = os.getenv("HERITAGE_KB_PATH", "data/heritage_kb")
+# Phrase témoin : son embedding identifie le backbone qui a encodé la base
+_PROBE = "Château de Versailles, monument historique classé, architecte Louis Le Vau"
+
+# Colonnes de l'export open data Mérimée (libellés POP ou codes courts)
+_ALIASES = {
+    "ref":         ["référence", "reference", "ref"],
+    "name":        ["appellation courante", "titre courant", "tico", "appl", "dénomination de l'édifice", "deno"],
+    "commune":     ["commune forme éditoriale", "commune forme index", "commune", "com", "wcom"],
+    "departement": ["département en lettres", "département", "departement", "dpt", "dpt_lettre"],
+    "siecle":      ["siècle de la campagne principale de construction", "siècle", "scle"],
+    "dates":       ["datation des campagnes principales de construction", "datation de l'édifice", "date", "datation"],
+    "architect":   ["auteur de l'édifice", "auteur", "autr"],
+    "protection":  ["date et typologie de la protection", "typologie de la protection", "dpro", "protection"],
+    "history":     ["historique", "hist"],
+    "description": ["description de l'édifice", "description", "desc"],
+}
+_FIELDS = list(_ALIASES)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS records ({", ".join(f"{f} TEXT" + (" PRIMARY KEY" if f == "ref" else "") for f in _FIELDS)});
+CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, ref TEXT NOT NULL, text TEXT NOT NULL);
+"""
+
+# Mots trop fréquents dans les appellations pour identifier un monument à eux seuls
+_GENERIC = {
+    "église", "eglise", "chapelle", "château", "chateau", "maison", "hôtel", "hotel", "abbaye",
+    "cathédrale", "pont", "ancien", "ancienne", "immeuble", "saint", "sainte", "notre", "dame",
+    "porte", "tour", "place", "fontaine", "moulin", "ferme", "croix", "manoir", "prieuré",
+}
+
+
+def read_merimee(path: str):
+    """Itère les notices d'un export CSV Mérimée (séparateur détecté automatiquement)."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(8192)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        for row in csv.DictReader(f, dialect=dialect):
+            lowered = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+            rec = {}
+            for field, aliases in _ALIASES.items():
+                rec[field] = next((lowered[a] for a in aliases if lowered.get(a)), "")
+            if rec["ref"] and rec["name"]:
+                yield rec
+
+
+def chunk_record(rec: dict, chunk_chars: int = 600) -> list[str]:
+    """Une fiche structurée + le texte libre découpé par phrases, préfixé du nom du monument."""
+    head = f"{rec['name']} ({rec['commune']})" if rec["commune"] else rec["name"]
+    facts = [head]
+    for label, field in (("Siècle", "siecle"), ("Datation", "dates"),
+                         ("Architecte", "architect"), ("Protection", "protection")):
+        if rec[field]:
+            facts.append(f"{label} : {rec[field]}")
+    chunks = [". ".join(facts)]
+
+    text = " ".join(t for t in (rec["history"], rec["description"]) if t)
+    current = ""
+    for sentence in re.split(r"(?<=[.!?;])\s+", text):
+        if current and len(current) + len(sentence) > chunk_chars:
+            chunks.append(f"{head} : {current.strip()}")
+            current = ""
+        current += " " + sentence
+    if current.strip():
+        chunks.append(f"{head} : {current.strip()}")
+    return chunks
+
+
+def _tokens(text: str) -> set[str]:
+    return {t for t in re.findall(r"[\wÀ-ÿ]+", text.lower()) if len(t) > 3}
+
+
+class HeritageKB:
+    def __init__(self, path: str, embed):
+        """`embed(list[str])` → vecteurs normalisés (SbertClassifier.embed / ClassifierClient.embed)."""
+        self.path = path
+        self.embed = embed
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.conn = sqlite3.connect(os.path.join(path, "kb.sqlite"), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build(records, embed, path: str = DEFAULT_PATH, batch_size: int = 64,
+              chunk_chars: int = 600, checkpoint: str = "") -> dict:
+        """Reconstruit l'index complet ; les embeddings sont écrits par lots dans un memmap."""
+        os.makedirs(path, exist_ok=True)
+        # meta.json retiré d'abord et réécrit en dernier : une construction interrompue laisse
+        # une base sans meta.json (ignorée par open_heritage_kb), jamais un mélange ancien/nouveau
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        db_path = os.path.join(path, "kb.tmp.sqlite")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        conn = sqlite3.connect(db_path)
+        conn.executescript(_SCHEMA)
+        n_records, texts = 0, []
+        with conn:
+            for rec in records:
+                conn.execute(f"INSERT OR REPLACE INTO records VALUES ({', '.join('?' * len(_FIELDS))})",
+                             [rec[f] for f in _FIELDS])
+                for chunk in chunk_record(rec, chunk_chars):
+                    conn.execute("INSERT INTO chunks (id, ref, text) VALUES (?, ?, ?)", (len(texts), rec["ref"], chunk))
+                    texts.append(chunk)
+                n_records += 1
+        conn.close()
+        if not texts:
+            raise ValueError("aucune notice exploitable dans l'export")
+
+        first = np.asarray(embed(texts[:batch_size]), dtype=np.float32)
+        tmp = os.path.join(path, "vectors.tmp.npy")
+        vectors = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float16, shape=(len(texts), first.shape[1]))
+        vectors[:len(first)] = first
+        for start in range(batch_size, len(texts), batch_size):
+            vectors[start:start + batch_size] = np.asarray(embed(texts[start:start + batch_size]), dtype=np.float32)
+        vectors.flush()
+        del vectors
+        os.replace(tmp, os.path.join(path, "vectors.npy"))
+        os.replace(db_path, os.path.join(path, "kb.sqlite"))
+
+        meta = {"dim": int(first.shape[1]), "n_chunks": len(texts), "n_records": n_records,
+                "checkpoint": checkpoint, "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "probe": [round(float(x), 6) for x in embed([_PROBE])[0]]}
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+        return meta
+
+    def matches(self, embed) -> bool:
+        """Vrai si `embed` est le backbone qui a encodé la base (embedding témoin identique)."""
+        probe = self.meta.get("probe")
+        if not probe:
+            return False  # base construite avant l'empreinte : pas de garantie
+        current = np.asarray(embed([_PROBE])[0], dtype=np.float32)
+        return current.shape[0] == len(probe) and float(current @ np.asarray(probe, dtype=np.float32)) >= 0.999
+
+    def search(self, query: str, k: int = 5, block: int = 16384) -> list[dict]:
+        """Top-k passages par similarité cosinus (produit scalaire par blocs, float32)."""
+        if len(self.vectors) == 0 or k <= 0:
+            return []
+        q = np.asarray(self.embed([query])[0], dtype=np.float32)
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), block):
+            scores[start:start + block] = self.vectors[start:start + block].astype(np.float32) @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        with self._lock:
+            rows = {r["id"]: r for r in self.conn.execute(
+                f"SELECT id, ref, text FROM chunks WHERE id IN ({', '.join('?' * len(top))})",
+                [int(i) for i in top]).fetchall()}
+        # id absent de kb.sqlite (vecteurs et base désynchronisés) : passage ignoré
+        return [{"ref": rows[int(i)]["ref"], "text": rows[int(i)]["text"], "score": float(scores[i])}
+                for i in top if int(i) in rows]
+
+    def record(self, ref: str) -> dict | None:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM records WHERE ref = ?", (ref,)).fetchone()
+        return dict(row) if row else None
+
+    def match_record(self, query: str, hits: list[dict], min_score: float = 0.5) -> dict | None:
+        """Notice du meilleur passage si la question nomme bien ce monument (mot distinctif commun)."""
+        if not hits or hits[0]["score"] < min_score:
+            return None
+        rec = self.record(hits[0]["ref"])
+        if rec is None:
+            return None
+        distinctive = _tokens(rec["name"]) - _GENERIC
+        return rec if distinctive & _tokens(query) else None
+
+
+def open_heritage_kb(embed, path: str = DEFAULT_PATH) -> "HeritageKB | None":
+    """Base existante, ou None si elle n'a pas été construite ou si le modèle n'est pas disponible."""
+    if embed is None or not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    try:
+        kb = HeritageKB(path, embed)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logging.warning(f"[HeritageKB] base {path} illisible ({e}) : désactivée")
+        return None
+    try:
+        ok = kb.matches(embed)
+    except Exception as e:
+        logging.warning(f"[HeritageKB] vérification du modèle impossible : {e}")
+        ok = False
+    if not ok:
+        logging.warning(f"[HeritageKB] base {path} encodée avec un autre modèle "
+                        f"(checkpoint {kb.meta.get('checkpoint') or 'inconnu'}) : désactivée, "
+                        "reconstruire avec python -m services.heritage_kb build ...")
+        return None
+    return kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Base de connaissances patrimoine (Mérimée)")
+    parser.add_argument("--kb", default=DEFAULT_PATH)
+    parser.add_argument("--model-path", default="checkpoints/dispatcher_sbert.pt")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_b = sub.add_parser("build", help="construire l'index depuis un export CSV Mérimée")
+    p_b.add_argument("csv")
+    p_b.add_argument("--batch-size", type=int, default=64)
+    p_b.add_argument("--chunk-chars", type=int, default=600)
+    p_q = sub.add_parser("query")
+    p_q.add_argument("text")
+    p_q.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    from agents.sbert_classifier import SbertClassifier, resolve_checkpoint
+
+    checkpoint = resolve_checkpoint(args.model_path)
+    model = SbertClassifier(checkpoint)
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        meta = HeritageKB.build(read_merimee(args.csv), model.embed, args.kb, args.batch_size,
+                                args.chunk_chars, checkpoint=checkpoint)
+        logging.info(f"{meta['n_records']} notices, {meta['n_chunks']} passages "
+                     f"en {time.perf_counter() - t0:.1f}s → {args.kb}")
+    else:
+        kb = HeritageKB(args.kb, model.embed)
+        for hit in kb.search(args.text, args.k):
+            print(f"[{hit['score']:.2f}] {hit['ref']} {hit['text'][:160]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Rechargement à chaud du checkpoint du dispatcher, sans redémarrer les process.
+
+Un thread surveille la version du checkpoint : (mtime, taille) du fichier local, ou le
+commit du dépôt Hugging Face si aucun fichier local n'existe (même priorité que
+`resolve_checkpoint`). Une nouvelle version est chargée en arrière-plan, validée sur un
+petit lot de val.jsonl, puis échangée d'un bloc par `Dispatcher.swap_classifier` :
+les requêtes en cours terminent sur l'ancien modèle, libéré dès qu'elles ont fini.
+
+    CHECKPOINT_WATCH_INTERVAL=60 streamlit run ui_app.py
+"""
+import os
+import gc
+import json
+import time
+import random
+import logging
+import threading
+
+
+def checkpoint_version(model_path: str, hf_repo_id: str, hf_filename: str) -> tuple:
+    if os.path.exists(model_path):
+        st = os.stat(model_path)
+        return ("local", model_path, st.st_mtime_ns, st.st_size)
+    from huggingface_hub import HfApi
+
+    info = HfApi().model_info(hf_repo_id, timeout=10)
+    return ("hf", hf_repo_id, hf_filename, info.sha)
+
+
+def fetch_checkpoint(version: tuple) -> str:
+    if version[0] == "local":
+        return version[1]
+    from huggingface_hub import hf_hub_download
+
+    _, repo_id, filename, sha = version
+    return hf_hub_download(repo_id=repo_id, filename=filename, revision=sha, repo_type="model")
+
+
+def validation_batch(path: str, size: int = 64, seed: int = 0) -> tuple[list[str], list[str]]:
+    """Échantillon fixe (même graine) de val.jsonl : ancien et nouveau modèle voient le même lot."""
+    if not os.path.exists(path):
+        return [], []
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    items = random.Random(seed).sample(items, min(size, len(items)))
+    return [it["text"] for it in items], [it["label"] for it in items]
+
+
+def batch_accuracy(classifier, texts: list[str], labels: list[str]) -> float:
+    probs = classifier.predict_proba(texts)
+    preds = [classifier.id2label[max(range(len(p)), key=p.__getitem__)] for p in probs]
+    return sum(p == g for p, g in zip(preds, labels)) / max(1, len(labels))
+
+
+class CheckpointWatcher:
+    def __init__(self, dispatcher, model_path: str, hf_repo_id: str, hf_filename: str,
+                 interval: float = 60, val_path: str = "training/val.jsonl", val_size: int = 64,
+                 min_accuracy: float = 0.6, max_drop: float = 0.05):
+        self.dispatcher = dispatcher
+        self.model_path = model_path
+        self.hf_repo_id = hf_repo_id
+        self.hf_filename = hf_filename
+        self.interval = interval
+        self.val_path = val_path
+        self.val_size = val_size
+        self.min_accuracy = min_accuracy
+        self.max_drop = max_drop
+        self.version = self._version()
+        self._pending = None     # version vue une fois : on attend qu'elle soit stable
+        self._rejected = set()   # versions refusées à la validation, pas retentées
+        self.reloads = 0
+        self._thread = threading.Thread(target=self._loop, name="checkpoint-watcher", daemon=True)
+        self._thread.start()
+
+    def _version(self):
+        try:
+            return checkpoint_version(self.model_path, self.hf_repo_id, self.hf_filename)
+        except Exception as e:
+            logging.warning(f"[HotReload] version du checkpoint indisponible : {e}")
+            return None
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            version = self._version()
+            if version is None or version == self.version or version in self._rejected:
+                continue
+            # fichier local en cours d'écriture : on recharge quand deux relevés concordent
+            if version[0] == "local" and version != self._pending:
+                self._pending = version
+                continue
+            try:
+                self.reload(version)
+            except Exception:
+                logging.exception(f"[HotReload] échec du rechargement de {version}")
+                self._rejected.add(version)
+
+    def reload(self, version: tuple) -> bool:
+        from agents.sbert_classifier import SbertClassifier
+
+        t0 = time.perf_counter()
+        candidate = SbertClassifier(fetch_checkpoint(version))
+        ok, reason = self.validate(candidate)
+        if not ok:
+            logging.warning(f"[HotReload] checkpoint {version} refusé : {reason}")
+            self._rejected.add(version)
+            del candidate
+            gc.collect()
+            return False
+        self.dispatcher.swap_classifier(candidate)
+        self.version, self._pending = version, None
+        self.reloads += 1
+        logging.info(f"[HotReload] nouveau checkpoint actif ({reason}) en {time.perf_counter() - t0:.1f}s")
+        return True
+
+    def validate(self, candidate) -> tuple[bool, str]:
+        """Labels routables + précision sur le lot de validation (et pas pire que le modèle actuel)."""
+        unknown = set(candidate.label2id) - set(self.dispatcher.agents)
+        if unknown:
+            return False, f"labels sans agent : {sorted(unknown)}"
+        texts, labels = validation_batch(self.val_path, self.val_size)
+        if not texts:
+            return True, "pas de lot de validation"
+        # ce passage sert aussi de préchauffage : le premier vrai message ne paie pas l'init
+        new_acc = batch_accuracy(candidate, texts, labels)
+        old_acc = batch_accuracy(self.dispatcher.classifier, texts, labels)
+        if new_acc < self.min_accuracy:
+            return False, f"précision {new_acc:.2f} < {self.min_accuracy:.2f}"
+        if new_acc < old_acc - self.max_drop:
+            return False, f"précision {new_acc:.2f} contre {old_acc:.2f} pour le modèle actuel"
+        return True, f"précision {new_acc:.2f} (actuel {old_acc:.2f})"
@@ -0,0 +1,349 @@
+"""
+Diagnostic mémoire des process longs (Streamlit, CLI, serveur) — désactivé par défaut.
+
+Chaque cache / store en mémoire s'enregistre dans `registry` avec un plafond optionnel
+d'entrées. Le moniteur (activé par MEMORY_DIAGNOSTICS=<secondes>) relève périodiquement :
+    - RSS du process,
+    - entrées et taille approximative de chaque cache, avec l'écart depuis le relevé précédent,
+    - les plus gros allocateurs tracemalloc et leur croissance (si MEMORY_TRACEMALLOC=1),
+et vide les caches qui dépassent leur plafond (les plus anciennes entrées d'abord).
+
+Lecture : commande `mem` de main.py, panneau « Mémoire » de la sidebar, ou endpoint
+HTTP (MEMORY_DEBUG_PORT) :
+    python -m services.memory --url http://127.0.0.1:8766
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def approx_sizeof(obj, sample: int = 64, _depth: int = 0, _seen=None) -> int:
+    """
+    Taille approximative (octets) d'un objet et de son contenu. Au-delà de `sample`
+    éléments, un conteneur est estimé à partir de ses premiers éléments.
+    """
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen or _depth > 6:
+        return 0
+    _seen.add(id(obj))
+    nbytes = getattr(obj, "nbytes", None)  # tableaux numpy, memmap exclus ci-dessous
+    if isinstance(nbytes, int) and not hasattr(obj, "filename"):
+        return nbytes + sys.getsizeof(obj)
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):  # tenseurs torch
+        return obj.element_size() * obj.nelement()
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.items())[:sample]
+        sub = sum(approx_sizeof(k, sample, _depth + 1, _seen) + approx_sizeof(v, sample, _depth + 1, _seen)
+                  for k, v in items)
+        return size + (sub * len(obj) // len(items) if items else 0)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        items = list(obj)[:sample]
+        sub = sum(approx_sizeof(v, sample, _depth + 1, _seen) for v in items)
+        return size + (sub * len(obj) // len(items) if items else 0)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return size + approx_sizeof(vars(obj), sample, _depth + 1, _seen)
+    return size
+
+
+def rss_bytes() -> int | None:
+    """RSS courant (Linux), sinon pic mémoire via resource."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:
+            return None
+
+
+@dataclass
+class _Tracked:
+    data: object                 # dict / OrderedDict / list mesuré (et vidé si plafond)
+    lock: object = None
+    cap: int | None = None       # nombre max d'entrées, None = pas de plafond
+    evict: object = None         # evict(n) spécifique, sinon retrait des plus anciennes clés
+    last_entries: int = 0
+    last_bytes: int = 0
+    evicted: int = 0
+
+
+class MemoryRegistry:
+    def __init__(self):
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self.caps = {}
+
+    def register(self, name: str, data, lock=None, cap: int | None = None, evict=None):
+        """Enregistre (ou remplace) un cache ; MEMORY_CAPS="nom=entrées,..." prime sur `cap`."""
+        with self._lock:
+            self._tracked[name] = _Tracked(data, lock, self.caps.get(name, cap), evict=evict)
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._tracked.pop(name, None)
+
+    def set_cap(self, name: str, cap: int | None):
+        self.caps[name] = cap
+        with self._lock:
+            if name in self._tracked:
+                self._tracked[name].cap = cap
+
+    @staticmethod
+    def _trim(t: _Tracked) -> int:
+        # les dict conservent l'ordre d'insertion : on retire les plus anciennes entrées
+        excess = len(t.data) - t.cap
+        if excess <= 0:
+            return 0
+        if t.evict is not None:
+            t.evict(excess)
+        elif isinstance(t.data, OrderedDict):
+            for _ in range(excess):
+                t.data.popitem(last=False)
+        elif isinstance(t.data, dict):
+            for key in list(t.data)[:excess]:
+                del t.data[key]
+        elif isinstance(t.data, list):
+            del t.data[:excess]
+        return excess
+
+    def enforce_caps(self) -> dict:
+        evicted = {}
+        with self._lock:
+            tracked = list(self._tracked.items())
+        for name, t in tracked:
+            if t.cap is None:
+                continue
+            if t.lock is not None:
+                with t.lock:
+                    n = self._trim(t)
+            else:
+                n = self._trim(t)
+            if n:
+                t.evicted += n
+                evicted[name] = n
+                logging.warning(f"[Memory] {name} : {n} entrées évincées (plafond {t.cap})")
+        return evicted
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            tracked = list(self._tracked.items())
+        rows = []
+        for name, t in tracked:
+            try:
+                if t.lock is not None:
+                    with t.lock:
+                        entries, nbytes = len(t.data), approx_sizeof(t.data)
+                else:
+                    entries, nbytes = len(t.data), approx_sizeof(t.data)
+            except RuntimeError:
+                # cache sans verrou modifié pendant la mesure : on garde le relevé précédent
+                entries, nbytes = t.last_entries, t.last_bytes
+            rows.append({
+                "name": name, "entries": entries, "bytes": nbytes,
+                "delta_entries": entries - t.last_entries, "delta_bytes": nbytes - t.last_bytes,
+                "cap": t.cap, "evicted": t.evicted,
+            })
+            t.last_entries, t.last_bytes = entries, nbytes
+        return sorted(rows, key=lambda r: -r["bytes"])
+
+
+registry = MemoryRegistry()
+
+
+class MemoryMonitor:
+    def __init__(self, interval: float = 60, trace: bool = False, frames: int = 10, top_n: int = 10):
+        self.interval = interval
+        self.top_n = top_n
+        self.last_report = None
+        self._prev_snapshot = None
+        self._prev_rss = None
+        self._lock = threading.Lock()
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._thread = threading.Thread(target=self._loop, name="memory-monitor", daemon=True)
+        self._thread.start()
+
+    def _top_allocators(self) -> tuple[list, list]:
+        if not tracemalloc.is_tracing():
+            return [], []
+        snap = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        top = [{"where": str(s.traceback[0]), "bytes": s.size, "count": s.count}
+               for s in snap.statistics("lineno")[:self.top_n]]
+        growth = []
+        if self._prev_snapshot is not None:
+            growth = [{"where": str(s.traceback[0]), "delta_bytes": s.size_diff, "bytes": s.size}
+                      for s in snap.compare_to(self._prev_snapshot, "lineno")[:self.top_n] if s.size_diff > 0]
+        self._prev_snapshot = snap
+        return top, growth
+
+    def snapshot(self) -> dict:
+        """Relevé complet ; applique aussi les plafonds."""
+        with self._lock:
+            evicted = registry.enforce_caps()
+            rss = rss_bytes()
+            top, growth = self._top_allocators()
+            report = {
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "rss": rss,
+                "delta_rss": rss - self._prev_rss if rss is not None and self._prev_rss is not None else None,
+                "caches": registry.stats(),
+                "evicted": evicted,
+                "top_allocators": top,
+                "growth": growth,
+            }
+            self._prev_rss = rss
+            self.last_report = report
+            return report
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                logging.info("[Memory]\n" + format_report(self.snapshot()))
+            except Exception:
+                logging.exception("[Memory] échec du relevé")
+
+
+def _mb(n) -> str:
+    return "?" if n is None else f"{n / 1e6:.1f} Mo"
+
+
+def format_report(report: dict) -> str:
+    lines = [f"RSS {_mb(report['rss'])}" + (f" ({report['delta_rss'] / 1e6:+.1f} Mo)" if report.get("delta_rss") else "")]
+    for c in report["caches"]:
+        cap = f"/{c['cap']}" if c["cap"] else ""
+        lines.append(f"  {c['name']:<24} {c['entries']:>7}{cap} entrées  {_mb(c['bytes']):>10}"
+                     f"  ({c['delta_entries']:+d}, {c['delta_bytes'] / 1e3:+.0f} ko)")
+    if report["top_allocators"]:
+        lines.append("Top allocateurs :")
+        lines += [f"  {a['bytes'] / 1e3:>9.0f} ko  {a['where']}" for a in report["top_allocators"]]
+    if report["growth"]:
+        lines.append("Croissance depuis le relevé précédent :")
+        lines += [f"  {g['delta_bytes'] / 1e3:>+9.0f} ko  {g['where']}" for g in report["growth"]]
+    return "\n".join(lines)
+
+
+# Autres relevés servis par le même endpoint (ex : /debug/llm de services/model_selector.py)
+_debug_routes = {}
+
+
+def register_debug_route(path: str, fn):
+    """`fn()` doit renvoyer un objet sérialisable en JSON."""
+    _debug_routes[path] = fn
+
+
+def serve_debug(monitor: MemoryMonitor, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """GET /debug/memory → dernier relevé (nouveau relevé avec ?refresh=1) ; routes enregistrées en plus."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            route = self.path.split("?")[0]
+            if route in _debug_routes:
+                report = _debug_routes[route]()
+            elif route == "/debug/memory":
+                report = monitor.snapshot() if "refresh=1" in self.path or monitor.last_report is None \
+                    else monitor.last_report
+            else:
+                self.send_error(404)
+                return
+            body = json.dumps(report, ensure_ascii=False).encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logging.debug("[Memory] " + fmt % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="memory-debug", daemon=True).start()
+    logging.info(f"[Memory] endpoint de diagnostic sur http://{host}:{port}/debug/memory")
+    return server
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def start_monitor_from_env() -> MemoryMonitor | None:
+    """Démarre le moniteur une seule fois par process si MEMORY_DIAGNOSTICS est défini."""
+    global _monitor
+    from config import MEMORY_DIAGNOSTICS, MEMORY_TRACEMALLOC, MEMORY_DEBUG_PORT, MEMORY_CAPS
+
+    for name, cap in MEMORY_CAPS.items():
+        registry.set_cap(name, cap)
+    if not MEMORY_DIAGNOSTICS:
+        # plafonds sans diagnostic : ils doivent quand même être appliqués
+        if MEMORY_CAPS:
+            _start_cap_enforcer()
+        return None
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = MemoryMonitor(interval=MEMORY_DIAGNOSTICS, trace=MEMORY_TRACEMALLOC)
+            if MEMORY_DEBUG_PORT:
+                try:
+                    serve_debug(_monitor, MEMORY_DEBUG_PORT)
+                except OSError as e:
+                    # plusieurs process sur la même machine : seul le premier expose l'endpoint
+                    logging.warning(f"[Memory] endpoint indisponible sur le port {MEMORY_DEBUG_PORT} : {e}")
+    return _monitor
+
+
+_enforcer = None
+
+
+def _start_cap_enforcer(interval: float = 30.0):
+    """Thread qui applique les plafonds (le moniteur le fait déjà à chaque relevé)."""
+    global _enforcer
+    with _monitor_lock:
+        if _enforcer is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    registry.enforce_caps()
+                except Exception:
+                    logging.exception("[Memory] échec de l'application des plafonds")
+
+        _enforcer = threading.Thread(target=loop, name="memory-caps", daemon=True)
+        _enforcer.start()
+
+
+def get_monitor() -> MemoryMonitor | None:
+    return _monitor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lire le diagnostic mémoire d'un process en cours")
+    parser.add_argument("--url", default="http://127.0.0.1:8766")
+    parser.add_argument("--refresh", action="store_true", help="forcer un nouveau relevé")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    from urllib.request import urlopen
+
+    with urlopen(f"{args.url.rstrip('/')}/debug/memory{'?refresh=1' if args.refresh else ''}", timeout=10) as resp:
+        report = json.load(resp)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
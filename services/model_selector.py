@@ -0,0 +1,173 @@
+"""
+Choix du modèle LLM par requête, partagé par tous les agents (via `chat_completion`).
+
+Les modèles sont rangés du meilleur au moins cher (TIERS). Le modèle demandé par
+l'agent est gardé, sauf si l'un de ces cas s'applique (motif enregistré) :
+    deadline : le temps restant de la requête est inférieur à la latence habituelle du modèle
+    budget   : la session a dépassé son budget de tokens
+    p95      : la latence p95 glissante du modèle dépasse le budget (heures de pointe)
+    simple   : question courte sans demande d'explication
+Les mesures sont glissantes dans le temps (window_s) : quand la charge retombe, les
+échantillons lents expirent et le modèle demandé revient de lui-même.
+
+Chaque décision est ajoutée à la requête en cours (`request_scope`) et agrégée dans
+`metrics()`, lisible sur l'endpoint de diagnostic (/debug/llm, voir services/memory.py).
+"""
+import re
+import time
+import threading
+import contextvars
+from collections import deque, Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from services.resilience import remaining
+
+TIERS = ["gpt-4o", "gpt-4o-mini"]
+
+_session = contextvars.ContextVar("llm_session", default=None)
+_decisions = contextvars.ContextVar("llm_decisions", default=None)
+
+# Demandes qui méritent le gros modèle même formulées en peu de mots
+_COMPLEX = re.compile(r"\b(pourquoi|explique|expliquer|compare|comparer|analyse|histoire|détaille|raconte)\b",
+                      re.IGNORECASE)
+
+
+@contextmanager
+def request_scope(session_id=None):
+    """Rattache les appels LLM à une session ; renvoie la liste des décisions de la requête."""
+    decisions = _decisions.get()
+    tokens = [_session.set(session_id)]
+    if decisions is None:  # scopes imbriqués (batch → Dispatcher) : même liste
+        decisions = []
+        tokens.append(_decisions.set(decisions))
+    try:
+        yield decisions
+    finally:
+        for var, token in zip((_session, _decisions), tokens):
+            var.reset(token)
+
+
+@dataclass
+class Decision:
+    requested: str
+    model: str
+    reason: str
+
+
+class ModelSelector:
+    def __init__(self, tiers=TIERS, window_s: float = 300, min_samples: int = 20,
+                 p95_budget_s: float = 8.0, session_token_budget: int = 30_000,
+                 short_chars: int = 80, max_sessions: int = 10_000):
+        self.tiers = list(tiers)
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self.p95_budget_s = p95_budget_s
+        self.session_token_budget = session_token_budget
+        self.short_chars = short_chars
+        self.max_sessions = max_sessions
+        self._latency = {m: deque() for m in self.tiers}       # (horodatage, secondes)
+        self._tokens = Counter()
+        self._calls = Counter()
+        self._session_tokens = OrderedDict()
+        self._decisions = Counter()
+        self._recent = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    # ----- mesures -----
+    def _window(self, model: str) -> list[float]:
+        samples = self._latency.setdefault(model, deque())
+        cutoff = time.time() - self.window_s
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return sorted(s for _, s in samples)
+
+    def percentile(self, model: str, q: float) -> float | None:
+        with self._lock:
+            values = self._window(model)
+        if len(values) < self.min_samples:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def record(self, model: str, latency_s: float, usage=None):
+        total = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+        session_id = _session.get()
+        with self._lock:
+            self._latency.setdefault(model, deque()).append((time.time(), latency_s))
+            self._calls[model] += 1
+            self._tokens[model] += total
+            if session_id is not None:
+                self._session_tokens[session_id] = self._session_tokens.get(session_id, 0) + total
+                self._session_tokens.move_to_end(session_id)
+                while len(self._session_tokens) > self.max_sessions:
+                    self._session_tokens.popitem(last=False)
+
+    # ----- décision -----
+    @staticmethod
+    def _last_user_text(messages) -> str:
+        for msg in reversed(messages or []):
+            if msg.get("role") == "user":
+                return msg.get("content") or ""
+        return ""
+
+    def _reason(self, model: str, messages) -> str | None:
+        left = remaining()
+        p50 = self.percentile(model, 0.5)
+        if left is not None and p50 is not None and left < p50:
+            return "deadline"
+        session_id = _session.get()
+        if session_id is not None and self._session_tokens.get(session_id, 0) >= self.session_token_budget:
+            return "budget"
+        p95 = self.percentile(model, 0.95)
+        if p95 is not None and p95 > self.p95_budget_s:
+            return "p95"
+        text = self._last_user_text(messages)
+        if len(text) <= self.short_chars and not _COMPLEX.search(text):
+            return "simple"
+        return None
+
+    def choose(self, requested: str, messages) -> Decision:
+        if requested not in self.tiers or requested == self.tiers[-1]:
+            decision = Decision(requested, requested, "demandé")
+        else:
+            reason = self._reason(requested, messages)
+            cheaper = self.tiers[self.tiers.index(requested) + 1]
+            decision = Decision(requested, cheaper, reason) if reason else Decision(requested, requested, "demandé")
+        with self._lock:
+            self._decisions[(decision.requested, decision.model, decision.reason)] += 1
+            self._recent.append({"time": time.strftime("%H:%M:%S"), "session": _session.get(), **vars(decision)})
+        current = _decisions.get()
+        if current is not None:
+            current.append(vars(decision))
+        return decision
+
+    def metrics(self) -> dict:
+        models = {}
+        for model in set(self._calls) | set(self.tiers):
+            models[model] = {
+                "calls": self._calls[model],
+                "tokens": self._tokens[model],
+                "p50_s": self.percentile(model, 0.5),
+                "p95_s": self.percentile(model, 0.95),
+            }
+        with self._lock:
+            decisions = [{"requested": r, "model": m, "reason": why, "count": n}
+                         for (r, m, why), n in self._decisions.most_common()]
+            recent = list(self._recent)
+        return {"models": models, "decisions": decisions, "recent": recent}
+
+
+_selector = None
+_selector_lock = threading.Lock()
+
+
+def get_selector() -> ModelSelector:
+    global _selector
+    with _selector_lock:
+        if _selector is None:
+            from config import LLM_P95_BUDGET, LLM_SESSION_TOKEN_BUDGET
+            from services.memory import register_debug_route
+
+            _selector = ModelSelector(p95_budget_s=LLM_P95_BUDGET, session_token_budget=LLM_SESSION_TOKEN_BUDGET)
+            register_debug_route("/debug/llm", _selector.metrics)
+    return _selector
@@ -0,0 +1,118 @@
+"""
+Rafraîchissement en arrière-plan des panneaux « infos locales » (météo, loisirs).
+
+`RefreshScheduler.get()` ne bloque jamais : il renvoie la valeur en cache (même un peu
+périmée, stale-while-revalidate) ou None, et planifie le calcul sur un pool de threads.
+Une boucle de fond recalcule les clés populaires juste avant l'expiration du TTL, pour
+que le rendu de la page n'attende jamais Open-Meteo ou gpt-4o.
+"""
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from services.resilience import deadline
+
+
+@dataclass
+class _Entry:
+    value: object = None
+    fetched_at: float = 0.0
+    last_access: float = 0.0
+    hits: int = 0
+
+
+class RefreshScheduler:
+    def __init__(self, ttl: float = 600, refresh_ahead: float = 60, max_workers: int = 4,
+                 popular_min_hits: int = 2, job_timeout: float = 30, tick: float = 10):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.popular_min_hits = popular_min_hits
+        self.job_timeout = job_timeout
+        self.tick = tick
+        self._loaders = {}
+        self._entries = {}
+        self._in_flight = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._thread = threading.Thread(target=self._loop, name="prefetch-loop", daemon=True)
+        self._thread.start()
+
+    def register(self, kind: str, loader):
+        """`loader(key)` calcule la valeur du panneau `kind` pour la clé (ex : une ville)."""
+        self._loaders[kind] = loader
+
+    def get(self, kind: str, key: str):
+        """Renvoie la valeur disponible (éventuellement périmée) ou None, sans jamais attendre."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault((kind, key), _Entry())
+            entry.hits += 1
+            entry.last_access = now
+            value, age = entry.value, now - entry.fetched_at
+        if value is None or age >= self.ttl - self.refresh_ahead:
+            self.schedule(kind, key)
+        return value
+
+    def peek(self, kind: str, key: str):
+        """Valeur en cache sans compter d'accès ni planifier de calcul."""
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            return entry.value if entry else None
+
+    def pending(self, kind: str, key: str) -> bool:
+        with self._lock:
+            return (kind, key) in self._in_flight
+
+    def failed(self, kind: str, key: str) -> bool:
+        """True si le dernier calcul a échoué (remis à False au prochain succès)."""
+        with self._lock:
+            return (kind, key) in self._failed
+
+    def schedule(self, kind: str, key: str):
+        with self._lock:
+            if (kind, key) in self._in_flight:
+                return
+            self._in_flight.add((kind, key))
+        self._pool.submit(self._run, kind, key)
+
+    def _run(self, kind, key):
+        try:
+            with deadline(self.job_timeout):
+                value = self._loaders[kind](key)
+            with self._lock:
+                entry = self._entries.setdefault((kind, key), _Entry())
+                entry.value, entry.fetched_at = value, time.time()
+                self._failed.discard((kind, key))
+        except Exception:
+            logging.exception(f"[Prefetch] échec du calcul {kind}/{key}")
+            with self._lock:
+                self._failed.add((kind, key))
+        finally:
+            with self._lock:
+                self._in_flight.discard((kind, key))
+
+    def _loop(self):
+        while True:
+            time.sleep(self.tick)
+            now = time.time()
+            to_refresh = []
+            with self._lock:
+                for k, entry in list(self._entries.items()):
+                    idle = now - entry.last_access
+                    if idle > 2 * self.ttl:
+                        # plus personne ne regarde cette ville : on oublie
+                        del self._entries[k]
+                        continue
+                    popular = entry.hits >= self.popular_min_hits and idle < self.ttl
+                    if popular and entry.value is not None and \
+                            now - entry.fetched_at >= self.ttl - self.refresh_ahead:
+                        to_refresh.append(k)
+                        entry.hits = 0  # la popularité se re-gagne à chaque fenêtre
+            for kind, key in to_refresh:
+                self.schedule(kind, key)
+
+    def __len__(self):
+        return len(self._entries)
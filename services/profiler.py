@@ -0,0 +1,96 @@
+"""
+Profilage CPU d'une requête du Dispatcher, activable sans redéploiement.
+
+Un thread échantillonne toutes les PROFILE_INTERVAL_MS la pile Python du thread qui
+traite la requête (`sys._current_frames`) : coût nul hors requêtes profilées, et
+quelques % pendant. Avec PROFILE_TORCH=1, les opérateurs torch sont profilés en plus
+(`torch.profiler`, une requête à la fois car il est global au process).
+
+Sortie au format « collapsed stacks » (flamegraph.pl, speedscope, inferno) dans
+PROFILE_DIR, un fichier par requête ; chaque pile commence par l'identifiant de la
+requête et ses catégories, pour pouvoir concaténer plusieurs fichiers :
+    req:3f2a9c01b7de;cats:transport;route_request (agents/dispatcher.py:312);... 17
+
+Activation : `route_request(..., profile=True)`, `python main.py --profile`, en-tête
+HTTP `X-Profile: 1` sur l'UI (si PROFILE_ALLOW_HEADER=1), ou tirage aléatoire
+PROFILE_SAMPLE_RATE=0.01.
+"""
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+
+_torch_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    parts = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    def __init__(self, interval: float = 0.005, torch_ops: bool = False):
+        self.interval = interval
+        self.samples = Counter()
+        self.n_samples = 0
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._torch = None
+        if torch_ops and "torch" in sys.modules and _torch_lock.acquire(blocking=False):
+            import torch
+
+            self._torch = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], with_stack=True)
+            self._torch.__enter__()
+        self.t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None or self._stop.is_set():  # pas d'échantillon dans stop() lui-même
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+            self.n_samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.t0
+        if self._torch is not None:
+            try:
+                self._torch.__exit__(None, None, None)
+            finally:
+                _torch_lock.release()
+
+    def write(self, out_dir: str, request_id: str, categories: list[str] | None) -> str:
+        os.makedirs(out_dir, exist_ok=True)
+        prefix = f"req:{request_id};cats:{'+'.join(categories or []) or 'aucune'}"
+        path = os.path.join(out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{prefix};{stack} {count}\n")
+        if self._torch is not None:
+            # piles Python + opérateurs torch, temps CPU propre en µs
+            self._torch.export_stacks(path.replace(".collapsed", ".torch.collapsed"), "self_cpu_time_total")
+        logging.info(f"[Profiler] requête {request_id} : {self.n_samples} échantillons "
+                     f"sur {self.elapsed * 1000:.0f} ms → {path}")
+        return path
+
+
+def start_profiler(force: bool | None = None) -> RequestProfiler | None:
+    """force=True/False : choix explicite ; None : tirage selon PROFILE_SAMPLE_RATE."""
+    from config import PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_TORCH
+
+    enabled = force if force is not None else (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+    if not enabled:
+        return None
+    return RequestProfiler(interval=PROFILE_INTERVAL_MS / 1000, torch_ops=PROFILE_TORCH)
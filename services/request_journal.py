@@ -0,0 +1,120 @@
+"""
+Journal des requêtes du Dispatcher : une ligne JSONL par requête (texte, catégories,
+score, latence par agent, issue), écrite par un thread dédié.
+
+Le chemin chaud ne fait qu'un `put_nowait` dans une file bornée : si le disque ne suit
+pas, les entrées en trop sont comptées (`dropped`) plutôt que de ralentir la réponse.
+Rotation par taille : requests.jsonl → requests.jsonl.1 → ... → requests.jsonl.<backups>.
+Opt-in (REQUEST_JOURNAL) et un fichier par process : plusieurs répliques ne doivent pas
+faire tourner le même fichier.
+
+Relu par benchmarks/replay_requests.py (rejeu) et training/tune_thresholds.py (--logged).
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+_STOP = object()
+
+
+def journal_files(path: str) -> list[str]:
+    """Fichiers du journal du plus ancien au plus récent (rotations comprises)."""
+    rotated = []
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        rotated.append(f"{path}.{n}")
+        n += 1
+    return list(reversed(rotated)) + ([path] if os.path.exists(path) else [])
+
+
+def read_journal(path: str):
+    for file in journal_files(path):
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # dernière ligne tronquée (arrêt brutal)
+
+
+class RequestJournal:
+    def __init__(self, path: str, max_bytes: int = 20_000_000, backups: int = 5,
+                 queue_size: int = 10_000, batch: int = 256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch = batch
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="request-journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, entry: dict):
+        """Non bloquant ; l'horodatage est ajouté ici pour refléter l'instant de la requête."""
+        entry.setdefault("ts", time.time())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _rotate(self):
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _run(self):
+        f = open(self.path, "a", encoding="utf-8")
+        stop = False
+        while not stop:
+            items = [self._queue.get()]
+            # on vide ce qui est déjà en file : une écriture + un flush par lot
+            while len(items) < self.batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in items:
+                stop = True
+                items = [it for it in items if it is not _STOP]
+            try:
+                f.write("".join(json.dumps(it, ensure_ascii=False, default=str) + "\n" for it in items))
+                f.flush()
+                self.written += len(items)
+                if self.backups and f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+            except OSError as e:
+                self.dropped += len(items)
+                logging.warning(f"[Journal] écriture impossible dans {self.path} : {e}")
+        f.close()
+
+
+def open_journal(path: str | None = None) -> RequestJournal | None:
+    """
+    Chemin vide : journal désactivé. Par défaut REQUEST_JOURNAL (vide, donc désactivé).
+    « {pid} » dans le chemin est remplacé par le pid : la rotation (os.replace) n'est pas
+    sûre si plusieurs process écrivent le même fichier.
+    """
+    from config import REQUEST_JOURNAL, REQUEST_JOURNAL_MAX_MB, REQUEST_JOURNAL_BACKUPS
+
+    path = REQUEST_JOURNAL if path is None else path
+    if not path:
+        return None
+    path = path.replace("{pid}", str(os.getpid()))
+    return RequestJournal(path, max_bytes=int(REQUEST_JOURNAL_MAX_MB * 1e6), backups=REQUEST_JOURNAL_BACKUPS)
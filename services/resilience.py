@@ -0,0 +1,297 @@
+"""
+Couche de résilience commune aux appels externes (OpenAI, Google Maps, Open-Meteo, ...).
+
+Par fournisseur :
+  - un limiteur de débit (token bucket),
+  - un disjoncteur (circuit breaker) qui échoue tout de suite quand le taux d'erreurs
+    ou d'appels lents dépasse un seuil, puis retente un appel « sonde » après un délai,
+  - un timeout par appel, borné par la deadline de la requête en cours.
+
+La deadline est portée par un ContextVar : `with deadline(20): ...` dans le Dispatcher,
+et chaque appel en aval hérite du temps restant. Les GET idempotents peuvent être
+« hedgés » (deuxième requête lancée si la première traîne).
+"""
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class ResilienceError(RuntimeError):
+    """Erreur levée par la couche de résilience elle-même (et non par le fournisseur)."""
+
+
+class DeadlineExceeded(ResilienceError):
+    pass
+
+
+class CircuitOpenError(ResilienceError):
+    pass
+
+
+class RateLimitedError(ResilienceError):
+    pass
+
+
+# =========================
+# Deadline de requête
+# =========================
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """Fixe une deadline (jamais plus tardive qu'une deadline englobante)."""
+    if seconds is None:
+        yield
+        return
+    new = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default: float | None = None) -> float | None:
+    """Temps restant avant la deadline courante (ou `default` s'il n'y en a pas)."""
+    d = _deadline.get()
+    if d is None:
+        return default
+    return d - time.monotonic()
+
+
+def bind_context(fn):
+    """Enveloppe `fn` pour qu'elle s'exécute dans le contexte courant (deadline comprise) depuis un autre thread."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+# =========================
+# Token bucket
+# =========================
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """Prend un jeton, en attendant au plus `timeout` secondes."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_for = (1 - self._tokens) / self.rate
+            if end is not None and time.monotonic() + wait_for > end:
+                return False
+            time.sleep(wait_for)
+
+
+# =========================
+# Circuit breaker
+# =========================
+class CircuitBreaker:
+    """
+    closed → open quand, sur les `window` derniers appels, la part d'échecs (ou d'appels
+    plus lents que `slow_call_s`) dépasse `failure_rate` ; open → half-open après
+    `reset_timeout` ; un appel sonde réussi referme le circuit.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, slow_call_s: float = 8.0,
+                 window: int = 20, min_calls: int = 5, reset_timeout: float = 30.0):
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._results = deque(maxlen=window)
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = "half_open"
+            self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self):
+        """Rend la sonde half-open quand l'appel n'a finalement pas eu lieu."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, ok: bool, latency: float):
+        bad = (not ok) or latency > self.slow_call_s
+        with self._lock:
+            if self._state == "half_open":
+                if bad:
+                    self._trip()
+                else:
+                    self._state = "closed"
+                    self._results.clear()
+                return
+            self._results.append(bad)
+            if len(self._results) >= self.min_calls and \
+                    sum(self._results) / len(self._results) >= self.failure_rate:
+                self._trip()
+
+    def _trip(self):
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._results.clear()
+
+
+# =========================
+# Fournisseurs
+# =========================
+@dataclass
+class Provider:
+    name: str
+    rate: float                     # jetons / seconde
+    burst: float                    # taille du bucket
+    timeout: float                  # timeout max d'un appel
+    hedge_after: float | None = None  # délai avant requête « hedgée » (GET idempotents)
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+    def __post_init__(self):
+        self.bucket = TokenBucket(self.rate, self.burst)
+
+
+PROVIDERS = {
+    "openai":      Provider("openai",      rate=5,  burst=10, timeout=30, breaker=CircuitBreaker(slow_call_s=20)),
+    "google_maps": Provider("google_maps", rate=10, burst=20, timeout=6),
+    "open_meteo":  Provider("open_meteo",  rate=10, burst=20, timeout=4, hedge_after=0.8),
+    "nominatim":   Provider("nominatim",   rate=1,  burst=1,  timeout=5),
+    "classifier":  Provider("classifier",  rate=500, burst=1000, timeout=5),
+}
+
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def get_provider(name: str) -> Provider:
+    return PROVIDERS[name]
+
+
+def call_timeout(name: str) -> float:
+    """Timeout à utiliser pour un appel : min(timeout du fournisseur, temps restant)."""
+    p = get_provider(name)
+    left = remaining()
+    if left is None:
+        return p.timeout
+    if left <= 0:
+        raise DeadlineExceeded(f"{name}: deadline dépassée")
+    return min(p.timeout, left)
+
+
+def guarded(name: str, fn, *args, **kwargs):
+    """
+    Exécute `fn(*args, **kwargs)` derrière le limiteur et le disjoncteur du fournisseur.
+    Le temps restant n'est pas injecté : utiliser `call_timeout(name)` pour le passer à `fn`.
+    """
+    p = get_provider(name)
+    timeout = call_timeout(name)
+    if not p.breaker.allow():
+        raise CircuitOpenError(f"{name}: circuit ouvert, appel refusé")
+    if not p.bucket.acquire(timeout=timeout):
+        p.breaker.release_probe()
+        raise RateLimitedError(f"{name}: limite de débit atteinte")
+    t0 = time.monotonic()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        p.breaker.record(False, time.monotonic() - t0)
+        raise
+    p.breaker.record(True, time.monotonic() - t0)
+    return result
+
+
+def http_get(name: str, url: str, params: dict | None = None, hedge: bool = False, **kwargs):
+    """
+    `requests.get` protégé, avec timeout hérité de la deadline ; lève HTTPError sur 4xx/5xx.
+    hedge=True : si aucune réponse après `hedge_after`, une seconde requête identique part
+    et la première réponse réussie est gardée (réservé aux GET idempotents).
+    """
+    import requests
+
+    def call():
+        response = requests.get(url, params=params, timeout=call_timeout(name), **kwargs)
+        # dans l'appel protégé : une réponse 4xx/5xx compte comme un échec pour le disjoncteur,
+        # et une requête hedgée ne la garde jamais comme « première réponse réussie »
+        response.raise_for_status()
+        return response
+
+    def attempt():
+        return guarded(name, call)
+
+    p = get_provider(name)
+    if not hedge or p.hedge_after is None:
+        return attempt()
+
+    first = _hedge_pool.submit(bind_context(attempt))
+    done, _ = wait([first], timeout=p.hedge_after)
+    if done:
+        return first.result()
+    logging.debug(f"[resilience] {name}: requête hedgée après {p.hedge_after}s")
+    pending = {first, _hedge_pool.submit(bind_context(attempt))}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"{name}: deadline dépassée")
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+def chat_completion(client, **kwargs):
+    """
+    `client.chat.completions.create(...)` via la couche de résilience du fournisseur 'openai'.
+    Le modèle demandé passe par le sélecteur partagé (services/model_selector.py), qui peut
+    le remplacer par un modèle moins cher ; latence et tokens de l'appel y sont enregistrés.
+    """
+    from services.model_selector import get_selector
+
+    selector = get_selector()
+    kwargs["model"] = selector.choose(kwargs["model"], kwargs.get("messages")).model
+
+    def call():
+        t0 = time.monotonic()
+        response = client.with_options(timeout=call_timeout("openai"), max_retries=0).chat.completions.create(**kwargs)
+        selector.record(kwargs["model"], time.monotonic() - t0, getattr(response, "usage", None))
+        return response
+
+    return guarded("openai", call)
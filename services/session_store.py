@@ -0,0 +1,255 @@
+"""
+Stockage externe des conversations (historique des agents LLM et de l'UI).
+
+Une session est identifiée par `session_id` et découpée en espaces de noms
+(« ui », « culture », « loisirs », ...). Chaque session porte un numéro de génération :
+`reset()` se contente de l'incrémenter (O(1)), les anciens tours deviennent
+invisibles et sont purgés plus tard (ou expirent via le TTL).
+
+Implémentations :
+  - `SQLiteSessionStore` : fichier local, survit aux redémarrages ;
+  - `KVSessionStore` : au-dessus d'un client clé/valeur de type Redis
+    (get / incr / rpush / lrange / expire) ; `LocalKV` en est un substitut en mémoire.
+
+`open_session_store("sqlite:///sessions.db")` ou `open_session_store("memory://")`.
+"""
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+_COMPRESS_ABOVE = 512  # octets
+
+
+def pack_turn(role: str, content: str) -> bytes:
+    """Sérialisation compacte : JSON sans espaces, compressé au-delà de 512 octets."""
+    raw = json.dumps([role, content], ensure_ascii=False, separators=(",", ":")).encode("utf8")
+    if len(raw) > _COMPRESS_ABOVE:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def unpack_turn(blob: bytes) -> dict:
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    role, content = json.loads(raw)
+    return {"role": role, "content": content}
+
+
+class SessionStore:
+    """Interface commune."""
+
+    def __init__(self, ttl: float | None = 7 * 24 * 3600):
+        self.ttl = ttl
+
+    def append(self, session_id: str, namespace: str, role: str, content: str):
+        raise NotImplementedError
+
+    def history(self, session_id: str, namespace: str, last_n: int | None = None) -> list[dict]:
+        """Les `last_n` derniers tours (tous si None), du plus ancien au plus récent."""
+        raise NotImplementedError
+
+    def reset(self, session_id: str):
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str = "sessions.db", ttl: float | None = 7 * 24 * 3600,
+                 purge_every: int = 1000):
+        """`purge()` est appelé à l'ouverture puis toutes les `purge_every` écritures (0 : jamais)."""
+        super().__init__(ttl)
+        self.purge_every = purge_every
+        self._appends = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY, generation INTEGER NOT NULL, expires REAL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL, generation INTEGER NOT NULL,
+                namespace TEXT NOT NULL, payload BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS turns_lookup ON turns (session_id, generation, namespace, id);
+        """)
+        self.purge()
+
+    def _expires(self):
+        return None if self.ttl is None else time.time() + self.ttl
+
+    def _generation(self, session_id: str, create: bool) -> int | None:
+        row = self.conn.execute(
+            "SELECT generation, expires FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row and (row[1] is None or row[1] > time.time()):
+            return row[0]
+        if not create:
+            return None
+        # session absente ou expirée : on repart sur une nouvelle génération
+        gen = row[0] + 1 if row else 0
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, generation, expires) VALUES (?, ?, ?)",
+            (session_id, gen, self._expires()),
+        )
+        return gen
+
+    def append(self, session_id, namespace, role, content):
+        with self._lock:
+            gen = self._generation(session_id, create=True)
+            self.conn.execute(
+                "INSERT INTO turns (session_id, generation, namespace, payload) VALUES (?, ?, ?, ?)",
+                (session_id, gen, namespace, pack_turn(role, content)),
+            )
+            self.conn.execute("UPDATE sessions SET expires = ? WHERE id = ?", (self._expires(), session_id))
+            self._appends += 1
+            due = self.purge_every and self._appends % self.purge_every == 0
+        if due:
+            self.purge()
+
+    def history(self, session_id, namespace, last_n=None):
+        with self._lock:
+            gen = self._generation(session_id, create=False)
+            if gen is None:
+                return []
+            rows = self.conn.execute(
+                "SELECT payload FROM turns WHERE session_id = ? AND generation = ? AND namespace = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (session_id, gen, namespace, -1 if last_n is None else last_n),
+            ).fetchall()
+        return [unpack_turn(r[0]) for r in reversed(rows)]
+
+    def reset(self, session_id):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO sessions (id, generation, expires) VALUES (?, 1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET generation = generation + 1, expires = excluded.expires",
+                (session_id, self._expires()),
+            )
+
+    def purge(self) -> int:
+        """Supprime les tours des générations périmées et des sessions expirées."""
+        with self._lock:
+            self.conn.execute("DELETE FROM sessions WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            cur = self.conn.execute(
+                "DELETE FROM turns WHERE NOT EXISTS (SELECT 1 FROM sessions s "
+                "WHERE s.id = turns.session_id AND s.generation = turns.generation)"
+            )
+            return cur.rowcount
+
+
+class LocalKV:
+    """
+    Substitut en mémoire d'un KV réseau (sous-ensemble de l'API Redis, valeurs en bytes),
+    avec expiration paresseuse des clés.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expiry = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        exp = self._expiry.get(key)
+        if exp is not None and exp <= time.time():
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            return self._data[key] if self._alive(key) else None
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data[key]) + 1 if self._alive(key) else 1
+            self._data[key] = str(value).encode()
+            return value
+
+    def rpush(self, key, *values):
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = []
+            self._data[key].extend(values)
+            return len(self._data[key])
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            if not self._alive(key):
+                return []
+            items = self._data[key]
+            end = len(items) if end == -1 else end + 1
+            return items[start:end] if start >= 0 else items[max(0, len(items) + start):end]
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._alive(key):
+                self._expiry[key] = time.time() + seconds
+                return True
+            return False
+
+    def delete(self, *keys):
+        with self._lock:
+            n = 0
+            for key in keys:
+                n += self._data.pop(key, None) is not None
+                self._expiry.pop(key, None)
+            return n
+
+    def evict_oldest(self, n: int):
+        """Retire les `n` clés les plus anciennes (plafond mémoire, voir services/memory.py)."""
+        for key in list(self._data)[:n]:
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class KVSessionStore(SessionStore):
+    """Sessions sur un KV type Redis : `sess:<id>:gen` + une liste par (génération, namespace)."""
+
+    def __init__(self, kv=None, ttl: float | None = 7 * 24 * 3600, prefix: str = "sess"):
+        super().__init__(ttl)
+        self.kv = kv if kv is not None else LocalKV()
+        self.prefix = prefix
+
+    def _gen_key(self, session_id):
+        return f"{self.prefix}:{session_id}:gen"
+
+    def _list_key(self, session_id, namespace):
+        gen = self.kv.get(self._gen_key(session_id))
+        return f"{self.prefix}:{session_id}:{int(gen or 0)}:{namespace}"
+
+    def append(self, session_id, namespace, role, content):
+        key = self._list_key(session_id, namespace)
+        self.kv.rpush(key, pack_turn(role, content))
+        if self.ttl is not None:
+            self.kv.expire(key, int(self.ttl))
+            self.kv.expire(self._gen_key(session_id), int(self.ttl))
+
+    def history(self, session_id, namespace, last_n=None):
+        if last_n == 0:
+            return []  # -0 == 0 : lrange renverrait toute la liste
+        start = 0 if last_n is None else -last_n
+        return [unpack_turn(b) for b in self.kv.lrange(self._list_key(session_id, namespace), start, -1)]
+
+    def reset(self, session_id):
+        # les anciennes listes ne sont plus adressées et expirent d'elles-mêmes
+        self.kv.incr(self._gen_key(session_id))
+        if self.ttl is not None:
+            self.kv.expire(self._gen_key(session_id), int(self.ttl))
+
+
+def open_session_store(url: str = "sqlite:///sessions.db", ttl: float | None = 7 * 24 * 3600) -> SessionStore:
+    """`sqlite:///<chemin>`, `memory://` (LocalKV) ou `redis://...` (si le paquet redis est installé)."""
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):], ttl=ttl)
+    if url.startswith("memory://"):
+        return KVSessionStore(LocalKV(), ttl=ttl)
+    if url.startswith("redis://"):
+        import redis  # dépendance optionnelle
+        return KVSessionStore(redis.Redis.from_url(url), ttl=ttl)
+    raise ValueError(f"URL de session store non supportée : {url}")
@@ -0,0 +1,42 @@
+from agents.weather_agent import WeatherAgent
+
+
+def _agent(calls):
+    """Agent sans réseau : les prévisions sont enregistrées, la météo actuelle est interdite."""
+    agent = WeatherAgent()
+
+    def forecast_answer(city, query):
+        calls.append((city, query.kind))
+        return f"prévision {city}"
+
+    def current_weather(city):
+        raise AssertionError(f"météo actuelle demandée pour {city}")
+
+    agent.forecast_answer = forecast_answer
+    agent.get_coordinates = current_weather
+    return agent
+
+
+def test_lowercase_hour_forecast():
+    calls = []
+    assert _agent(calls).handle_request("météo à paris demain à 15h") == "prévision paris"
+    assert calls == [("paris", "hour")]
+
+
+def test_lowercase_weekend_forecast():
+    calls = []
+    _agent(calls).handle_request("quel temps à lyon ce week-end")
+    assert calls == [("lyon", "days")]
+
+
+def test_lowercase_enumeration_forecast():
+    calls = []
+    _agent(calls).handle_request("météo à lille, paris et lyon demain")
+    assert calls == [("lille", "days"), ("paris", "days"), ("lyon", "days")]
+
+
+def test_extract_cities_ignores_non_places_without_capitals():
+    agent = WeatherAgent()
+    assert agent.extract_cities("météo à paris, s'il vous plaît") == ["paris"]
+    assert agent.extract_cities("météo à paris et il pleut à lyon ?") == ["paris"]
+    assert agent.extract_cities("météo pour le havre demain") == ["le havre"]
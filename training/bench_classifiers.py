@@ -0,0 +1,204 @@
+"""
+Benchmark des classifieurs candidats pour le dispatcher (section 5 du README) :
+précision ET coût CPU, mesurés sur le même train.jsonl / val.jsonl.
+
+Candidats :
+    tfidf       TF-IDF (caractères 2-5) + régression logistique, sans réseau de neurones
+    minilm      paraphrase-multilingual-MiniLM-L12-v2 + tête logistique
+    mpnet       paraphrase-multilingual-mpnet-base-v2 (backbone actuel) + tête logistique
+    *-int8      mêmes backbones quantifiés dynamiquement (torch, couches Linear en int8)
+
+Comme dans sweep_dispatcher.py, le backbone n'apprend pas : les embeddings de chaque
+candidat sont calculés une fois et gardés dans cache/ (un .npy par modèle et par fichier).
+La tête est une régression logistique, identique pour tous : l'écart mesuré vient du backbone.
+
+Métriques :
+    bal_acc, f1_macro   sur val.jsonl
+    p50_ms, p95_ms      une requête à la fois (encodage + tête), comme dans le chat
+    batch_qps           textes/s en lots de --batch-size (mode batch, tune_thresholds)
+    size_mb             poids sérialisés (state_dict torch, ou pickle pour TF-IDF)
+    load_s              chargement du modèle (+ quantification), fichiers déjà téléchargés
+
+Usage (depuis le dossier training/) :
+    python bench_classifiers.py
+    python bench_classifiers.py --candidates tfidf minilm minilm-int8 --threads 4
+"""
+import io
+import os
+import csv
+import time
+import pickle
+import hashlib
+import logging
+import argparse
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import balanced_accuracy_score, f1_score
+
+from training_data_searching import RequestDataset
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+CACHE_DIR = "cache"
+label2id = {"transport": 0, "météo": 1, "culture": 2, "loisirs": 3}
+
+BACKBONES = {
+    "minilm": "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+    "mpnet":  "sentence-transformers/paraphrase-multilingual-mpnet-base-v2",
+}
+CANDIDATES = ["tfidf", "minilm", "minilm-int8", "mpnet", "mpnet-int8"]
+
+
+# =========================
+# Modèles
+# =========================
+def load_backbone(candidate: str):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    name, _, quant = candidate.partition("-")
+    model = SentenceTransformer(BACKBONES[name], device="cpu")
+    model.eval()
+    if quant == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def serialized_mb(obj) -> float:
+    buf = io.BytesIO()
+    if hasattr(obj, "state_dict"):
+        import torch
+
+        torch.save(obj.state_dict(), buf)
+    else:
+        pickle.dump(obj, buf)
+    return buf.tell() / 1e6
+
+
+def _cache_path(candidate: str, path: str) -> str:
+    h = hashlib.sha1(candidate.encode("utf8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return os.path.join(CACHE_DIR, f"{os.path.basename(path)}.{candidate}.{h.hexdigest()[:12]}.npy")
+
+
+def cached_embeddings(model, candidate: str, texts: list[str], path: str, batch_size: int) -> np.ndarray:
+    """Encode une seule fois par (candidat, contenu du fichier) ; les relances relisent le .npy."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    out = _cache_path(candidate, path)
+    if os.path.exists(out):
+        return np.load(out)
+    embs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    np.save(out, embs.astype(np.float32))
+    logging.info(f"Cache d'embeddings écrit : {out} {embs.shape}")
+    return embs
+
+
+def percentile_ms(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q) * 1000)
+
+
+# =========================
+# Évaluation d'un candidat
+# =========================
+def bench_candidate(candidate: str, train, val, paths: tuple[str, str], n_latency: int, batch_size: int) -> dict:
+    (train_texts, y_train), (val_texts, y_val) = train, val
+
+    if candidate == "tfidf":
+        model = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), min_df=2, sublinear_tf=True)
+        x_train = model.fit_transform(train_texts)
+        x_val = model.transform(val_texts)
+        blob = pickle.dumps(model)
+        t0 = time.perf_counter()
+        pickle.loads(blob)  # chargement d'un vectoriseur déjà ajusté
+        load_s = time.perf_counter() - t0
+        encode = model.transform
+    else:
+        load_backbone(candidate)  # premier chargement : téléchargement éventuel, non compté
+        t0 = time.perf_counter()
+        model = load_backbone(candidate)
+        load_s = time.perf_counter() - t0
+        x_train = cached_embeddings(model, candidate, train_texts, paths[0], batch_size)
+        x_val = cached_embeddings(model, candidate, val_texts, paths[1], batch_size)
+
+        def encode(texts):
+            return model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+    head = LogisticRegression(max_iter=2000, class_weight="balanced")
+    head.fit(x_train, y_train)
+    preds = head.predict(x_val)
+
+    # latence requête par requête (après un appel de chauffe)
+    head.predict(encode(val_texts[:1]))
+    latencies = []
+    for text in val_texts[:n_latency]:
+        t = time.perf_counter()
+        head.predict(encode([text]))
+        latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    head.predict(encode(val_texts))
+    batch_s = time.perf_counter() - t
+
+    return {
+        "candidate": candidate,
+        "bal_acc": round(balanced_accuracy_score(y_val, preds), 4),
+        "f1_macro": round(f1_score(y_val, preds, average="macro"), 4),
+        "p50_ms": round(percentile_ms(latencies, 50), 2),
+        "p95_ms": round(percentile_ms(latencies, 95), 2),
+        "batch_qps": round(len(val_texts) / batch_s, 1),
+        "size_mb": round(serialized_mb(model) + serialized_mb(head), 1),
+        "load_s": round(load_s, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark précision / latence des classifieurs candidats")
+    parser.add_argument("--candidates", nargs="+", default=CANDIDATES, choices=CANDIDATES)
+    parser.add_argument("--train", default="train.jsonl")
+    parser.add_argument("--val", default="val.jsonl")
+    parser.add_argument("--n-latency", type=int, default=200, help="requêtes chronométrées une à une")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="threads torch (défaut : tous)")
+    parser.add_argument("--results", default="bench_classifiers.csv")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+
+        torch.set_num_threads(args.threads)
+
+    datasets = []
+    for path in (args.train, args.val):
+        ds = RequestDataset(path, label2id)
+        datasets.append(([text for text, _ in ds], np.asarray(ds.labels, dtype=np.int64)))
+    logging.info(f"{len(datasets[0][0])} textes d'entraînement, {len(datasets[1][0])} de validation")
+
+    rows = []
+    for candidate in args.candidates:
+        logging.info(f"Candidat {candidate}…")
+        rows.append(bench_candidate(candidate, datasets[0], datasets[1], (args.train, args.val),
+                                    args.n_latency, args.batch_size))
+
+    with open(args.results, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n{'candidat':<12} | {'bal_acc':>7} {'F1':>6} | {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'lot q/s':>8} | {'Mo':>6} {'charg. s':>8}")
+    print("-" * 78)
+    for r in rows:
+        print(f"{r['candidate']:<12} | {r['bal_acc']:>7.3f} {r['f1_macro']:>6.3f} | {r['p50_ms']:>7.1f} "
+              f"{r['p95_ms']:>7.1f} {r['batch_qps']:>8.0f} | {r['size_mb']:>6.1f} {r['load_s']:>8.2f}")
+    logging.info(f"Résultats écrits dans {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Étape optionnelle de validation / réétiquetage du corpus par un LLM.
+
+Les labels de DataFetcher sont « faibles » : ils viennent du subreddit ou du mot-clé de
+recherche et des regex `_PATTERNS`. Des titres comme « Sziget Festival 2024 Aftermovie »
+ou des titres en anglais passent donc dans train.jsonl. Ici, chaque titre reçoit un
+verdict LLM parmi les 4 labels ou « aucun » (bruit : pas une question d'utilisateur).
+
+    - plusieurs titres par appel (--batch-size), numérotés, réponse JSON
+    - appels en parallèle bornés (--concurrency)
+    - verdicts en cache disque (sqlite) par hash (modèle, prompt, texte) : une relance ne
+      paie que les nouveaux titres
+    - rapport : débit, taux de cache, désaccord avec le label faible par classe
+
+Modes : validate (garde les titres où LLM et label faible sont d'accord) ou relabel
+(le label LLM remplace le label faible). Les titres « aucun » sont écartés dans les deux cas ;
+les titres sans verdict (appel en échec) sont gardés avec leur label faible et comptés à part.
+
+Usage (depuis le dossier training/) :
+    python relabel_llm.py run --input train.jsonl --output train.relabeled.jsonl --mode validate
+    # serveur local compatible OpenAI (verdicts par regex, latence simulée) pour tester sans clé
+    python relabel_llm.py serve --port 8011 --latency 0.3
+    python relabel_llm.py run --input train.jsonl --base-url http://127.0.0.1:8011/v1
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from training_data_searching import DataFetcher
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+LABELS = ["transport", "météo", "culture", "loisirs", "aucun"]
+PROMPT_VERSION = "v1"  # à changer si le prompt change : invalide le cache
+SYSTEM_PROMPT = (
+    "Tu étiquettes des titres pour un assistant de mobilité urbaine. Pour chaque titre numéroté, "
+    "choisis un label parmi : transport (déplacements, horaires, trajets), météo, culture "
+    "(patrimoine, histoire, musées, livres, films), loisirs (sorties, activités, événements, sport), "
+    "ou aucun si le titre n'est pas une question qu'un utilisateur poserait à l'assistant "
+    "(annonce, vidéo, récit, hors sujet). "
+    'Réponds uniquement en JSON : {"labels": [{"i": 1, "label": "..."}, ...]}'
+)
+
+
+# =========================
+# Cache disque des verdicts
+# =========================
+class VerdictCache:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, label TEXT)")
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha1(f"{model}|{PROMPT_VERSION}|{text}".encode("utf8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict:
+        out = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT key, label FROM verdicts WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                out.update(rows)
+        return out
+
+    def put_many(self, items: list[tuple[str, str]]):
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?)", items)
+
+
+# =========================
+# Appels LLM
+# =========================
+def parse_verdicts(content: str, n: int) -> list[str | None]:
+    """Label par titre (None si absent ou invalide : le titre sera retenté à la prochaine passe)."""
+    try:
+        items = json.loads(content).get("labels", [])
+    except (ValueError, AttributeError):
+        return [None] * n
+    out = [None] * n
+    for it in items:
+        try:
+            i, label = int(it["i"]) - 1, str(it["label"]).strip().lower()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= i < n and label in LABELS:
+            out[i] = label
+    return out
+
+
+def label_batch(client, model: str, texts: list[str]) -> list[str | None]:
+    numbered = "\n".join(f"{i}. {t}" for i, t in enumerate(texts, 1))
+    resp = client.chat.completions.create(
+        model=model,
+        temperature=0,
+        response_format={"type": "json_object"},
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": numbered}],
+    )
+    return parse_verdicts(resp.choices[0].message.content, len(texts))
+
+
+def relabel(items: list[dict], client, model: str, cache: VerdictCache,
+            batch_size: int = 25, concurrency: int = 4) -> tuple[list[str | None], dict]:
+    keys = [cache.key(model, it["text"]) for it in items]
+    verdicts = [None] * len(items)
+    cached = cache.get_many(list(set(keys)))
+    todo = {}
+    for idx, key in enumerate(keys):
+        if key in cached:
+            verdicts[idx] = cached[key]
+        else:
+            todo.setdefault(key, []).append(idx)  # doublons : un seul envoi
+
+    pending = list(todo)
+    batches = [pending[s:s + batch_size] for s in range(0, len(pending), batch_size)]
+    logging.info(f"{len(items)} titres : {len(items) - sum(map(len, todo.values()))} en cache, "
+                 f"{len(pending)} à envoyer en {len(batches)} appels")
+
+    calls, failed = 0, 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(label_batch, client, model, [items[todo[k][0]]["text"] for k in batch]): batch
+                   for batch in batches}
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            calls += 1
+            try:
+                labels = fut.result()
+            except Exception as e:
+                logging.warning(f"Appel LLM en échec ({len(batch)} titres) : {e}")
+                failed += len(batch)
+                continue
+            cache.put_many([(k, lbl) for k, lbl in zip(batch, labels) if lbl is not None])
+            for k, lbl in zip(batch, labels):
+                for idx in todo[k]:
+                    verdicts[idx] = lbl
+            if calls % 10 == 0:
+                logging.info(f"{calls}/{len(batches)} appels, {(time.perf_counter() - t0):.1f}s")
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "titles": len(items),
+        "cache_hits": len(items) - sum(map(len, todo.values())),
+        "sent": len(pending),
+        "calls": calls,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 2),
+        "titles_per_s": round((len(pending) - failed) / elapsed, 1) if elapsed and pending else None,
+    }
+    return verdicts, stats
+
+
+def disagreement_report(items: list[dict], verdicts: list[str | None]) -> dict:
+    per_label = Counter()
+    disagree = Counter()
+    confusion = Counter()
+    for it, v in zip(items, verdicts):
+        if v is None:
+            continue
+        per_label[it["label"]] += 1
+        if v != it["label"]:
+            disagree[it["label"]] += 1
+            confusion[f"{it['label']}→{v}"] += 1
+    total = sum(per_label.values())
+    return {
+        "with_verdict": total,
+        "no_verdict": len(items) - total,
+        "disagreement": round(sum(disagree.values()) / total, 4) if total else None,
+        "noise": round(sum(n for k, n in confusion.items() if k.endswith("→aucun")) / total, 4) if total else None,
+        "disagreement_per_label": {lbl: round(disagree[lbl] / n, 4) for lbl, n in sorted(per_label.items())},
+        "top_confusions": dict(confusion.most_common(10)),
+    }
+
+
+# =========================
+# Serveur local de substitution (compatible /v1/chat/completions)
+# =========================
+def _stub_label(text: str) -> str:
+    if "?" not in text:
+        return "aucun"
+    for label, pattern in DataFetcher._PATTERNS.items():
+        if pattern.search(text):
+            return label
+    return "aucun"
+
+
+def serve_stub(port: int, latency: float = 0.0, host: str = "127.0.0.1"):
+    """Répond comme l'API OpenAI, verdicts par les regex de DataFetcher (+ « aucun » sans '?')."""
+    line = re.compile(r"^(\d+)\. (.*)$")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            user = next(m["content"] for m in body["messages"] if m["role"] == "user")
+            labels = [{"i": int(m.group(1)), "label": _stub_label(m.group(2))}
+                      for m in map(line.match, user.splitlines()) if m]
+            time.sleep(latency)
+            out = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps({"labels": labels})}}],
+                "usage": {"prompt_tokens": len(user) // 4, "completion_tokens": 8 * len(labels),
+                          "total_tokens": len(user) // 4 + 8 * len(labels)},
+            }).encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, fmt, *args):
+            logging.debug(fmt % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info(f"Serveur de substitution sur http://{host}:{port}/v1 (latence {latency}s)")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validation / réétiquetage du corpus par un LLM")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--input", default="train.jsonl")
+    run.add_argument("--output", default=None, help="défaut : <entrée>.relabeled.jsonl")
+    run.add_argument("--mode", choices=["validate", "relabel"], default="validate")
+    run.add_argument("--model", default="gpt-4o-mini")
+    run.add_argument("--base-url", default=None, help="API compatible OpenAI (ex : serveur local)")
+    run.add_argument("--batch-size", type=int, default=25, help="titres par appel")
+    run.add_argument("--concurrency", type=int, default=4, help="appels simultanés")
+    run.add_argument("--cache", default="cache/llm_labels.sqlite")
+    run.add_argument("--report", default=None, help="écrire le rapport JSON ici")
+
+    serve = sub.add_parser("serve")
+    serve.add_argument("--port", type=int, default=8011)
+    serve.add_argument("--latency", type=float, default=0.0, help="latence simulée par appel (s)")
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        serve_stub(args.port, args.latency)
+        return
+
+    from openai import OpenAI
+
+    client = OpenAI(base_url=args.base_url, api_key=os.getenv("OPENAI_API_KEY") or "local",
+                    timeout=60, max_retries=3)
+    with open(args.input, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    verdicts, stats = relabel(items, client, args.model, VerdictCache(args.cache),
+                              args.batch_size, args.concurrency)
+    report = {**stats, **disagreement_report(items, verdicts)}
+
+    output = args.output or os.path.splitext(args.input)[0] + ".relabeled.jsonl"
+    kept, unverified = 0, 0
+    with open(output, "w", encoding="utf-8") as f:
+        for it, v in zip(items, verdicts):
+            if v is None:
+                # appel en échec ou réponse incomplète : on garde le label faible (relancer pour valider)
+                label = it["label"]
+                unverified += 1
+            elif v == "aucun" or (args.mode == "validate" and v != it["label"]):
+                continue
+            else:
+                label = v
+            f.write(json.dumps({"text": it["text"], "label": label}, ensure_ascii=False) + "\n")
+            kept += 1
+    report["kept"] = kept
+    report["kept_unverified"] = unverified
+    logging.info(f"{kept}/{len(items)} titres gardés ({args.mode}) → {output}")
+    if unverified:
+        logging.warning(f"{unverified} titres sans verdict gardés avec leur label faible : "
+                        f"relancer la commande pour les valider (les autres sont en cache)")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
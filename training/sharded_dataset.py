@@ -0,0 +1,279 @@
+"""
+Couche dataset pour les corpus JSONL découpés en shards.
+
+- `ShardedJsonlDataset` : accès aléatoire via un index d'offsets (octets) ; on ne garde
+  en mémoire que l'index et les labels (quelques octets par ligne), pas les textes.
+- `StreamingRequestDataset` : lecture en flux, shards mélangés + buffer de mélange.
+- `ShardWriter` / `DiskSeenSet` : écriture et dédoublonnage à mémoire constante,
+  utilisés par `DataFetcher.run_streaming`.
+
+Chaque ligne a la forme {"text": ..., "label": ...}, comme train.jsonl.
+"""
+import os
+import glob
+import json
+import random
+import sqlite3
+import hashlib
+import logging
+from array import array
+from collections import Counter
+
+try:
+    from torch.utils.data import IterableDataset, get_worker_info
+except ImportError:  # permet d'indexer / écrire un corpus sans torch
+    IterableDataset = object
+
+    def get_worker_info():
+        return None
+
+_INDEX_VERSION = 1
+
+
+def _expand(paths) -> list[str]:
+    """Accepte un chemin, un glob (« shards/train-*.jsonl ») ou une liste des deux."""
+    if isinstance(paths, str):
+        paths = [paths]
+    out = []
+    for p in paths:
+        matches = sorted(glob.glob(p))
+        out.extend(matches or [p])
+    return out
+
+
+def _clean_text(text: str) -> str:
+    return text.strip().replace("\n", " ")
+
+
+class _ShardIndex:
+    """Offsets + labels d'un shard, persistés à côté (<shard>.idx) et reconstruits si le shard change."""
+
+    def __init__(self, path: str, label2id: dict):
+        self.path = path
+        self.offsets = array("q")
+        self.labels = array("h")
+        self.counts = Counter()
+        stat = os.stat(path)
+        key = {"v": _INDEX_VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns,
+               "labels": [list(kv) for kv in sorted(label2id.items())]}  # même forme qu'après json.loads
+        if not self._load(key):
+            self._build(label2id)
+            self._dump(key)
+
+    def _idx_path(self):
+        return self.path + ".idx"
+
+    def _load(self, key) -> bool:
+        try:
+            with open(self._idx_path(), "rb") as f:
+                header = json.loads(f.readline())
+                if header["key"] != key:
+                    return False
+                self.offsets.fromfile(f, header["n"])
+                self.labels.fromfile(f, header["n"])
+                self.counts = Counter(header["counts"])
+            return True
+        except (OSError, ValueError, KeyError, EOFError):
+            self.offsets, self.labels = array("q"), array("h")
+            return False
+
+    def _dump(self, key):
+        try:
+            with open(self._idx_path(), "wb") as f:
+                header = {"key": key, "n": len(self.offsets), "counts": dict(self.counts)}
+                f.write(json.dumps(header, ensure_ascii=False).encode("utf8") + b"\n")
+                self.offsets.tofile(f)
+                self.labels.tofile(f)
+        except OSError as e:
+            logging.warning(f"Index non persisté pour {self.path}: {e}")
+
+    def _build(self, label2id):
+        # une seule passe : offsets + labels + statistiques
+        with open(self.path, "rb") as f:
+            offset = 0
+            for raw in f:
+                if raw.strip():
+                    item = json.loads(raw)
+                    label = label2id.get(item["label"])
+                    self.counts[item["label"]] += 1
+                    if label is not None:
+                        self.offsets.append(offset)
+                        self.labels.append(label)
+                offset += len(raw)
+
+
+class ShardedJsonlDataset:
+    """Dataset « map-style » sur un ou plusieurs shards JSONL, sans charger les textes en mémoire."""
+
+    def __init__(self, paths, label2id):
+        self.paths = _expand(paths)
+        self.label2id = label2id
+        self.labels = array("h")
+        self._shard_of = array("i")
+        self._offsets = array("q")
+        self.label_counts = Counter()  # toutes étiquettes vues, y compris hors label2id
+        for shard_id, path in enumerate(self.paths):
+            idx = _ShardIndex(path, label2id)
+            self._offsets.extend(idx.offsets)
+            self.labels.extend(idx.labels)
+            self._shard_of.extend([shard_id] * len(idx.offsets))
+            self.label_counts.update(idx.counts)
+        self._handles = {}
+        self._pid = os.getpid()
+
+    def _handle(self, shard_id):
+        # les workers DataLoader héritent de l'objet : un jeu de fichiers ouverts par processus
+        if self._pid != os.getpid():
+            self._handles, self._pid = {}, os.getpid()
+        fh = self._handles.get(shard_id)
+        if fh is None:
+            fh = self._handles[shard_id] = open(self.paths[shard_id], "rb")
+        return fh
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, idx):
+        fh = self._handle(self._shard_of[idx])
+        fh.seek(self._offsets[idx])
+        item = json.loads(fh.readline())
+        return _clean_text(item["text"]), self.labels[idx]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_handles"] = {}
+        return state
+
+    def close(self):
+        for fh in self._handles.values():
+            fh.close()
+        self._handles = {}
+
+
+class StreamingRequestDataset(IterableDataset):
+    """
+    Lecture en flux des shards : mémoire bornée par `buffer_size`.
+    Les shards sont répartis entre workers DataLoader, l'ordre est re-mélangé à chaque epoch.
+    """
+
+    def __init__(self, paths, label2id, buffer_size: int = 10_000, shuffle: bool = True, seed: int = 42):
+        self.paths = _expand(paths)
+        self.label2id = label2id
+        self.buffer_size = buffer_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _iter_lines(self, paths):
+        for path in paths:
+            with open(path, encoding="utf8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    label = self.label2id.get(item["label"])
+                    if label is not None:
+                        yield _clean_text(item["text"]), label
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        paths = list(self.paths)
+        if self.shuffle:
+            rng.shuffle(paths)
+        info = get_worker_info()
+        if info is not None:
+            paths = paths[info.id::info.num_workers]
+        stream = self._iter_lines(paths)
+        if not self.shuffle:
+            yield from stream
+            return
+
+        buffer = []
+        for sample in stream:
+            if len(buffer) < self.buffer_size:
+                buffer.append(sample)
+                continue
+            i = rng.randrange(self.buffer_size)
+            yield buffer[i]
+            buffer[i] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+
+def label_statistics(paths) -> Counter:
+    """Compte les étiquettes en une passe, sans rien garder d'autre en mémoire."""
+    counts = Counter()
+    for path in _expand(paths):
+        with open(path, encoding="utf8") as f:
+            for line in f:
+                if line.strip():
+                    counts[json.loads(line)["label"]] += 1
+    return counts
+
+
+class ShardWriter:
+    """Écrit des enregistrements dans <out_dir>/<prefix>-00000.jsonl, avec rotation tous les `shard_size`."""
+
+    def __init__(self, out_dir: str, prefix: str, shard_size: int = 50_000):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.counts = Counter()
+        self.total = 0
+        self._shard = -1
+        self._fh = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _rotate(self):
+        if self._fh:
+            self._fh.close()
+        self._shard += 1
+        path = os.path.join(self.out_dir, f"{self.prefix}-{self._shard:05d}.jsonl")
+        self._fh = open(path, "w", encoding="utf-8")
+
+    def write(self, item: dict):
+        if self._fh is None or self.total % self.shard_size == 0:
+            self._rotate()
+        json.dump(item, self._fh, ensure_ascii=False)
+        self._fh.write("\n")
+        self.total += 1
+        self.counts[item["label"]] += 1
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DiskSeenSet:
+    """Ensemble de textes déjà vus, stocké en SQLite (empreinte 16 octets) plutôt qu'en RAM."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (h BLOB PRIMARY KEY) WITHOUT ROWID")
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf8"), digest_size=16).digest()
+
+    def __contains__(self, text: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM seen WHERE h = ?", (self._key(text),)).fetchone() is not None
+
+    def add(self, text: str):
+        self.conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (self._key(text),))
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
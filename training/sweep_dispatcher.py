@@ -0,0 +1,278 @@
+"""
+Recherche d'hyperparamètres pour la tête de classification du dispatcher.
+
+Dans `finetune_dispatcher.py`, les embeddings sont calculés par `backbone.encode`
+(donc sans gradient) : seule la tête apprend réellement. On peut donc encoder le
+corpus UNE seule fois, le poser sur disque en .npy et le partager en lecture
+(memmap) entre plusieurs processus qui entraînent chacun une tête différente.
+
+Usage (depuis le dossier training/) :
+    python sweep_dispatcher.py --workers 4 --trials 24
+"""
+import os
+import csv
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+from torch import nn
+from torch.nn.utils import clip_grad_norm_
+from torch.optim import AdamW
+from transformers import get_linear_schedule_with_warmup
+from sklearn.metrics import accuracy_score, balanced_accuracy_score, f1_score
+
+from training_data_searching import RequestDataset
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+MODEL_NAME   = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+CACHE_DIR    = "cache"
+WEIGHT_DECAY = 0.01
+PATIENCE     = 5      # même early stopping que finetune_dispatcher.py
+PRUNE_AFTER  = 3      # à partir de cette epoch on compare au meilleur essai connu
+PRUNE_MARGIN = 0.05   # un essai à plus de 5 points du meilleur est abandonné
+
+label2id = {"transport":0, "météo":1, "culture":2, "loisirs":3}
+
+# Espace de recherche (les valeurs actuelles de finetune_dispatcher.py sont incluses)
+BOOSTS = {
+    "actuel": {"transport": 1.8, "météo": 1.6, "loisirs": 0.7},
+    "aucun":  {},
+    "doux":   {"transport": 1.3, "météo": 1.3, "loisirs": 0.85},
+}
+SEARCH_SPACE = {
+    "batch_size": [16, 32, 64],
+    "lr_head":    [1e-4, 2e-4, 5e-4],
+    "dropout":    [0.2, 0.3],
+    "boost":      list(BOOSTS),
+    "epochs":     [8, 15],
+}
+
+
+# =========================
+# Cache d'embeddings (partagé en memmap)
+# =========================
+def _file_digest(path: str) -> str:
+    h = hashlib.sha1(MODEL_NAME.encode("utf8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def build_embedding_cache(backbone, ds: RequestDataset, path: str) -> str:
+    """Encode le dataset une seule fois ; réutilise le .npy si le fichier source n'a pas changé."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    out = os.path.join(CACHE_DIR, f"{os.path.basename(path)}.{_file_digest(path)}.npy")
+    if os.path.exists(out):
+        logging.info(f"Cache d'embeddings réutilisé : {out}")
+        return out
+    texts = [text for text, _ in ds]
+    embs = backbone.encode(texts, batch_size=64, convert_to_numpy=True, show_progress_bar=True)
+    np.save(out, embs.astype(np.float32))
+    logging.info(f"Cache d'embeddings écrit : {out} {embs.shape}")
+    return out
+
+
+# =========================
+# Essai (exécuté dans un processus du pool)
+# =========================
+_SHARED = {}
+
+
+def _init_worker(train_emb, train_lab, val_emb, val_lab, best_value):
+    # un seul thread torch par processus : le parallélisme vient du pool
+    torch.set_num_threads(1)
+    _SHARED["train"] = (np.load(train_emb, mmap_mode="r"), np.asarray(train_lab, dtype=np.int64))
+    _SHARED["val"]   = (np.load(val_emb, mmap_mode="r"),   np.asarray(val_lab, dtype=np.int64))
+    _SHARED["best"]  = best_value
+
+
+def build_head(embed_dim: int, n_labels: int, dropout: float) -> nn.Module:
+    # même architecture que finetune_dispatcher.py
+    return nn.Sequential(
+        nn.Dropout(dropout),
+        nn.Linear(embed_dim, 256),
+        nn.GELU(),
+        nn.Dropout(dropout),
+        nn.Linear(256, n_labels)
+    )
+
+
+def class_weights(labels: np.ndarray, boost: dict) -> torch.Tensor:
+    counts = np.bincount(labels, minlength=len(label2id))
+    base_w = len(labels) / np.maximum(counts, 1)
+    w = torch.tensor(
+        [base_w[i] * boost.get(lbl, 1.0) for lbl, i in label2id.items()],
+        dtype=torch.float32
+    )
+    return w / w.mean()
+
+
+def run_trial(trial_id: int, params: dict) -> dict:
+    # même graine pour l'init torch et l'ordre des lots : un essai est reproductible
+    torch.manual_seed(trial_id)
+    rng = np.random.default_rng(trial_id)
+    x_train, y_train = _SHARED["train"]
+    x_val, y_val     = _SHARED["val"]
+    best_shared      = _SHARED["best"]
+
+    clf = build_head(x_train.shape[1], len(label2id), params["dropout"])
+    loss_fn = nn.CrossEntropyLoss(weight=class_weights(y_train, BOOSTS[params["boost"]]))
+    opt = AdamW(clf.parameters(), lr=params["lr_head"], weight_decay=WEIGHT_DECAY)
+    steps_per_epoch = -(-len(y_train) // params["batch_size"])
+    total_steps = steps_per_epoch * params["epochs"]
+    sched = get_linear_schedule_with_warmup(
+        opt,
+        num_warmup_steps=int(0.06 * total_steps),
+        num_training_steps=total_steps
+    )
+    xv = torch.from_numpy(np.ascontiguousarray(x_val))
+    best = {"bal_acc": 0.0, "acc": 0.0, "f1": 0.0, "epoch": 0, "state": None}
+    stale, status = 0, "terminé"
+    t0 = time.perf_counter()
+
+    for epoch in range(1, params["epochs"] + 1):
+        clf.train()
+        order = rng.permutation(len(y_train))
+        for start in range(0, len(order), params["batch_size"]):
+            idx = np.sort(order[start:start + params["batch_size"]])
+            embs = torch.from_numpy(np.ascontiguousarray(x_train[idx]))
+            labs = torch.from_numpy(y_train[idx])
+            loss = loss_fn(clf(embs), labs)
+            loss.backward()
+            clip_grad_norm_(clf.parameters(), 1.0)
+            opt.step(); sched.step(); opt.zero_grad()
+
+        clf.eval()
+        with torch.no_grad():
+            preds = torch.argmax(clf(xv), dim=1).numpy()
+        bal_acc = balanced_accuracy_score(y_val, preds)
+
+        if bal_acc > best["bal_acc"]:
+            best.update(
+                bal_acc=bal_acc,
+                acc=accuracy_score(y_val, preds),
+                f1=f1_score(y_val, preds, average="macro"),
+                epoch=epoch,
+                state={k: v.clone() for k, v in clf.state_dict().items()},
+            )
+            stale = 0
+            with best_shared.get_lock():
+                if bal_acc > best_shared.value:
+                    best_shared.value = bal_acc
+        else:
+            stale += 1
+            if stale >= PATIENCE:
+                status = "early stopping"
+                break
+
+        # élagage : trop loin derrière le meilleur essai connu (tous processus confondus)
+        if epoch >= PRUNE_AFTER and best["bal_acc"] < best_shared.value - PRUNE_MARGIN:
+            status = f"élagué (epoch {epoch})"
+            break
+
+    return {
+        "trial": trial_id,
+        **params,
+        "bal_acc": best["bal_acc"],
+        "acc": best["acc"],
+        "f1": best["f1"],
+        "best_epoch": best["epoch"],
+        "status": status,
+        "seconds": time.perf_counter() - t0,
+        "state": best["state"],
+    }
+
+
+# =========================
+# Orchestration
+# =========================
+def sample_trials(n_trials: int | None, seed: int) -> list[dict]:
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if n_trials and n_trials < len(grid):
+        random.Random(seed).shuffle(grid)
+        grid = grid[:n_trials]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep d'hyperparamètres de la tête du dispatcher")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--trials", type=int, default=None, help="nb d'essais tirés dans la grille (défaut : grille complète)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--results", default="sweep_results.csv")
+    parser.add_argument("--checkpoint", default="../checkpoints/dispatcher_sbert_sweep.pt")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    train_ds = RequestDataset("train.jsonl", label2id)
+    val_ds   = RequestDataset("val.jsonl",   label2id)
+
+    backbone = SentenceTransformer(MODEL_NAME, device="cpu")
+    backbone.eval()
+    train_emb = build_embedding_cache(backbone, train_ds, "train.jsonl")
+    val_emb   = build_embedding_cache(backbone, val_ds,   "val.jsonl")
+
+    trials = sample_trials(args.trials, args.seed)
+    logging.info(f"{len(trials)} essais sur {args.workers} processus")
+
+    best_value = mp.Value("d", 0.0)
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(train_emb, list(train_ds.labels), val_emb, list(val_ds.labels), best_value),
+    ) as pool:
+        futures = {pool.submit(run_trial, i, p): i for i, p in enumerate(trials)}
+        for fut in as_completed(futures):
+            res = fut.result()
+            logging.info(
+                f"Essai {res['trial']}: bal_acc={res['bal_acc']:.3f} f1={res['f1']:.3f} "
+                f"({res['status']}, {res['seconds']:.1f}s)"
+            )
+            results.append(res)
+
+    results.sort(key=lambda r: (r["bal_acc"], r["f1"]), reverse=True)
+    best = results[0]
+
+    # Tableau classé
+    columns = ["rank", "trial", *SEARCH_SPACE, "bal_acc", "acc", "f1", "best_epoch", "status", "seconds"]
+    with open(args.results, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for rank, res in enumerate(results, start=1):
+            writer.writerow({**res, "rank": rank})
+
+    # Meilleur checkpoint, au même format que finetune_dispatcher.py
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+    torch.save({
+        "sbert":    backbone.state_dict(),
+        "clf":      best["state"],
+        "label2id": label2id,
+        "params":   {k: best[k] for k in SEARCH_SPACE},
+    }, args.checkpoint)
+
+    logging.info(
+        f"Sweep terminé en {time.perf_counter() - t0:.1f}s → {args.results}\n"
+        f"Meilleur essai : {json.dumps({k: best[k] for k in SEARCH_SPACE}, ensure_ascii=False)} "
+        f"bal_acc={best['bal_acc']:.3f} → {args.checkpoint}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@ import os
 import json
 import re
 import random
+import hashlib
 import logging
 from collections import Counter
 from dotenv import load_dotenv
-import praw
-import prawcore
-from sklearn.model_selection import train_test_split
+
+# praw / prawcore / sklearn sont importés dans DataFetcher seulement : finetune_dispatcher.py
+# n'a besoin que de RequestDataset et ne doit pas payer (ni exiger) ces dépendances
+from sharded_dataset import ShardedJsonlDataset, ShardWriter, DiskSeenSet
 
 # Pour les logs
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -68,24 +70,11 @@ def get_config(key: str, default: str | None = None) -> str | None:
     return default
 
 
-class RequestDataset:
-    def __init__(self, path, label2id):
-        self.samples = []
-        self.labels = []
-        with open(path, encoding="utf8") as f:
-            for line in f:
-                item = json.loads(line)
-                text = item["text"].strip().replace("\n", " ")
-                label = label2id.get(item["label"])
-                if label is not None:
-                    self.samples.append((text, label))
-                    self.labels.append(label)
-
-    def __len__(self):
-        return len(self.samples)
-
-    def __getitem__(self, idx):
-        return self.samples[idx]
+class RequestDataset(ShardedJsonlDataset):
+    """
+    Dataset JSONL {"text", "label"} : un fichier, un glob de shards ou une liste.
+    Seuls les offsets et les labels restent en mémoire (voir sharded_dataset.py).
+    """
 
 
 class DataFetcher:
@@ -100,7 +89,9 @@ class DataFetcher:
         ),
     }
 
-    def __init__(self, max_per_label=200):
+    def __init__(self, max_per_label=200, seen_path: str | None = None):
+        import praw
+
         # Local: charge .env (Streamlit Cloud: ça ne gêne pas)
         load_dotenv()
 
@@ -146,13 +137,29 @@ class DataFetcher:
         )
 
         self.max_per_label = max_per_label
-        self.seen = set()
+        # seen_path : dédoublonnage sur disque (gros corpus), sinon set() en mémoire
+        self.seen = DiskSeenSet(seen_path) if seen_path else set()
 
     def clean(self, text: str) -> str:
         return re.sub(r"\s+", " ", text).strip()
 
-    def fetch_label(self, subreddits, keywords, label) -> list[dict]:
+    def fetch_label(self, subreddits, keywords, label, sink=None) -> list[dict]:
+        """
+        Si `sink` est fourni, chaque exemple lui est passé au fil de l'eau et
+        rien n'est conservé en mémoire (la liste renvoyée reste vide).
+        """
+        import prawcore
+
         collected = []
+        n = 0
+
+        def emit(item):
+            nonlocal n
+            n += 1
+            if sink is None:
+                collected.append(item)
+            else:
+                sink(item)
         logging.info(f"On récupère données pour '{label}' dans {subreddits} avec mot clef {keywords}")
         query = " OR ".join(keywords)
 
@@ -175,8 +182,8 @@ class DataFetcher:
                     if not self._PATTERNS[label].search(title):
                         continue
                     self.seen.add(title)
-                    collected.append({"text": title, "label": label})
-                    if len(collected) >= self.max_per_label:
+                    emit({"text": title, "label": label})
+                    if n >= self.max_per_label:
                         break
             except prawcore.exceptions.Forbidden:
                 logging.warning(f"→ 403 pendant récup des datas de '{sub}', on zappe.")
@@ -185,11 +192,11 @@ class DataFetcher:
                 logging.warning(f"→ Erreur pendant l'itération des posts de '{sub}': {e}, on zappe.")
                 continue
 
-            if len(collected) >= self.max_per_label:
+            if n >= self.max_per_label:
                 break
 
         # passe 2 pour 'loisirs' si insuffisant
-        if label == "loisirs" and len(collected) < self.max_per_label:
+        if label == "loisirs" and n < self.max_per_label:
             logging.info("Pas assez de data 'loisirs' → on y retourne.")
             for sub in subreddits:
                 try:
@@ -209,8 +216,8 @@ class DataFetcher:
                         if not self._PATTERNS[label].search(title):
                             continue
                         self.seen.add(title)
-                        collected.append({"text": title, "label": label})
-                        if len(collected) >= self.max_per_label:
+                        emit({"text": title, "label": label})
+                        if n >= self.max_per_label:
                             break
                 except prawcore.exceptions.Forbidden:
                     logging.warning(f"→ 403 pendant récup de '{sub}', on zappe.")
@@ -219,13 +226,15 @@ class DataFetcher:
                     logging.warning(f"→ Erreur pendant l'itération des posts de '{sub}': {e}, on zappe.")
                     continue
 
-                if len(collected) >= self.max_per_label:
+                if n >= self.max_per_label:
                     break
 
-        logging.info(f"Recuperation de {len(collected)} exemples pour '{label}'")
+        logging.info(f"Recuperation de {n} exemples pour '{label}'")
         return collected
 
     def run(self, themes: dict, extra_paths: list[str] | None = None) -> tuple[list, list]:
+        from sklearn.model_selection import train_test_split
+
         data = []
         for label, cfg in themes.items():
             data.extend(self.fetch_label(cfg["subreddits"], cfg["keywords"], label))
@@ -268,6 +277,42 @@ class DataFetcher:
         )
         return train, val
 
+    @staticmethod
+    def _is_val(text: str, val_ratio: float) -> bool:
+        # split déterministe par hash : pas besoin d'avoir tout le corpus en mémoire
+        h = int.from_bytes(hashlib.md5(text.encode("utf8")).digest()[:4], "big")
+        return h % 10_000 < val_ratio * 10_000
+
+    def run_streaming(self, themes: dict, out_dir: str, extra_paths: list[str] | None = None,
+                      val_ratio: float = 0.2, shard_size: int = 50_000) -> tuple[Counter, Counter]:
+        """
+        Variante à mémoire constante de run() : chaque exemple est écrit directement dans
+        <out_dir>/train-*.jsonl ou <out_dir>/val-*.jsonl. Renvoie les comptes par label.
+        (Pas de duplication des petites classes ni de stratification exacte ici.)
+        """
+        with ShardWriter(out_dir, "train", shard_size) as train_w, \
+                ShardWriter(out_dir, "val", shard_size) as val_w:
+
+            def sink(item):
+                (val_w if self._is_val(item["text"], val_ratio) else train_w).write(item)
+
+            for label, cfg in themes.items():
+                self.fetch_label(cfg["subreddits"], cfg["keywords"], label, sink=sink)
+
+            for extra in extra_paths or []:
+                if os.path.exists(extra):
+                    logging.info(f"Je récupère les questions supplémentaires {extra}")
+                    with open(extra, encoding="utf-8") as f:
+                        for line in f:
+                            item = json.loads(line)
+                            text = self.clean(item["text"])
+                            if text not in self.seen:
+                                self.seen.add(text)
+                                sink({"text": text, "label": item["label"]})
+
+        logging.info(f"Streaming terminé : train={dict(train_w.counts)} val={dict(val_w.counts)} → {out_dir}")
+        return train_w.counts, val_w.counts
+
     def save(self, data: list[dict], path: str):
         with open(path, "w", encoding="utf-8") as f:
             for item in data:
@@ -0,0 +1,229 @@
+"""
+Réglage des seuils du Dispatcher (threshold / secondary_threshold) selon précision,
+nombre d'appels d'agents et latence attendue.
+
+Chaque label secondaire déclenche un appel d'agent complet (souvent gpt-4o ou Google
+Maps) dans `Dispatcher._route`, exécuté à la suite du principal : des seuils trop lâches
+doublent coût et latence. Les textes sont classifiés UNE fois (matrice de probabilités),
+puis toutes les paires de seuils sont évaluées par opérations numpy sur cette matrice.
+
+Métriques par paire (t, s) :
+    acc_main    : le label principal routé (SBERT ou fallback mots-clés) est le bon
+    recall      : le bon label figure parmi les agents appelés
+    calls       : nombre moyen d'agents appelés par requête
+    latency_s   : latence moyenne attendue (somme des latences des agents appelés)
+
+Usage (depuis le dossier training/) :
+    python tune_thresholds.py --val val.jsonl --logged ../logs/requests.jsonl --max-calls 1.2
+Le point retenu est écrit dans checkpoints/dispatcher_thresholds.json, relu par Dispatcher.
+"""
+import os
+import re
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.dispatcher import Dispatcher  # noqa: E402  (regex du fallback mots-clés)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+# Latence moyenne d'un appel d'agent (s), à ajuster avec --latency ou les journaux
+DEFAULT_LATENCY = {"transport": 2.5, "météo": 0.6, "culture": 3.0, "loisirs": 3.0}
+THRESHOLDS = np.round(np.arange(0.30, 0.951, 0.05), 2)
+SECONDARIES = np.round(np.arange(0.10, 0.751, 0.05), 2)
+
+
+def read_texts(path: str, labelled: bool) -> tuple[list[str], list[str | None]]:
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            text = item.get("text") or item.get("question") or item.get("query")
+            if not text:
+                continue
+            texts.append(text)
+            labels.append(item.get("label") if labelled else None)
+    return texts, labels
+
+
+def score_texts(classifier, texts: list[str], batch_size: int = 64) -> np.ndarray:
+    probs = []
+    for start in range(0, len(texts), batch_size):
+        probs.extend(classifier.predict_proba(texts[start:start + batch_size]))
+    return np.asarray(probs, dtype=np.float32)
+
+
+def keyword_labels(texts: list[str], label2id: dict) -> np.ndarray:
+    """Label du fallback mots-clés de Dispatcher pour chaque texte (-1 si aucun)."""
+    regex = {lbl: re.compile(p, re.IGNORECASE) for lbl, p in Dispatcher._KEYWORDS.items()}
+    out = np.full(len(texts), -1, dtype=np.int64)
+    for i, text in enumerate(texts):
+        for lbl, r in regex.items():
+            if r.search(text) and lbl in label2id:
+                out[i] = label2id[lbl]
+                break
+    return out
+
+
+def sweep(probs: np.ndarray, gold: np.ndarray, kw: np.ndarray, latency: np.ndarray,
+          thresholds=THRESHOLDS, secondaries=SECONDARIES) -> list[dict]:
+    """
+    Évalue toutes les paires (t, s) en une passe vectorielle.
+    gold = -1 pour les requêtes non étiquetées (journaux) : comptées pour calls / latence seulement.
+    """
+    n, c = probs.shape
+    main = probs.argmax(1)
+    score = probs[np.arange(n), main]
+    not_main = np.ones((n, c), dtype=bool)
+    not_main[np.arange(n), main] = False
+
+    # (S, n, C) : labels secondaires retenus pour chaque seuil s
+    sec = (probs[None] >= secondaries[:, None, None]) & not_main[None]
+    sec_calls = sec.sum(2)                                   # (S, n)
+    sec_latency = (sec * latency[None, None]).sum(2)         # (S, n)
+    labelled = gold >= 0
+    gold_in_sec = sec[:, np.arange(n), np.where(labelled, gold, 0)] & labelled[None]   # (S, n)
+
+    # (T, n) : score sous le seuil + mot-clé trouvé → seul l'agent du mot-clé est appelé
+    fallback = (score[None] < thresholds[:, None]) & (kw[None] >= 0)
+    primary = np.where(fallback, kw[None], main[None])       # (T, n)
+
+    # (T, S, n)
+    calls = 1 + np.where(fallback[:, None], 0, sec_calls[None])
+    lat = latency[primary][:, None] + np.where(fallback[:, None], 0.0, sec_latency[None])
+    hit_main = np.broadcast_to(((primary == gold[None]) & labelled[None])[:, None], calls.shape)
+    recall = hit_main | (~fallback[:, None] & gold_in_sec[None])
+
+    n_lab = max(1, int(labelled.sum()))
+    rows = []
+    for i, t in enumerate(thresholds):
+        for j, s in enumerate(secondaries):
+            rows.append({
+                "threshold": float(t),
+                "secondary_threshold": float(s),
+                "acc_main": float(hit_main[i, j, labelled].sum() / n_lab),
+                "recall": float(recall[i, j, labelled].sum() / n_lab),
+                "calls": float(calls[i, j].mean()),
+                "latency_s": float(lat[i, j].mean()),
+            })
+    return rows
+
+
+def pareto_front(rows: list[dict]) -> list[dict]:
+    """Points non dominés : recall et acc_main maximisés, appels et latence minimisés."""
+    def dominates(a, b):
+        better_eq = (a["recall"] >= b["recall"] and a["acc_main"] >= b["acc_main"]
+                     and a["calls"] <= b["calls"] and a["latency_s"] <= b["latency_s"])
+        strictly = (a["recall"] > b["recall"] or a["acc_main"] > b["acc_main"]
+                    or a["calls"] < b["calls"] or a["latency_s"] < b["latency_s"])
+        return better_eq and strictly
+    front = [r for r in rows if not any(dominates(o, r) for o in rows)]
+    # à métriques égales, on garde une seule paire (la première dans l'ordre de la grille)
+    unique = {}
+    for r in front:
+        key = (round(r["recall"], 4), round(r["acc_main"], 4), round(r["calls"], 4), round(r["latency_s"], 3))
+        unique.setdefault(key, r)
+    return sorted(unique.values(), key=lambda r: (r["calls"], -r["recall"]))
+
+
+def choose(front: list[dict], max_calls: float, max_latency: float | None) -> dict:
+    ok = [r for r in front if r["calls"] <= max_calls and (max_latency is None or r["latency_s"] <= max_latency)]
+    if not ok:
+        logging.warning("Aucun point ne respecte les contraintes : on prend le moins coûteux.")
+        ok = [min(front, key=lambda r: (r["calls"], r["latency_s"]))]
+    return max(ok, key=lambda r: (r["recall"], r["acc_main"], -r["latency_s"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réglage des seuils de routage du Dispatcher")
+    parser.add_argument("--val", default="val.jsonl")
+    parser.add_argument("--logged", nargs="*", default=[], help="requêtes réelles (JSONL, sans label)")
+    parser.add_argument("--model-path", default="../checkpoints/dispatcher_sbert.pt")
+    parser.add_argument("--classifier-url", default=None, help="utiliser le serveur de classification")
+    parser.add_argument("--latency", nargs="*", default=[], help="ex : culture=2.1 transport=1.8")
+    parser.add_argument("--max-calls", type=float, default=1.2, help="appels d'agents moyens max")
+    parser.add_argument("--max-latency", type=float, default=None, help="latence moyenne max (s)")
+    parser.add_argument("--results", default="threshold_sweep.csv")
+    parser.add_argument("--output", default="../checkpoints/dispatcher_thresholds.json")
+    parser.add_argument("--dry-run", action="store_true", help="ne pas écrire la configuration")
+    args = parser.parse_args()
+
+    from agents.sbert_classifier import SbertClassifier, ClassifierClient, resolve_checkpoint
+
+    if args.classifier_url:
+        classifier, checkpoint = ClassifierClient(args.classifier_url), args.classifier_url
+    else:
+        checkpoint = resolve_checkpoint(args.model_path)
+        classifier = SbertClassifier(checkpoint)
+    label2id = classifier.label2id
+
+    latency = dict(DEFAULT_LATENCY)
+    for item in args.latency:
+        name, value = item.split("=")
+        latency[name] = float(value)
+    lat_vec = np.array([latency.get(classifier.id2label[i], 1.0) for i in range(len(label2id))], dtype=np.float32)
+
+    texts, labels = read_texts(args.val, labelled=True)
+    for path in args.logged:
+        t, l = read_texts(path, labelled=False)
+        texts += t
+        labels += l
+    gold = np.array([label2id.get(l, -1) if l else -1 for l in labels], dtype=np.int64)
+    logging.info(f"{len(texts)} textes ({int((gold >= 0).sum())} étiquetés)")
+
+    t0 = time.perf_counter()
+    probs = score_texts(classifier, texts)
+    logging.info(f"Classification en {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    rows = sweep(probs, gold, keyword_labels(texts, label2id), lat_vec)
+    logging.info(f"{len(rows)} paires de seuils évaluées en {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    with open(args.results, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    front = pareto_front(rows)
+    current = next(r for r in rows if r["threshold"] == 0.5 and r["secondary_threshold"] == 0.35)
+    print(f"\n{'seuil':>6} {'second.':>7} | {'acc main':>8} {'recall':>7} {'appels':>7} {'latence':>8}")
+    print("-" * 52)
+    for r in front:
+        print(f"{r['threshold']:>6.2f} {r['secondary_threshold']:>7.2f} | {r['acc_main']:>8.3f} "
+              f"{r['recall']:>7.3f} {r['calls']:>7.2f} {r['latency_s']:>7.2f}s")
+    print(f"\nActuel (0.50 / 0.35) : acc {current['acc_main']:.3f}, recall {current['recall']:.3f}, "
+          f"{current['calls']:.2f} appels, {current['latency_s']:.2f}s")
+
+    best = choose(front, args.max_calls, args.max_latency)
+    print(f"Retenu ({best['threshold']:.2f} / {best['secondary_threshold']:.2f}) : acc {best['acc_main']:.3f}, "
+          f"recall {best['recall']:.3f}, {best['calls']:.2f} appels, {best['latency_s']:.2f}s")
+    if args.dry_run:
+        return
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "threshold": best["threshold"],
+            "secondary_threshold": best["secondary_threshold"],
+            "metrics": {k: round(v, 4) for k, v in best.items() if k not in ("threshold", "secondary_threshold")},
+            "checkpoint": os.path.basename(checkpoint),
+            "n_texts": len(texts),
+            "latency_s": latency,
+            "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, ensure_ascii=False, indent=2)
+    logging.info(f"Configuration écrite dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
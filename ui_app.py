@@ -9,14 +9,19 @@ os.environ["SENTENCE_TRANSFORMERS_HOME"] = "/home/appuser/.cache/sentence_transf
 
 import re
 import time
+import uuid
 import types
-import requests
 import streamlit as st
-import googlemaps
 from dotenv import load_dotenv
 
-from streamlit_js_eval import get_geolocation, streamlit_js_eval
+from streamlit_js_eval import streamlit_js_eval
 from agents.dispatcher import Dispatcher
+from services.geocoder import ReverseGeocoder
+from services.resilience import guarded, http_get
+from services.prefetch import RefreshScheduler
+from services.memory import registry as memory_registry, get_monitor, format_report
+from ui_history import render_history
+from config import PROFILE_ALLOW_HEADER
 
 # =========================
 # Page config
@@ -46,7 +51,13 @@ if openai_key:
 if gmaps_key:
     os.environ["GOOGLE_MAPS_API_KEY"] = gmaps_key
 
-gmaps = googlemaps.Client(key=gmaps_key) if gmaps_key else None
+@st.cache_resource
+def get_gmaps():
+    # googlemaps n'est importé qu'au premier géocodage Google (fallback rare)
+    if not gmaps_key:
+        return None
+    import googlemaps
+    return googlemaps.Client(key=gmaps_key)
 
 # =========================
 # Styles (simple + chat clean)
@@ -65,55 +76,61 @@ hr{ margin: .8rem 0; }
 )
 
 # =========================
-# State init
+# Header
 # =========================
-if "history" not in st.session_state:
-    st.session_state.history = []
-if "user_city" not in st.session_state:
-    st.session_state.user_city = None
-
-# --- états pour polling ---
-if "geo_pending" not in st.session_state:
-    st.session_state.geo_pending = False
-if "geo_deadline" not in st.session_state:
-    st.session_state.geo_deadline = 0.0
-if "geo_attempts" not in st.session_state:
-    st.session_state.geo_attempts = 0
-if "geo_data" not in st.session_state:
-    st.session_state.geo_data = None
-
-if "ip_pending" not in st.session_state:
-    st.session_state.ip_pending = False
-if "ip_deadline" not in st.session_state:
-    st.session_state.ip_deadline = 0.0
-if "ip_attempts" not in st.session_state:
-    st.session_state.ip_attempts = 0
-if "ip_data" not in st.session_state:
-    st.session_state.ip_data = None
+st.markdown('<div class="chat-title">🧭 Assistant Mobilité Urbaine</div>', unsafe_allow_html=True)
+st.markdown('<div class="chat-subtitle">Transport • Météo • Culture • Loisirs — routage automatique (SBERT + fallback)</div>', unsafe_allow_html=True)
 
 # =========================
 # Dispatcher + context
 # =========================
-@st.cache_resource
+# Le titre est envoyé au navigateur avant le chargement du modèle (premier run seulement)
+@st.cache_resource(show_spinner="Chargement du modèle de routage…")
 def get_dispatcher():
     disp = Dispatcher()
     disp.context = types.SimpleNamespace(location=None, geo_permission=False, city=None)
+    disp.agents.preload(background=True)  # agents importés en tâche de fond
     return disp
 
 disp = get_dispatcher()
 ctx  = disp.context
 
+# =========================
+# State init
+# =========================
+# Identifiant de session gardé dans l'URL : la conversation survit à un redémarrage
+# du serveur et peut être servie par n'importe quelle réplique
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("sid") or uuid.uuid4().hex
+    st.query_params["sid"] = st.session_state.session_id
+if "history" not in st.session_state:
+    st.session_state.history = disp.sessions.history(st.session_state.session_id, "ui")
+if "user_city" not in st.session_state:
+    st.session_state.user_city = None
+
+# --- états de la détection de position (une sonde navigateur par clic) ---
+if "geo_probe" not in st.session_state:
+    st.session_state.geo_probe = 0          # numéro de la sonde, sert de clé au composant
+if "geo_running" not in st.session_state:
+    st.session_state.geo_running = False
+if "geo_result" not in st.session_state:
+    st.session_state.geo_result = None      # (ville, debug) gardé pour la session
+if "geo_data" not in st.session_state:
+    st.session_state.geo_data = None
+if "ip_data" not in st.session_state:
+    st.session_state.ip_data = None
+
 # =========================
 # Geolocation helpers
 # =========================
 @st.cache_data(ttl=3600)
 def reverse_city_osm(lat: float, lon: float) -> str | None:
     try:
-        r = requests.get(
+        r = http_get(
+            "nominatim",
             "https://nominatim.openstreetmap.org/reverse",
             params={"format": "json", "lat": lat, "lon": lon, "zoom": 10},
             headers={"User-Agent": "mobility-app"},
-            timeout=10,
         )
         addr = r.json().get("address", {})
         return addr.get("city") or addr.get("town") or addr.get("village")
@@ -122,10 +139,11 @@ def reverse_city_osm(lat: float, lon: float) -> str | None:
 
 @st.cache_data(ttl=3600)
 def reverse_city_google(lat: float, lon: float) -> str | None:
+    gmaps = get_gmaps()
     if not gmaps:
         return None
     try:
-        rev = gmaps.reverse_geocode((lat, lon))
+        rev = guarded("google_maps", gmaps.reverse_geocode, (lat, lon))
         if not rev:
             return None
         for comp in rev[0].get("address_components", []):
@@ -135,6 +153,19 @@ def reverse_city_google(lat: float, lon: float) -> str | None:
     except Exception:
         return None
 
+@st.cache_resource
+def get_reverse_geocoder() -> ReverseGeocoder:
+    # k-d tree local + cache geohash partagé par toutes les sessions
+    geocoder = ReverseGeocoder()
+    memory_registry.register("ui.geohash", geocoder.cache._data, geocoder.cache._lock)
+    return geocoder
+
+def _remote_reverse_city(lat: float, lon: float) -> str | None:
+    return reverse_city_google(lat, lon) or reverse_city_osm(lat, lon)
+
+def reverse_city(lat: float, lon: float) -> str | None:
+    return get_reverse_geocoder().reverse(lat, lon, fallback=_remote_reverse_city)
+
 def set_city(city: str | None):
     if city:
         st.session_state.user_city = city
@@ -142,28 +173,44 @@ def set_city(city: str | None):
         ctx.city = city
 
 # =========================
-# ✅ Ville via IP côté navigateur (quasi certain)
+# ✅ Sondes GPS + IP côté navigateur, en parallèle
 # =========================
-def get_city_from_ip_browser():
+# Les deux sondes partent ensemble (Promise.allSettled) et le résultat revient en un seul
+# message : le composant déclenche alors UN rerun, au lieu d'un rerun par tentative.
+_BROWSER_LOCATION_JS = """
+(async () => {
+  const withTimeout = (p, ms) => Promise.race([
+    p, new Promise((_, reject) => setTimeout(() => reject(new Error("timeout")), ms)),
+  ]);
+  const gps = new Promise((resolve, reject) => {
+    if (!navigator.geolocation) return reject(new Error("géolocalisation indisponible"));
+    navigator.geolocation.getCurrentPosition(
+      p => resolve({ coords: { latitude: p.coords.latitude, longitude: p.coords.longitude,
+                               accuracy: p.coords.accuracy }, timestamp: p.timestamp }),
+      e => reject(new Error(e.message)),
+      { enableHighAccuracy: false, timeout: 12000, maximumAge: 600000 },
+    );
+  });
+  const ip = fetch("https://ipapi.co/json/").then(r => r.json())
+    .then(d => ({ ok: true, city: d.city, region: d.region, country: d.country_name }));
+  const [g, i] = await Promise.allSettled([withTimeout(gps, 20000), withTimeout(ip, 8000)]);
+  return {
+    geo: g.status === "fulfilled" ? g.value : { error: String(g.reason) },
+    ip: i.status === "fulfilled" ? i.value : { ok: false, error: String(i.reason) },
+  };
+})()
+"""
+
+def probe_browser_location() -> dict | None:
     """
-    Exécute un fetch côté navigateur via streamlit_js_eval.
-    Retour attendu: dict {ok, city, region, country} ou None (si pas encore dispo).
-    """
-    js = """
-    (async () => {
-      try {
-        const r = await fetch("https://ipapi.co/json/");
-        const d = await r.json();
-        return { ok: true, city: d.city, region: d.region, country: d.country_name };
-      } catch(e) {
-        return { ok: false, error: String(e) };
-      }
-    })()
+    Retour : {geo, ip} une fois les deux sondes terminées, None tant que le navigateur
+    n'a pas répondu (le composant relance alors le script de lui-même).
     """
     try:
-        return streamlit_js_eval(js_expressions=js, key=f"ip_eval_{st.session_state.ip_attempts}", want_output=True)
+        return streamlit_js_eval(js_expressions=_BROWSER_LOCATION_JS,
+                                 key=f"geo_probe_{st.session_state.geo_probe}", want_output=True)
     except Exception:
-        return None
+        return {"geo": None, "ip": None}
 
 # =========================
 # Détection ville "best effort" (GPS -> IP browser -> None)
@@ -182,7 +229,7 @@ def detect_city_best_effort() -> tuple[str | None, dict]:
 
         # Pour juste la ville, on accepte large
         if acc <= 100000:
-            city = reverse_city_google(lat, lon) or reverse_city_osm(lat, lon)
+            city = reverse_city(lat, lon)
             if city:
                 dbg["chosen"] = "browser_gps"
                 return city, dbg
@@ -203,18 +250,25 @@ def detect_city_best_effort() -> tuple[str | None, dict]:
 # =========================
 # Business helpers
 # =========================
-@st.cache_data(ttl=600)
 def get_local_weather(city: str) -> str:
     wa = disp.agents["météo"]
     return wa.handle_request(f"météo à {city}")
 
-@st.cache_data(ttl=600)
 def get_local_loisirs(city: str) -> str:
     la = disp.agents["loisirs"]
     return la.handle_request(
         f"activités à proximité de {city}, uniquement les titres avec des émojis en lien avec l'activité, ne fais pas de phrases s'il te plaît"
     )
 
+@st.cache_resource
+def get_refresher() -> RefreshScheduler:
+    # calcul hors du chemin de rendu + rafraîchissement des villes populaires avant expiration
+    refresher = RefreshScheduler(ttl=600, refresh_ahead=60)
+    refresher.register("météo", get_local_weather)
+    refresher.register("loisirs", get_local_loisirs)
+    memory_registry.register("ui.prefetch", refresher._entries, refresher._lock)
+    return refresher
+
 def preprocess_input(prompt: str, cats: list[str], user_city: str | None, geo_allowed: bool) -> str:
     inp = prompt
     if geo_allowed and user_city:
@@ -253,56 +307,32 @@ with st.sidebar:
 
     if ctx.geo_permission:
         if st.button("📍 Détecter ma position", use_container_width=True):
-            # reset + lance polling GPS + polling IP
-            st.session_state.geo_pending = True
-            st.session_state.geo_deadline = time.time() + 12
-            st.session_state.geo_attempts = 0
+            # nouvelle sonde (nouvelle clé de composant) ; le résultat précédent est oublié
+            st.session_state.geo_probe += 1
+            st.session_state.geo_running = True
+            st.session_state.geo_result = None
             st.session_state.geo_data = None
-
-            st.session_state.ip_pending = True
-            st.session_state.ip_deadline = time.time() + 8
-            st.session_state.ip_attempts = 0
             st.session_state.ip_data = None
 
-            st.rerun()
-
-        # ---- Poll GPS ----
-        if st.session_state.geo_pending:
-            st.info("Détection GPS en cours… accepte la demande de localisation si elle apparaît.")
-            if time.time() > st.session_state.geo_deadline or st.session_state.geo_attempts > 25:
-                st.session_state.geo_pending = False
-            else:
-                st.session_state.geo_attempts += 1
-                geo = get_geolocation()
-                if geo and "coords" in geo:
-                    st.session_state.geo_data = geo
-                    st.session_state.geo_pending = False
-                else:
-                    time.sleep(0.25)
-                    st.rerun()
-
-        # ---- Poll IP (browser) ----
-        if st.session_state.ip_pending:
-            st.info("Fallback ville via IP en cours…")
-            if time.time() > st.session_state.ip_deadline or st.session_state.ip_attempts > 20:
-                st.session_state.ip_pending = False
+        # ---- Sonde navigateur : pas de sleep ni de st.rerun, le composant rappelle quand il a fini ----
+        if st.session_state.geo_running:
+            probe = probe_browser_location()
+            if probe is None:
+                st.info("Détection en cours (GPS + IP)… accepte la demande de localisation si elle apparaît.")
             else:
-                st.session_state.ip_attempts += 1
-                ipd = get_city_from_ip_browser()
-                if ipd and isinstance(ipd, dict):
-                    st.session_state.ip_data = ipd
-                    st.session_state.ip_pending = False
-                else:
-                    time.sleep(0.25)
-                    st.rerun()
-
-        # ---- Résultat ----
-        if (not st.session_state.geo_pending) and (not st.session_state.ip_pending) and (st.session_state.geo_data or st.session_state.ip_data):
-            city, dbg = detect_city_best_effort()
+                st.session_state.geo_data = probe.get("geo")
+                st.session_state.ip_data = probe.get("ip")
+                st.session_state.geo_result = detect_city_best_effort()
+                st.session_state.geo_running = False
+                if st.session_state.geo_result[0]:
+                    set_city(st.session_state.geo_result[0])
+
+        # ---- Résultat (calculé une fois, gardé pour la session) ----
+        if st.session_state.geo_result is not None:
+            city, dbg = st.session_state.geo_result
             # st.write(dbg)
 
             if city:
-                set_city(city)
                 st.success(f"Ville détectée : {city}")
             else:
                 st.error("Impossible de détecter la ville. Utilise la saisie manuelle.")
@@ -310,23 +340,36 @@ with st.sidebar:
     else:
         st.caption("Autorise la position pour tenter une géoloc précise. Sinon, utilise la ville manuelle.")
 
+    monitor = get_monitor()
+    if monitor is not None:
+        with st.expander("🧠 Mémoire", expanded=False):
+            if st.button("Nouveau relevé", use_container_width=True) or monitor.last_report is None:
+                monitor.snapshot()
+            report = monitor.last_report
+            st.caption(f"RSS {report['rss'] / 1e6:.0f} Mo — relevé {report['time']}" if report["rss"] else report["time"])
+            st.dataframe(
+                [{"cache": c["name"], "entrées": c["entries"], "Mo": round(c["bytes"] / 1e6, 2),
+                  "Δ entrées": c["delta_entries"], "plafond": c["cap"]} for c in report["caches"]],
+                hide_index=True, use_container_width=True,
+            )
+            if report["growth"]:
+                st.code(format_report({**report, "caches": [], "top_allocators": []}))
+
     if st.button("🧹 Réinitialiser", use_container_width=True):
+        disp.reset_session(st.session_state.session_id)
         st.session_state.history = []
+        st.session_state.history_pages_shown = 0
+        st.session_state.history_page_cache = {}
         st.session_state.user_city = None
         ctx.location = None
         ctx.city = None
 
-        st.session_state.geo_pending = False
+        st.session_state.geo_running = False
+        st.session_state.geo_result = None
         st.session_state.geo_data = None
-        st.session_state.ip_pending = False
         st.session_state.ip_data = None
         st.rerun()
 
-# =========================
-# Header
-# =========================
-st.markdown('<div class="chat-title">🧭 Assistant Mobilité Urbaine</div>', unsafe_allow_html=True)
-st.markdown('<div class="chat-subtitle">Transport • Météo • Culture • Loisirs — routage automatique (SBERT + fallback)</div>', unsafe_allow_html=True)
 
 user_city = st.session_state.user_city
 if user_city:
@@ -339,32 +382,81 @@ st.markdown("<hr>", unsafe_allow_html=True)
 # =========================
 # Optional local info
 # =========================
-if show_local and user_city:
+LOCAL_PANELS_TIMEOUT = 30  # s d'attente max avant d'arrêter de sonder les panneaux
+
+def _render_panel(refresher, kind: str, city: str, value, loading: str):
+    if value is not None:
+        st.write(value)
+    elif refresher.failed(kind, city):
+        st.caption("⚠️ Indisponible pour le moment.")
+    else:
+        st.caption(loading)
+
+def render_local_panels(city: str):
+    """Affiche les panneaux, ou un placeholder tant que les données ne sont pas prêtes."""
+    refresher = get_refresher()
+    weather = refresher.get("météo", city)
+    loisirs = refresher.get("loisirs", city)
     c1, c2 = st.columns(2)
     with c1:
         with st.expander("🌦️ Météo", expanded=False):
-            st.write(get_local_weather(user_city))
+            _render_panel(refresher, "météo", city, weather, "⏳ Chargement de la météo…")
     with c2:
         with st.expander("🎉 Loisirs", expanded=False):
-            st.write(get_local_loisirs(user_city))
+            _render_panel(refresher, "loisirs", city, loisirs, "⏳ Chargement des idées de sorties…")
+
+def local_panels_waiting(city: str) -> bool:
+    """True tant qu'un panneau manque encore, sans échec de son calcul ni délai dépassé."""
+    refresher = get_refresher()
+    missing = [kind for kind in ("météo", "loisirs") if refresher.peek(kind, city) is None]
+    if not missing or any(refresher.failed(kind, city) for kind in missing):
+        return False
+    since = st.session_state.setdefault("local_panels_since", {}).setdefault(city, time.time())
+    return time.time() - since < LOCAL_PANELS_TIMEOUT
+
+if show_local and user_city:
+    render_local_panels(user_city)
+
+if show_local and user_city and local_panels_waiting(user_city) and hasattr(st, "fragment"):
+    # données pas encore prêtes : seul ce petit fragment est ré-exécuté, puis un rerun
+    # complet unique quand elles arrivent, qu'un calcul échoue ou que le délai est dépassé
+    # (le fragment n'est alors plus rendu, donc plus planifié)
+    @st.fragment(run_every=1.5)
+    def _wait_local_panels():
+        if not local_panels_waiting(user_city):
+            st.rerun()
+
+    _wait_local_panels()
 
 # =========================
 # Chat (ChatGPT-like)
 # =========================
-for msg in st.session_state.history:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+# seuls les derniers messages sont rendus en bulles, les anciens par pages à la demande
+render_history(st, st.session_state.history, recent_n=10, page_size=20)
+
+def profile_requested() -> bool | None:
+    """En-tête « X-Profile: 1 » (proxy, curl, extension), honoré seulement si PROFILE_ALLOW_HEADER=1."""
+    if not PROFILE_ALLOW_HEADER:
+        return None
+    try:
+        headers = st.context.headers  # Streamlit ≥ 1.37
+    except Exception:
+        return None
+    return True if headers.get("X-Profile") == "1" else None
 
 prompt = st.chat_input("Écris ta question…")
 
 if prompt:
+    sid = st.session_state.session_id
     st.session_state.history.append({"role": "user", "content": prompt})
+    disp.sessions.append(sid, "ui", "user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
     cats = disp.classify_request(prompt)
     inp = preprocess_input(prompt, cats, user_city, ctx.geo_permission)
-    answer = disp.route_request(inp)
+    answer = disp.route_request(inp, session_id=sid, profile=profile_requested())
+    disp.sessions.append(sid, "ui", "assistant", answer)
 
     if typing:
         with st.chat_message("assistant"):
@@ -0,0 +1,63 @@
+"""
+Rendu paginé de l'historique du chat pour ui_app.py.
+
+Seuls les `recent_n` derniers messages (au moins) sont rendus en bulles `st.chat_message`.
+Les plus anciens sont découpés en pages fixes de `page_size` messages, alignées sur le début
+de l'historique : une page pleine ne change plus jamais, son markdown est donc pré-calculé
+une seule fois. Les pages ne sont rendues que si l'utilisateur les demande
+(« Charger des messages plus anciens »), chacune en un seul bloc replié.
+"""
+import hashlib
+
+ROLE_LABELS = {"user": "🧑 **Vous**", "assistant": "🤖 **Assistant**"}
+
+
+def page_bounds(n_messages: int, recent_n: int = 10, page_size: int = 20) -> tuple[int, int]:
+    """Renvoie (nb de pages anciennes, index du premier message « récent »)."""
+    n_pages = max(0, (n_messages - recent_n) // page_size)
+    return n_pages, n_pages * page_size
+
+
+def prerender_page(messages: list[dict]) -> str:
+    """Markdown d'une page de messages, rendu en un seul appel st.markdown."""
+    parts = []
+    for msg in messages:
+        label = ROLE_LABELS.get(msg["role"], msg["role"])
+        parts.append(f"{label}\n\n{msg['content']}")
+    return "\n\n---\n\n".join(parts)
+
+
+def _page_key(messages: list[dict]) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for msg in messages:
+        h.update(msg["role"].encode())
+        h.update(msg["content"].encode("utf8"))
+    return h.hexdigest()
+
+
+def render_history(st, history: list[dict], recent_n: int = 10, page_size: int = 20):
+    """Affiche l'historique : pages anciennes à la demande + derniers messages complets."""
+    state = st.session_state
+    cache = state.setdefault("history_page_cache", {})
+    n_pages, first_recent = page_bounds(len(history), recent_n, page_size)
+    shown = min(state.get("history_pages_shown", 0), n_pages)
+
+    if shown < n_pages:
+        hidden = first_recent - shown * page_size
+        if st.button(f"⬆️ Charger des messages plus anciens ({hidden} masqués)", key="history_more"):
+            state["history_pages_shown"] = shown + 1
+            shown += 1
+
+    # pages anciennes demandées, de la plus ancienne à la plus récente
+    for page in range(n_pages - shown, n_pages):
+        start = page * page_size
+        messages = history[start:start + page_size]
+        key = (start, _page_key(messages))
+        if key not in cache:
+            cache[key] = prerender_page(messages)
+        with st.expander(f"Messages {start + 1}–{start + len(messages)}", expanded=False):
+            st.markdown(cache[key])
+
+    for msg in history[first_recent:]:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])